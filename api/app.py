@@ -1,8 +1,17 @@
-from flask import Flask, send_from_directory
+from flask import Flask, Response
 from routes import register_routes
 import os
 import secrets
 from utils.init_db import init_db
+from db import init_app
+from db.database import get_engine_settings
+from utils.password_helper import PasswordHasherBusy
+from middleware.image import UploadRequest
+from services.username_index import username_index
+from services.image_sweeper import start_image_sweeper
+from services.account_purger import start_account_purger
+from services.static_index import static_index
+from services import image_service
 
 # Set the working directory to the api folder
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -10,6 +19,7 @@ os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+app.request_class = UploadRequest
 
 # This is a secret key that is used to encrypt the JWT token.
 # Users will need to log in again if this is changed.
@@ -19,22 +29,90 @@ app.config["JWT_SECRET"] = secrets.token_urlsafe(32)
 app.config["JWT_TOKEN_EXPIRES"] = os.environ.get(
     "JWT_TOKEN_EXPIRES", 7200)
 
+# Cache of user ids known to exist, saves a query per authorized request.
+# A deleted user is removed from the cache, but only in this process.
+app.config["AUTH_CACHE_ENABLED"] = os.environ.get(
+    "AUTH_CACHE_ENABLED", "True") == "True"
+app.config["AUTH_CACHE_SIZE"] = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+app.config["AUTH_CACHE_TTL"] = float(os.environ.get("AUTH_CACHE_TTL", 60))
+
+# Cache of the get_user and get_post responses, emptied by the write routes.
+# Other processes are not told of writes, the TTL bounds how stale it gets.
+app.config["RESPONSE_CACHE_ENABLED"] = os.environ.get(
+    "RESPONSE_CACHE_ENABLED", "True") == "True"
+app.config["RESPONSE_CACHE_SIZE"] = int(
+    os.environ.get("RESPONSE_CACHE_SIZE", 1000))
+app.config["RESPONSE_CACHE_TTL"] = float(
+    os.environ.get("RESPONSE_CACHE_TTL", 30))
+
+# Statistics of the caches and the connection pool at /api/metrics, for
+# logged in users. Off by default, as they tell how the server is used.
+app.config["METRICS_ENABLED"] = os.environ.get(
+    "METRICS_ENABLED", "False") == "True"
+
+# Number of statements and database time of each request, sent in the
+# Server-Timing header. Statements slower than SLOW_QUERY_MS are logged.
+app.config["SERVER_TIMING_ENABLED"] = os.environ.get(
+    "SERVER_TIMING_ENABLED", "True") == "True"
+
+# Upload limits, checked while the request body is parsed.
+# Images are at most 5 MiB, the rest is room for the other form fields.
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get(
+    "MAX_CONTENT_LENGTH", 6 * 1024 * 1024))
+# Form fields that are not files are kept in memory. The parser buffers
+# 64 KiB at a time against this limit as well, so it must be above that.
+app.config["MAX_FORM_MEMORY_SIZE"] = int(os.environ.get(
+    "MAX_FORM_MEMORY_SIZE", 256 * 1024))
+app.config["MAX_FORM_PARTS"] = int(os.environ.get("MAX_FORM_PARTS", 20))
+# Uploaded files larger than this are spooled to a temporary file
+app.config["UPLOAD_SPOOL_SIZE"] = int(os.environ.get(
+    "UPLOAD_SPOOL_SIZE", 512 * 1024))
+
+init_app(app)
 register_routes(app)
 
 
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    # Too many logins at once, the client should try again shortly
+    return Response("Server busy, try again", 503,
+                    headers={"Retry-After": "1"})
+
+
+# The frontend build is indexed once, and served without filesystem probes
+static_index.build()
+
+
 @app.route('/')
 def index():
-    return send_from_directory('static', 'index.html')
+    return static_index.serve_index()
 
 
 @app.route('/<path:path>')
 def static_proxy(path):
-    print("Using static proxy")
-    if not os.path.exists(os.path.join('static', path)):
-        return send_from_directory('static', 'index.html')
-    return send_from_directory('static', path)
+    # Uploaded images are not part of the build, so they are not indexed
+    if static_index.is_excluded(path):
+        return image_service.send_image(path)
+    return static_index.serve(path)
 
 
 if __name__ == '__main__':
     init_db()
+    username_index.rebuild()
+
+    print("Database settings:")
+    for setting, value in get_engine_settings().items():
+        print(f"  {setting}: {value}")
+
+    # Seconds between sweeps of orphaned images, 0 turns the sweeper off.
+    # It can also be run by hand with `python -m utils.sweep_images`.
+    # Images whose last reference is released are only removed by it.
+    sweep_interval = float(os.environ.get("IMAGE_SWEEP_INTERVAL", 3600))
+    if sweep_interval > 0:
+        start_image_sweeper(sweep_interval)
+
+    # Large accounts are deleted in the background, the route wakes the
+    # purger up. It can also be run by hand with `python -m utils.purge_users`
+    start_account_purger(float(os.environ.get("USER_PURGE_INTERVAL", 3600)))
+
     app.run(port=5000)
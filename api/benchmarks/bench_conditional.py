@@ -0,0 +1,81 @@
+import os
+
+"""
+Measures the bytes sent for repeated fetches of a profile, a post and an
+image, by a client that ignores validators against a client that sends
+If-None-Match and gets 304 responses.
+Run with `python -m benchmarks.bench_conditional` from the api folder.
+"""
+
+FETCHES = 1000
+
+
+def fetch(test_client, url: str, headers: dict, revalidate: bool):
+    """Fetches a url repeatedly. Returns the body bytes received."""
+    received = 0
+    etag = None
+
+    for _ in range(FETCHES):
+        request_headers = dict(headers)
+        if revalidate and etag is not None:
+            request_headers["If-None-Match"] = etag
+
+        response = test_client.get(url, headers=request_headers)
+        assert response.status_code in (200, 304), url
+        received += len(response.data)
+        etag = response.headers.get("ETag", etag)
+
+    return received
+
+
+def main():
+    os.environ["TESTING"] = "True"
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+    from app import app
+    from utils.init_db import init_db
+
+    init_db()
+    test_client = app.test_client()
+
+    response = test_client.post("/api/auth/register", json={
+        "username": "benchmark", "password": "password",
+        "email": "benchmark@example.com"})
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    with open("tests/test_data/small.jpg", "rb") as f:
+        response = test_client.post(
+            "/api/users/1/posts", headers=headers,
+            data={"title": "Benchmark", "content": "Benchmark post",
+                  "image": (f, "small.jpg")})
+    post_id = response.json["id"]
+    image = test_client.get(f"/api/posts/{post_id}",
+                            headers=headers).json["image"]
+
+    urls = [
+        ("profile", "/api/users/1", {}),
+        ("post", f"/api/posts/{post_id}", headers),
+        ("image", f"/images/posts/{image}", {}),
+    ]
+
+    try:
+        total_full = total_conditional = 0
+        for name, url, url_headers in urls:
+            full = fetch(test_client, url, url_headers, revalidate=False)
+            conditional = fetch(test_client, url, url_headers,
+                                revalidate=True)
+            total_full += full
+            total_conditional += conditional
+            print(f"{name:>8}: {full:>12,} bytes -> {conditional:>10,} bytes "
+                  f"({1 - conditional / full:.1%} saved)")
+
+        print(f"{'total':>8}: {total_full:>12,} bytes -> "
+              f"{total_conditional:>10,} bytes "
+              f"({1 - total_conditional / total_full:.1%} saved "
+              f"over {FETCHES} fetches each)")
+    finally:
+        test_client.delete(f"/api/users/1/posts/{post_id}", headers=headers)
+
+
+if __name__ == "__main__":
+    main()
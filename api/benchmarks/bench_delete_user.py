@@ -0,0 +1,138 @@
+import os
+import tempfile
+import time
+
+"""
+Measures deleting a user as its account grows, with its rows loaded and
+deleted one at a time as before, against the set-based statements of
+db.purge. For the background purge, it measures how long the route holds
+the write lock and how long the longest purge transaction takes.
+Run with `python -m benchmarks.bench_delete_user` from the api folder.
+"""
+
+SIZES = [100, 1000, 10000]
+
+
+def seed(engine, size: int) -> int:
+    """Adds a user with size rows, split evenly between posts, likes,
+    comments and follows. Returns the id of the user."""
+    from sqlalchemy import insert, select
+    from db import User, Post, Like, Comment, Follow
+
+    quarter = size // 4
+    with engine.begin() as connection:
+        uid, other = (
+            connection.execute(insert(User).values(
+                username=f"bench{time.perf_counter_ns()}{i}",
+                email="bench@example.com", hashed_password="password")
+            ).inserted_primary_key[0]
+            for i in range(2)
+        )
+        connection.execute(insert(Post), [
+            {"uid": uid, "title": "Post", "content": "Post"}
+            for _ in range(quarter)])
+
+        # Each post of the other user is liked and commented once
+        connection.execute(insert(Post), [
+            {"uid": other, "title": "Post", "content": "Post",
+             "like_count": 1, "comment_count": 1} for _ in range(quarter)])
+        pids = connection.execute(
+            select(Post.id).where(Post.uid == other)).scalars().all()
+        connection.execute(insert(Like),
+                           [{"uid": uid, "pid": pid} for pid in pids])
+        connection.execute(insert(Comment), [
+            {"uid": uid, "pid": pid, "content": "Comment"} for pid in pids])
+
+        connection.execute(insert(User), [
+            {"username": f"followed{uid}-{i}", "email": "bench@example.com",
+             "hashed_password": "password"} for i in range(quarter)])
+        followed = connection.execute(
+            select(User.id).where(User.username.like(f"followed{uid}-%"))
+        ).scalars().all()
+        connection.execute(insert(Follow), [
+            {"follower_id": uid, "followed_id": followed_id}
+            for followed_id in followed])
+    return uid
+
+
+def delete_per_row(session, user):
+    # What the ORM did before the relationships were passive_deletes
+    for collection in (user.posts, user.likes, user.comments, user.follows):
+        for row in list(collection):
+            session.delete(row)
+    session.flush()
+    session.expire(user)
+    session.delete(user)
+    session.commit()
+
+
+def delete_set_based(session, user):
+    session.delete(user)
+    session.commit()
+
+
+def main():
+    directory = tempfile.TemporaryDirectory()
+    os.environ.pop("TESTING", None)
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory.name}/bench.db"
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+    from sqlalchemy import event
+    from db import get_engine, get_session, User
+    from services import account_purger
+    from utils.init_db import init_db
+
+    init_db()
+    engine = get_engine()
+    Session = get_session()
+
+    statements = 0
+    transactions = []
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    def begin(connection):
+        connection.info["began"] = time.perf_counter()
+
+    def commit(connection):
+        began = connection.info.pop("began", None)
+        if began is not None:
+            transactions.append(time.perf_counter() - began)
+
+    event.listen(engine, "before_cursor_execute", count)
+    event.listen(engine, "begin", begin)
+    event.listen(engine, "commit", commit)
+
+    for size in SIZES:
+        for name, delete in (("per row", delete_per_row),
+                             ("set based", delete_set_based)):
+            uid = seed(engine, size)
+            statements = 0
+            start = time.perf_counter()
+            with Session() as session:
+                delete(session, session.get(User, uid))
+            elapsed = time.perf_counter() - start
+            print(f"{size:>6} rows {name:>10}: {elapsed * 1000:>9.1f} ms "
+                  f"{statements:>7} statements")
+
+        uid = seed(engine, size)
+        start = time.perf_counter()
+        with Session() as session:
+            account_purger.mark_deleted(session, session.get(User, uid))
+        marked = time.perf_counter() - start
+
+        transactions.clear()
+        statements = 0
+        report = account_purger.purge_user(uid)
+        print(f"{size:>6} rows {'background':>10}: {marked * 1000:>9.1f} ms "
+              f"{statements:>7} statements, {report['batches']} batches, "
+              f"longest {max(transactions) * 1000:.1f} ms")
+
+    engine.dispose()
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from utils.jwt_helper import create_jwt, decode_jwt, token_cache
+import secrets
+import time
+
+"""
+Compares the throughput of decode_jwt for tokens that have to be verified
+(cold) against tokens that have been verified before (warm).
+Run with `python -m benchmarks.bench_jwt` from the api folder.
+"""
+
+ITERATIONS = 100_000
+
+
+def bench(name: str, jwt: str, secret: str, clear_cache: bool):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        if clear_cache:
+            token_cache.clear()
+        decode_jwt(jwt, secret)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:>5}: {ITERATIONS / elapsed:>12,.0f} decodes/s "
+          f"({elapsed / ITERATIONS * 1e6:.2f} us per decode)")
+    return elapsed
+
+
+def main():
+    secret = secrets.token_urlsafe(32)
+    jwt = create_jwt(time.time() + 3600, 1, secret)
+
+    cold = bench("cold", jwt, secret, clear_cache=True)
+    warm = bench("warm", jwt, secret, clear_cache=False)
+
+    print(f"Speedup: {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+"""
+Measures login throughput while other clients read users at the same time,
+with password hashing in the calling thread against hashing in the pool.
+Each mode runs in a fresh process, since the hashing settings are read
+when the app is imported.
+Run with `python -m benchmarks.bench_login` from the api folder.
+"""
+
+DURATION = 5
+LOGIN_THREADS = 8
+READ_THREADS = 4
+
+
+def run():
+    # Imported here so the database and hashing settings come from the
+    # environment set up by main
+    from app import app
+    from utils.init_db import init_db
+
+    init_db()
+    client = app.test_client()
+    response = client.post("/api/auth/register", json={
+        "username": "benchmark", "password": "password",
+        "email": "benchmark@example.com"})
+    token = response.json["access_token"]
+
+    counts = {"logins": 0, "busy": 0, "reads": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + DURATION
+
+    def login():
+        client = app.test_client()
+        while time.perf_counter() < stop:
+            response = client.post("/api/auth/login", json={
+                "username": "benchmark", "password": "password"})
+            key = "logins" if response.status_code == 200 else "busy"
+            with lock:
+                counts[key] += 1
+
+    def read():
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        while time.perf_counter() < stop:
+            client.get("/api/users/1", headers=headers)
+            with lock:
+                counts["reads"] += 1
+
+    threads = ([threading.Thread(target=login) for _ in range(LOGIN_THREADS)]
+               + [threading.Thread(target=read) for _ in range(READ_THREADS)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{counts['logins'] / DURATION:>8,.1f} logins/s "
+          f"{counts['busy'] / DURATION:>8,.1f} busy/s "
+          f"{counts['reads'] / DURATION:>10,.1f} reads/s")
+
+
+def main():
+    modes = [
+        ("inline", {"PASSWORD_HASH_WORKERS": "0"}),
+        ("pool", {"PASSWORD_HASH_WORKERS": os.environ.get(
+            "PASSWORD_HASH_WORKERS", "2")}),
+    ]
+
+    for name, variables in modes:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, **variables)
+            env["DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+            env.pop("TESTING", None)
+
+            print(f"{name:>6}: ", end="", flush=True)
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_login",
+                            "--run"], env=env, check=True)
+
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        run()
+    else:
+        main()
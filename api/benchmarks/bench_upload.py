@@ -0,0 +1,114 @@
+import http.client
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+
+"""
+Measures the peak memory (RSS) of a server receiving parallel 5 MB image
+uploads. Uploads are validated by image_validated, then either saved
+("seek", the current validation) or read into memory first ("read", how
+the size used to be measured). Each mode runs in a fresh process, since
+the peak RSS of a process never goes down.
+Run with `python -m benchmarks.bench_upload [parallel uploads]` from the
+api folder.
+"""
+
+UPLOADS = 16
+IMAGE_SIZE = 5 * 1024 * 1024 - 1024
+BOUNDARY = "benchmark-boundary"
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_body(path: str):
+    """Writes a multipart body with a fake 5 MB png,
+    so the clients can stream it from disk."""
+    with open(path, "wb") as f:
+        f.write((f"--{BOUNDARY}\r\n"
+                 'Content-Disposition: form-data; name="image"; '
+                 'filename="image.png"\r\n'
+                 "Content-Type: image/png\r\n\r\n").encode())
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(os.urandom(IMAGE_SIZE - 8))
+        f.write(f"\r\n--{BOUNDARY}--\r\n".encode())
+
+
+def run(mode: str, uploads: int):
+    from flask import Flask, request
+    from werkzeug.serving import make_server
+    from middleware.image import image_validated, UploadRequest
+
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config["MAX_CONTENT_LENGTH"] = 6 * 1024 * 1024
+    app.config["UPLOAD_SPOOL_SIZE"] = 512 * 1024
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    @app.route("/upload", methods=["POST"])
+    @image_validated()
+    def upload():
+        file = request.files["image"]
+        if mode == "read":
+            len(file.stream.read())
+            file.stream.seek(0)
+        file.save(os.devnull)
+        return "OK"
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    directory = tempfile.TemporaryDirectory()
+    body = os.path.join(directory.name, "body")
+    write_body(body)
+    size = os.path.getsize(body)
+
+    barrier = threading.Barrier(uploads)
+    statuses = []
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1",
+                                                server.server_port)
+        barrier.wait()
+        with open(body, "rb") as f:
+            connection.request("POST", "/upload", body=f, headers={
+                "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+                "Content-Length": str(size)})
+        statuses.append(connection.getresponse().status)
+        connection.close()
+
+    before = peak_rss_mb()
+    threads = [threading.Thread(target=client) for _ in range(uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    directory.cleanup()
+
+    assert statuses == [200] * uploads, statuses
+    print(f"peak RSS {peak_rss_mb():7.1f} MB "
+          f"(+{peak_rss_mb() - before:6.1f} MB for {uploads} uploads)")
+
+
+def main():
+    uploads = int(sys.argv[1]) if len(sys.argv) > 1 else UPLOADS
+
+    for mode in ("read", "seek"):
+        print(f"{mode:>4}: ", end="", flush=True)
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_upload",
+                        "--run", mode, str(uploads)], check=True)
+
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        run(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
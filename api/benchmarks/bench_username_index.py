@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+
+"""
+Measures a prefix search of the username index against the same search
+in the database, as the number of users grows.
+Run with `python -m benchmarks.bench_username_index` from the api folder.
+"""
+
+SIZES = [1000, 10000, 100000]
+SEARCHES = 1000
+
+
+def bench(search) -> float:
+    """Average seconds per search, for SEARCHES different prefixes."""
+    start = time.perf_counter()
+    for i in range(SEARCHES):
+        search(f"user{i:03d}")
+    return (time.perf_counter() - start) / SEARCHES
+
+
+def main():
+    directory = tempfile.TemporaryDirectory()
+    os.environ.pop("TESTING", None)
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory.name}/bench.db"
+    # The bulk inserts would be reported as slow queries
+    os.environ.setdefault("SLOW_QUERY_MS", "0")
+
+    from sqlalchemy import insert, select
+    from db import get_engine, get_session, User
+    from services.username_index import UsernameIndex
+    from utils.init_db import init_db
+
+    init_db()
+    engine = get_engine()
+    Session = get_session()
+    added = 0
+
+    for size in SIZES:
+        with engine.begin() as connection:
+            connection.execute(insert(User), [
+                {"username": f"user{i:06d}", "email": "bench@example.com",
+                 "hashed_password": "password"}
+                for i in range(added, size)])
+        added = size
+
+        index = UsernameIndex()
+        index.rebuild()
+
+        with Session() as session:
+            def search_database(prefix: str):
+                return session.execute(
+                    select(User.id, User.username)
+                    .where(User.username.ilike(f"{prefix}%"))
+                    .where(User.deleted_at.is_(None))
+                    .order_by(User.username)
+                    .limit(10)).all()
+
+            database = bench(search_database)
+
+        memory = bench(index.search)
+        print(f"{size:>7} users: index {memory * 1e6:>8.1f} us, "
+              f"database {database * 1e6:>9.1f} us per search")
+
+    engine.dispose()
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
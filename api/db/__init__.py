@@ -1,5 +1,14 @@
-from .database import Base, get_session, get_engine
-from .models import User, Post, Like, Comment, Follow
+from .database import (Base, get_session, get_engine, get_request_session,
+                       init_app)
+from .models import (User, Post, Like, Comment, Follow, TimelineEntry,
+                     Image)
+from .counters import reconcile_post_counters, reconcile_user_counters
+from . import (search, timeline, images, cached_responses, purge,
+               instrumentation)
 
-__all__ = ["Base", "get_session", "get_engine", "User",
-           "Post", "Like", "Comment", "Follow"]
+__all__ = ["Base", "get_session", "get_engine", "get_request_session",
+           "init_app", "User",
+           "Post", "Like", "Comment", "Follow", "TimelineEntry", "Image",
+           "reconcile_post_counters", "reconcile_user_counters", "search",
+           "timeline", "images", "cached_responses", "purge",
+           "instrumentation"]
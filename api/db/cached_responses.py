@@ -0,0 +1,67 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from utils import response_cache
+from utils.response_cache import user_key, post_key
+from .models import User, Post, Like, Comment, Follow
+
+"""
+NB: The responses of get_user and get_post are cached by
+utils.response_cache. Like db.counters, mapper events find the responses
+a flush changes, and they are removed from the cache once the transaction
+is committed, so a request after the commit never sees the old response.
+
+Likes, comments and follows change the counters of their post or users
+with Core updates, which do not fire the events of the post or user, so
+they invalidate them themselves. Core statements outside of these events
+must call queue_invalidation, as db.purge does.
+"""
+
+
+def queue_invalidation(session: Session | None, *keys: str):
+    """Invalidates the responses once the session commits."""
+    if session is not None:
+        session.info.setdefault("invalidate_responses", set()).update(keys)
+
+
+def _queue(target, key: str):
+    queue_invalidation(object_session(target), key)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def queue_user(mapper, connection, user: User):
+    _queue(user, user_key(user.id))
+
+
+@event.listens_for(Post, "after_update")
+@event.listens_for(Post, "after_delete")
+def queue_post(mapper, connection, post: Post):
+    _queue(post, post_key(post.id))
+
+
+@event.listens_for(Like, "after_insert")
+@event.listens_for(Like, "after_delete")
+@event.listens_for(Comment, "after_insert")
+@event.listens_for(Comment, "after_delete")
+def queue_counted_post(mapper, connection, target: Like | Comment):
+    _queue(target, post_key(target.pid))
+
+
+@event.listens_for(Follow, "after_insert")
+@event.listens_for(Follow, "after_delete")
+def queue_followed_users(mapper, connection, follow: Follow):
+    session = object_session(follow)
+    queue_invalidation(session, user_key(follow.follower_id),
+                       user_key(follow.followed_id))
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_responses(session: Session):
+    keys = session.info.pop("invalidate_responses", None)
+    if keys:
+        response_cache.invalidate(*keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def keep_responses(session: Session):
+    session.info.pop("invalidate_responses", None)
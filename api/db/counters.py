@@ -0,0 +1,117 @@
+from sqlalchemy import event, update, select, func, or_
+from sqlalchemy.engine import Connection
+from .models import User, Post, Like, Comment, Follow
+
+"""
+NB: The like and comment counters on posts, and the follower and following
+counters on users, are denormalized. They are updated by mapper events, so
+they change in the same transaction as the row that is inserted or deleted.
+This covers the routes as well as cascading deletes done through the ORM.
+
+Bulk deletes done with Core statements do not fire these events, and must
+update the counters themselves, as db.purge does. If the counters ever
+drift, reconcile_post_counters and reconcile_user_counters will recount
+them from the likes, comments and follows tables.
+"""
+
+users = User.__table__
+posts = Post.__table__
+
+
+def _change_counter(connection: Connection, row_id: int, column,
+                    amount: int):
+    table = column.table
+    connection.execute(
+        update(table)
+        .where(table.c.id == row_id)
+        .values({column: column + amount})
+    )
+
+
+@event.listens_for(Like, "after_insert")
+def increment_like_count(mapper, connection, like: Like):
+    _change_counter(connection, like.pid, posts.c.like_count, 1)
+
+
+@event.listens_for(Like, "after_delete")
+def decrement_like_count(mapper, connection, like: Like):
+    _change_counter(connection, like.pid, posts.c.like_count, -1)
+
+
+@event.listens_for(Comment, "after_insert")
+def increment_comment_count(mapper, connection, comment: Comment):
+    _change_counter(connection, comment.pid, posts.c.comment_count, 1)
+
+
+@event.listens_for(Comment, "after_delete")
+def decrement_comment_count(mapper, connection, comment: Comment):
+    _change_counter(connection, comment.pid, posts.c.comment_count, -1)
+
+
+@event.listens_for(Follow, "after_insert")
+def increment_follow_counts(mapper, connection, follow: Follow):
+    _change_counter(connection, follow.followed_id,
+                    users.c.follower_count, 1)
+    _change_counter(connection, follow.follower_id,
+                    users.c.following_count, 1)
+
+
+@event.listens_for(Follow, "after_delete")
+def decrement_follow_counts(mapper, connection, follow: Follow):
+    _change_counter(connection, follow.followed_id,
+                    users.c.follower_count, -1)
+    _change_counter(connection, follow.follower_id,
+                    users.c.following_count, -1)
+
+
+def reconcile_post_counters(connection: Connection) -> int:
+    """Recounts the like and comment counters of every post.
+    Returns the number of posts that had a wrong counter."""
+
+    like_count = (
+        select(func.count(Like.id))
+        .where(Like.pid == posts.c.id)
+        .scalar_subquery()
+    )
+
+    comment_count = (
+        select(func.count(Comment.id))
+        .where(Comment.pid == posts.c.id)
+        .scalar_subquery()
+    )
+
+    stmt = (
+        update(posts)
+        .where(or_(posts.c.like_count != like_count,
+                   posts.c.comment_count != comment_count))
+        .values(like_count=like_count, comment_count=comment_count)
+    )
+
+    return connection.execute(stmt).rowcount
+
+
+def reconcile_user_counters(connection: Connection) -> int:
+    """Recounts the follower and following counters of every user.
+    Returns the number of users that had a wrong counter."""
+
+    follower_count = (
+        select(func.count(Follow.id))
+        .where(Follow.followed_id == users.c.id)
+        .scalar_subquery()
+    )
+
+    following_count = (
+        select(func.count(Follow.id))
+        .where(Follow.follower_id == users.c.id)
+        .scalar_subquery()
+    )
+
+    stmt = (
+        update(users)
+        .where(or_(users.c.follower_count != follower_count,
+                   users.c.following_count != following_count))
+        .values(follower_count=follower_count,
+                following_count=following_count)
+    )
+
+    return connection.execute(stmt).rowcount
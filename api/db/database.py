@@ -1,6 +1,11 @@
 from sqlalchemy import create_engine as sqlalchemy_create_engine
+from sqlalchemy import event, make_url
+from sqlalchemy.engine import URL
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from flask import Flask, g
+from . import instrumentation
+import threading
 import os
 
 engine = None
@@ -8,13 +13,89 @@ Session = None
 
 Base = declarative_base()
 
+# Counters of pool events, to verify how often requests check out connections
+pool_stats = {"connects": 0, "checkouts": 0, "checkins": 0}
+pool_stats_lock = threading.Lock()
+
+# PRAGMAs applied to every new SQLite connection, and the environment
+# variables that override them. WAL lets readers run while a write is in
+# progress, and synchronous=NORMAL is safe against corruption in WAL mode.
+sqlite_pragmas = {
+    "journal_mode": ("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": ("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative values are in KiB, so this is 64 MiB of page cache
+    "cache_size": ("SQLITE_CACHE_SIZE", "-64000"),
+    "mmap_size": ("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "temp_store": ("SQLITE_TEMP_STORE", "MEMORY"),
+    # Milliseconds to wait for a lock before failing with "database is locked"
+    "busy_timeout": ("SQLITE_BUSY_TIMEOUT", "5000"),
+    # SQLite ignores foreign keys, and their ON DELETE CASCADE, unless
+    # enabled. Off by default, as existing data may reference deleted rows,
+    # so the cascades declared on the models do nothing unless this is ON.
+    # Deleting users does not depend on it, see db.purge
+    "foreign_keys": ("SQLITE_FOREIGN_KEYS", "OFF"),
+}
+
+
+def get_database_url() -> URL:
+    if os.environ.get("TESTING") == "True":
+        return make_url("sqlite:///:memory:")
+    return make_url(os.environ.get("DATABASE_URL", "sqlite:///database.db"))
+
+
+def is_memory_database(url: URL) -> bool:
+    return (url.get_backend_name() == "sqlite"
+            and url.database in (None, "", ":memory:"))
+
+
+def get_engine_options(url: URL) -> dict:
+    """Reads the engine options from the environment."""
+    options = {
+        "echo": os.environ.get("DATABASE_ECHO", "False") == "True",
+    }
+
+    # An in-memory database lives in a single connection,
+    # so it has no pool to configure
+    if not is_memory_database(url):
+        options["pool_size"] = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+        options["max_overflow"] = int(
+            os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+        options["pool_timeout"] = float(
+            os.environ.get("DATABASE_POOL_TIMEOUT", 30))
+        options["pool_pre_ping"] = url.get_backend_name() != "sqlite"
+
+    return options
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, (variable, default) in sqlite_pragmas.items():
+        value = os.environ.get(variable, default)
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
 
 def create_engine():
     global engine
-    if os.environ.get("TESTING") == "True":
-        engine = sqlalchemy_create_engine("sqlite:///:memory:", echo=True)
-    else:
-        engine = sqlalchemy_create_engine("sqlite:///database.db", echo=True)
+    url = get_database_url()
+    engine = sqlalchemy_create_engine(url, **get_engine_options(url))
+
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+
+    instrumentation.instrument_engine(engine)
+
+    for pool_event, counter in (("connect", "connects"),
+                                ("checkout", "checkouts"),
+                                ("checkin", "checkins")):
+        event.listen(engine.pool, pool_event, count_pool_event(counter))
+
+
+def count_pool_event(counter: str):
+    def listener(*args):
+        with pool_stats_lock:
+            pool_stats[counter] += 1
+    return listener
 
 
 def create_session():
@@ -43,3 +124,56 @@ def get_engine():
     if engine is None:
         create_engine()
     return engine
+
+
+def get_request_session():
+    """Returns the session of the current request, creating it on first use.
+    The auth middleware and the route share this session, and it is closed
+    when the request ends, so routes should not close it themselves."""
+    if "db_session" not in g:
+        g.db_session = get_session()()
+    return g.db_session
+
+
+def close_request_session(exception=None):
+    """Closes the session of the current request,
+    rolling back anything that was not committed."""
+    session = g.pop("db_session", None)
+    if session is not None:
+        session.close()
+
+
+def init_app(app: Flask):
+    # The session is closed when the request ends. An app context can
+    # outlive a request, for instance in tests, so it is also closed
+    # when the app context ends for sessions used outside requests.
+    app.teardown_request(close_request_session)
+    app.teardown_appcontext(close_request_session)
+    # Counts the statements of each request, see db.instrumentation
+    instrumentation.init_app(app)
+
+
+def get_pool_stats() -> dict:
+    with pool_stats_lock:
+        stats = dict(pool_stats)
+    stats["status"] = get_engine().pool.status()
+    return stats
+
+
+def get_engine_settings() -> dict:
+    """The settings in effect for the engine, for reporting at startup."""
+    engine = get_engine()
+
+    settings = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "echo": engine.echo,
+        "pool": engine.pool.status(),
+    }
+
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            for pragma in sqlite_pragmas:
+                settings[pragma] = connection.exec_driver_sql(
+                    f"PRAGMA {pragma}").scalar()
+
+    return settings
@@ -0,0 +1,105 @@
+from sqlalchemy import event, update, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, object_session
+from .models import User, Post, Image
+import os
+
+"""
+NB: Uploaded images are named by the hash of their content, so identical
+files are stored once. The images table counts the posts and users that
+reference each file. When the count reaches zero the row is deleted, but
+the file is left for the image sweeper. An upload of the same content may
+already have found the file and be about to count it again, so removing
+it on commit could leave that upload pointing at a missing file. The
+sweeper only removes files that nothing references and that have not been
+touched for its grace period, which save_image refreshes.
+
+Images uploaded before this have random names and no row in the images
+table. Each of them is used by a single row, so their file is removed as
+soon as that row no longer references it.
+
+Like db.counters this is done by mapper events when posts and users are
+deleted, and the services call acquire_image and release_image when an
+image is replaced.
+"""
+
+# Subdirectory of static/images for each kind of image
+IMAGE_DIRECTORIES = {
+    "posts": "static/images/posts",
+    "users": "static/images/users",
+}
+
+# Images shipped with the application, never counted or removed
+PLACEHOLDER_IMAGES = {"placeholder-profile.jpg", "placeholder-banner.jpg"}
+
+images = Image.__table__
+
+
+def image_path(kind: str, filename: str) -> str:
+    return os.path.join(IMAGE_DIRECTORIES[kind], filename)
+
+
+def acquire_image(connection: Connection, kind: str, filename: str,
+                  size: int):
+    """Counts a new reference to an image, adding the row if needed."""
+    connection.execute(
+        insert(images)
+        .values(kind=kind, filename=filename, size=size, ref_count=1)
+        .on_conflict_do_update(
+            index_elements=[images.c.kind, images.c.filename],
+            set_={"ref_count": images.c.ref_count + 1})
+    )
+
+
+def release_image(connection: Connection, session: Session | None,
+                  kind: str, filename: str | None, count: int = 1):
+    """Removes count references to an image. When they were the last
+    references the row is deleted, the file is left for the image sweeper.
+    Images without a row are removed after the session commits."""
+    if not filename or filename in PLACEHOLDER_IMAGES:
+        return
+
+    key = (images.c.kind == kind) & (images.c.filename == filename)
+    ref_count = connection.execute(
+        update(images)
+        .where(key)
+        .values(ref_count=images.c.ref_count - count)
+        .returning(images.c.ref_count)
+    ).scalar()
+
+    if ref_count is not None:
+        if ref_count <= 0:
+            connection.execute(delete(images).where(key))
+        return
+
+    # No row means the image was uploaded before images were counted
+    if session is not None:
+        session.info.setdefault("unlink_images", []).append(
+            image_path(kind, filename))
+
+
+@event.listens_for(Post, "after_delete")
+def release_post_image(mapper, connection, post: Post):
+    release_image(connection, object_session(post), "posts", post.image)
+
+
+@event.listens_for(User, "after_delete")
+def release_user_images(mapper, connection, user: User):
+    session = object_session(user)
+    release_image(connection, session, "users", user.profile_picture)
+    release_image(connection, session, "users", user.banner_picture)
+
+
+@event.listens_for(Session, "after_commit")
+def unlink_released_images(session: Session):
+    for path in session.info.pop("unlink_images", []):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@event.listens_for(Session, "after_rollback")
+def keep_released_images(session: Session):
+    session.info.pop("unlink_images", None)
@@ -0,0 +1,115 @@
+from flask import (Flask, Response, current_app, g, has_request_context,
+                   request)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy import event
+import logging
+import os
+import time
+
+"""
+NB: Every statement run on the engine is timed by cursor events. During a
+request the number of statements and their total time are added up in g,
+and sent back in a Server-Timing header, which the network tools of
+browsers show next to the request. Unlike DATABASE_ECHO this does not
+print every statement.
+
+Statements that take at least SLOW_QUERY_MS are written to the
+slow_queries logger, with their parameters and the plan SQLite chose for
+them. The plan is captured with EXPLAIN QUERY PLAN on the same connection
+right after the statement ran, so it is the plan the statement used unless
+the schema changed in between.
+"""
+
+# Statements taking at least this many milliseconds are logged,
+# 0 turns the slow query log off
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+
+slow_query_log = logging.getLogger("slow_queries")
+
+# Statements that EXPLAIN QUERY PLAN can describe
+EXPLAINED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def start_timer(conn: Connection, cursor, statement, parameters, context,
+                executemany):
+    # Kept on the execution context, so nothing is left behind when the
+    # statement raises and stop_timer is not called
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def stop_timer(conn: Connection, cursor, statement, parameters, context,
+               executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+
+    # Statements outside of requests, such as in background threads,
+    # are only checked for the slow query log
+    if has_request_context() and "sql_stats" in g:
+        g.sql_stats["statements"] += 1
+        g.sql_stats["time"] += elapsed
+
+    if 0 < SLOW_QUERY_MS <= elapsed * 1000:
+        if executemany:
+            parameters = parameters[0] if parameters else None
+        log_slow_query(conn, statement, parameters, elapsed)
+
+
+def explain(conn: Connection, statement: str, parameters) -> list[str]:
+    """The query plan of a statement, run on the DBAPI cursor so the
+    events are not fired for it."""
+    if (conn.dialect.name != "sqlite" or not statement.lstrip().upper()
+            .startswith(EXPLAINED_STATEMENTS)):
+        return []
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f"Not explained: {e}"]
+    finally:
+        cursor.close()
+
+
+def log_slow_query(conn: Connection, statement: str, parameters,
+                   elapsed: float):
+    source = (f"{request.method} {request.path}" if has_request_context()
+              else "outside of a request")
+    plan = explain(conn, statement, parameters)
+    slow_query_log.warning(
+        "%.1f ms, %s\n%s\nParameters: %r\nPlan:\n  %s",
+        elapsed * 1000, source, statement, parameters,
+        "\n  ".join(plan) or "none")
+
+
+def instrument_engine(engine: Engine):
+    event.listen(engine, "before_cursor_execute", start_timer)
+    event.listen(engine, "after_cursor_execute", stop_timer)
+
+
+def start_request():
+    g.sql_stats = {"statements": 0, "time": 0.0}
+    g.request_start = time.perf_counter()
+
+
+def add_server_timing(response: Response) -> Response:
+    stats = g.get("sql_stats")
+    if stats is None or not current_app.config.get("SERVER_TIMING_ENABLED"):
+        return response
+
+    total = time.perf_counter() - g.request_start
+    statements = stats["statements"]
+    description = f"{statements} statement{'' if statements == 1 else 's'}"
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={stats["time"] * 1000:.2f};desc="{description}", '
+        f'total;dur={total * 1000:.2f}')
+    return response
+
+
+def init_app(app: Flask):
+    app.before_request(start_request)
+    app.after_request(add_server_timing)
@@ -1,14 +1,23 @@
 from sqlalchemy.orm import validates, mapped_column, Mapped, relationship
-from sqlalchemy.types import Integer, String, DateTime
-from sqlalchemy import ForeignKey, func
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.types import Integer, String, DateTime, Boolean
+from sqlalchemy import ForeignKey, Index, func, text
+from utils import password_helper
 from typing import Optional
+from datetime import datetime
 from . import Base
 import re
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Lookups of the users referencing an image, see image_sweeper
+        Index("ix_users_profile_picture", "profile_picture"),
+        Index("ix_users_banner_picture", "banner_picture"),
+        # Users that are not deleted in id order, for the user listing,
+        # and deleted accounts waiting to be purged, see account_purger
+        Index("ix_users_deleted_at_id", "deleted_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(
@@ -21,14 +30,32 @@ class User(Base):
         String(50), nullable=False, default="placeholder-banner.jpg")
     about_me: Mapped[str] = mapped_column(
         String(200), nullable=False, default="")
+    # Denormalized counters, kept in sync by the listeners in db.counters
+    follower_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0")
+    following_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0")
+    # Changes on every update, also of the counters, used as the validator
+    # for conditional GETs
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime, default=datetime.now, onupdate=datetime.now)
+    # Set when the account is deleted, until the purge removes the row
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime, nullable=True)
+    # The rows of a deleted user are removed with set-based statements by
+    # db.purge, so they are never loaded to be deleted one by one
     follows: Mapped[list["Follow"]] = relationship(
-        "Follow", primaryjoin="User.id == Follow.follower_id", cascade="all, delete-orphan")
+        "Follow", primaryjoin="User.id == Follow.follower_id",
+        cascade="all, delete-orphan", passive_deletes=True)
     posts: Mapped[list["Post"]] = relationship(
-        "Post", primaryjoin="User.id == Post.uid", cascade="all, delete-orphan")
+        "Post", primaryjoin="User.id == Post.uid",
+        cascade="all, delete-orphan", passive_deletes=True)
     comments: Mapped[list["Comment"]] = relationship(
-        "Comment", primaryjoin="User.id == Comment.uid", cascade="all, delete-orphan")
+        "Comment", primaryjoin="User.id == Comment.uid",
+        cascade="all, delete-orphan", passive_deletes=True)
     likes: Mapped[list["Like"]] = relationship(
-        "Like", primaryjoin="User.id == Like.uid", cascade="all, delete-orphan")
+        "Like", primaryjoin="User.id == Like.uid",
+        cascade="all, delete-orphan", passive_deletes=True)
 
     def __init__(self, username, email, password) -> None:
         super().__init__(username=username, email=email)
@@ -40,11 +67,14 @@ class User(Base):
         return f"<User {self.username}>"
 
     def check_password(self, password):
-        return check_password_hash(self.hashed_password, password)
+        return password_helper.check_password(self.hashed_password, password)
 
     def set_password(self, password):
         self.validate_password(password)
-        self.hashed_password = generate_password_hash(password)
+        self.hashed_password = password_helper.hash_password(password)
+
+    def password_needs_rehash(self):
+        return password_helper.needs_rehash(self.hashed_password)
 
     def validate_password(self, password):
         if len(password) < 8:
@@ -97,19 +127,45 @@ class User(Base):
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # Posts made by a user, newest first
+        Index("ix_posts_uid_id", "uid", "id"),
+        # Same as above, but only for posts with an image (media tab)
+        Index("ix_posts_uid_id_image", "uid", "id",
+              sqlite_where=text("image IS NOT NULL")),
+        # Posts pulled into feeds instead of being fanned out
+        Index("ix_posts_uid_id_pulled", "uid", "id",
+              sqlite_where=text("fanned_out = 0")),
+        # Lookups of the posts referencing an image, see image_sweeper
+        Index("ix_posts_image", "image"),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(70), nullable=False)
     content: Mapped[str] = mapped_column(String(200), nullable=False)
     uid: Mapped[int] = mapped_column(
-        ForeignKey('users.id'), nullable=False)
+        ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
     image: Mapped[str] = mapped_column(
         String(50), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+    # Denormalized counters, kept in sync by the listeners in db.counters
+    like_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0")
+    comment_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0")
+    # Changes on every update, also of the counters, used as the validator
+    # for conditional GETs
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime, default=datetime.now, onupdate=datetime.now)
+    # Whether the post was added to the timelines of the followers,
+    # set by the listeners in db.timeline
+    fanned_out: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default="0")
     comments: Mapped[list["Comment"]] = relationship(
-        "Comment", cascade="all, delete")
+        "Comment", cascade="all, delete", passive_deletes=True)
     likes: Mapped[list["Like"]] = relationship(
         "Like",
-        cascade="all, delete")
+        cascade="all, delete", passive_deletes=True)
 
     def __repr__(self):
         return f"<Post {self.title}>"
@@ -133,12 +189,18 @@ class Post(Base):
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        # Likes for a post, the rowid makes it ordered by id
+        Index("ix_likes_pid", "pid"),
+        # Like status of a user for a post, and posts liked by a user
+        Index("ix_likes_uid_pid", "uid", "pid"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    uid: Mapped[int] = mapped_column(ForeignKey('users.id'),
-                                     nullable=False)
-    pid: Mapped[int] = mapped_column(ForeignKey('posts.id'),
-                                     nullable=False)
+    uid: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    pid: Mapped[int] = mapped_column(
+        ForeignKey('posts.id', ondelete="CASCADE"), nullable=False)
 
     def serialize(self):
         return {
@@ -150,13 +212,19 @@ class Like(Base):
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # Comments for a post, the rowid makes it ordered by id
+        Index("ix_comments_pid", "pid"),
+        # Comments made by a user, optionally on a single post
+        Index("ix_comments_uid_pid", "uid", "pid"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     content: Mapped[str] = mapped_column(String(100), nullable=False)
-    uid: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'),
-                                     nullable=False)
-    pid: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id'),
-                                     nullable=False)
+    uid: Mapped[int] = mapped_column(
+        Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    pid: Mapped[int] = mapped_column(
+        Integer, ForeignKey('posts.id', ondelete="CASCADE"), nullable=False)
 
     def serialize(self):
         return {
@@ -179,11 +247,49 @@ class Comment(Base):
 
 class Follow(Base):
     __tablename__ = "follows"
+    __table_args__ = (
+        # Users followed by a user, and the follow status between two users
+        Index("ix_follows_follower_id_followed_id",
+              "follower_id", "followed_id"),
+        # Followers of a user, newest first
+        Index("ix_follows_followed_id_followed_date",
+              "followed_id", "followed_date"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    follower_id: Mapped[int] = mapped_column(ForeignKey('users.id'),
-                                             nullable=False)
-    followed_id: Mapped[int] = mapped_column(ForeignKey('users.id'),
-                                             nullable=False)
+    follower_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    followed_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
     followed_date: Mapped[DateTime] = mapped_column(
         DateTime, default=func.now())
+
+
+class TimelineEntry(Base):
+    """A post in the feed of a user, kept in sync by db.timeline"""
+    __tablename__ = "timeline"
+    __table_args__ = (
+        # Entries for a post, to remove them when the post is deleted
+        Index("ix_timeline_post_id", "post_id"),
+        # The primary key is the only lookup needed, so no rowid
+        {"sqlite_with_rowid": False},
+    )
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    post_id: Mapped[int] = mapped_column(
+        ForeignKey('posts.id', ondelete="CASCADE"), primary_key=True)
+
+
+class Image(Base):
+    """An image file, named by the hash of its content.
+    Counts the rows referencing it, see db.images"""
+    __tablename__ = "images"
+
+    # Subdirectory of static/images the file is stored in
+    kind: Mapped[str] = mapped_column(String(10), primary_key=True)
+    filename: Mapped[str] = mapped_column(String(50), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    ref_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=1, server_default="1")
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
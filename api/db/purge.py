@@ -0,0 +1,160 @@
+from sqlalchemy import event, select, delete, update, func, and_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, object_session
+from utils.response_cache import user_key, post_key
+from .models import User, Post, Like, Comment, Follow, TimelineEntry
+from .images import release_image
+from .cached_responses import queue_invalidation
+
+"""
+NB: Deleting a user removes its posts, likes, comments and follows with a
+few set-based statements, instead of loading every row into the session
+and deleting them one by one. The relationships of User and Post are
+passive_deletes, so the ORM leaves these rows to the listeners here.
+
+The statements do for many rows at once what the mapper events in
+db.counters, db.timeline, db.images and db.cached_responses do for a
+single row, so they must be kept in step with them. The foreign keys
+declare ON DELETE CASCADE, but SQLite only applies it with
+SQLITE_FOREIGN_KEYS=ON, and tables created before the cascades were added
+do not have them, so these statements do the work.
+
+Every function takes a limit, so services.account_purger can remove a
+large account in many short transactions instead of one long one.
+"""
+
+users = User.__table__
+posts = Post.__table__
+likes = Like.__table__
+comments = Comment.__table__
+follows = Follow.__table__
+timeline = TimelineEntry.__table__
+
+
+def _limited(stmt, column, limit: int | None):
+    if limit is None:
+        return stmt
+    return stmt.order_by(column).limit(limit)
+
+
+def delete_posts(connection: Connection, session: Session | None,
+                 uid: int, limit: int | None = None) -> int:
+    """Deletes the posts of a user, with their likes, comments and timeline
+    entries, and releases their images. Returns the number of posts."""
+    post_ids = _limited(select(posts.c.id).where(posts.c.uid == uid),
+                        posts.c.id, limit)
+    pids = connection.execute(post_ids).scalars().all()
+    if not pids:
+        return 0
+    # A subquery, as the number of ids can be above the variable limit
+    post_ids = post_ids.scalar_subquery()
+
+    used_images = connection.execute(
+        select(posts.c.image, func.count())
+        .where(posts.c.id.in_(post_ids))
+        .where(posts.c.image.is_not(None))
+        .group_by(posts.c.image)
+    ).all()
+    for image, count in used_images:
+        release_image(connection, session, "posts", image, count)
+
+    connection.execute(delete(likes).where(likes.c.pid.in_(post_ids)))
+    connection.execute(delete(comments).where(comments.c.pid.in_(post_ids)))
+    connection.execute(
+        delete(timeline).where(timeline.c.post_id.in_(post_ids)))
+    connection.execute(delete(posts).where(posts.c.id.in_(post_ids)))
+
+    queue_invalidation(session, *(post_key(pid) for pid in pids))
+    return len(pids)
+
+
+def _delete_counted(connection: Connection, session: Session | None,
+                    owner, target, counter, key, uid: int,
+                    limit: int | None) -> int:
+    """Deletes the rows where the owner column is the user, and subtracts
+    them from the counter of the row the target column points to."""
+    table = owner.table
+    counted = counter.table
+
+    # The rows are picked by their last id instead of an IN subquery,
+    # which SQLite would run again for every row in the update
+    ids = _limited(select(table.c.id).where(owner == uid),
+                   table.c.id, limit).subquery()
+    last_id = connection.execute(select(func.max(ids.c.id))).scalar()
+    if last_id is None:
+        return 0
+    rows = and_(owner == uid, table.c.id <= last_id)
+
+    targets = connection.execute(
+        select(target).where(rows).distinct()).scalars().all()
+    removed = (
+        select(func.count())
+        .where(target == counted.c.id)
+        .where(rows)
+        .scalar_subquery()
+    )
+    connection.execute(
+        update(counted)
+        .where(counted.c.id.in_(select(target).where(rows)))
+        .values({counter: counter - removed})
+    )
+    deleted = connection.execute(delete(table).where(rows)).rowcount
+
+    queue_invalidation(session, *(key(row_id) for row_id in targets))
+    return deleted
+
+
+def delete_activity(connection: Connection, session: Session | None,
+                    uid: int, limit: int | None = None) -> int:
+    """Deletes the likes and comments of a user on the posts of others,
+    updating the counters of those posts. Returns the number of rows."""
+    return (
+        _delete_counted(connection, session, likes.c.uid, likes.c.pid,
+                        posts.c.like_count, post_key, uid, limit)
+        + _delete_counted(connection, session, comments.c.uid,
+                          comments.c.pid, posts.c.comment_count, post_key,
+                          uid, limit)
+    )
+
+
+def delete_follows(connection: Connection, session: Session | None,
+                   uid: int, limit: int | None = None) -> int:
+    """Deletes the follows of and by a user, updating the counters of the
+    other users. The timeline entries they caused are removed with the
+    posts and the timeline of the user. Returns the number of follows."""
+    return (
+        _delete_counted(connection, session, follows.c.follower_id,
+                        follows.c.followed_id, users.c.follower_count,
+                        user_key, uid, limit)
+        + _delete_counted(connection, session, follows.c.followed_id,
+                          follows.c.follower_id, users.c.following_count,
+                          user_key, uid, limit)
+    )
+
+
+def delete_timeline(connection: Connection, uid: int,
+                    limit: int | None = None) -> int:
+    """Deletes the feed of a user. Returns the number of entries."""
+    entries = _limited(
+        select(timeline.c.post_id).where(timeline.c.user_id == uid),
+        timeline.c.post_id, limit).scalar_subquery()
+    return connection.execute(
+        delete(timeline)
+        .where(timeline.c.user_id == uid)
+        .where(timeline.c.post_id.in_(entries))
+    ).rowcount
+
+
+@event.listens_for(User, "before_delete")
+def delete_user_rows(mapper, connection, user: User):
+    session = object_session(user)
+    delete_posts(connection, session, user.id)
+    delete_activity(connection, session, user.id)
+    delete_follows(connection, session, user.id)
+
+
+@event.listens_for(Post, "before_delete")
+def delete_post_rows(mapper, connection, post: Post):
+    # The counters of the post are not updated, as it is deleted
+    connection.execute(delete(likes).where(likes.c.pid == post.id))
+    connection.execute(delete(comments).where(comments.c.pid == post.id))
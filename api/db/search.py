@@ -0,0 +1,150 @@
+from sqlalchemy import (Table, Column, MetaData, Integer, Float, String,
+                        event, select, or_, and_)
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from .models import Post
+import re
+
+"""
+NB: Post search uses an SQLite FTS5 virtual table, posts_fts. It is an
+external content table, meaning it only stores the search index and reads
+the text from the posts table. Triggers on the posts table keep it in sync,
+which also covers statements that bypass the ORM.
+
+The table is not part of Base.metadata, as create_all can't create virtual
+tables. It is created together with the posts table, or by init_db for
+databases created before search was added. If the SQLite build lacks FTS5
+the table is never created, and the routes fall back to ilike.
+"""
+
+posts_fts = Table(
+    "posts_fts", MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("title", String),
+    Column("content", String),
+    # Hidden columns, the table name is used as the left side of MATCH
+    Column("posts_fts", String),
+    Column("rank", Float),
+)
+
+create_statements = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content,
+        content='posts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts
+    BEGIN
+        INSERT INTO posts_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts
+    BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_update
+    AFTER UPDATE OF title, content ON posts
+    BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+# None until it is known whether the search table exists
+_search_enabled: bool | None = None
+
+
+def create_search_index(connection: Connection) -> bool:
+    """Creates the search table and its triggers if they don't exist.
+    Returns whether post search is enabled."""
+    global _search_enabled
+
+    if connection.dialect.name != "sqlite":
+        _search_enabled = False
+        return False
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").first()
+
+    try:
+        for statement in create_statements:
+            connection.exec_driver_sql(statement)
+    except OperationalError:
+        # The SQLite build has no FTS5 support
+        _search_enabled = False
+        return False
+
+    if not exists:
+        # Index posts that existed before the search table
+        connection.exec_driver_sql(
+            "INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')")
+
+    _search_enabled = True
+    return True
+
+
+def drop_search_index(connection: Connection):
+    """Drops the search table, the triggers are dropped with posts."""
+    global _search_enabled
+
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS posts_fts")
+    _search_enabled = None
+
+
+def search_enabled(connection: Connection) -> bool:
+    """Whether the search table exists. Only checked once."""
+    global _search_enabled
+
+    if _search_enabled is None:
+        _search_enabled = connection.dialect.name == "sqlite" and bool(
+            connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'"
+            ).first())
+
+    return _search_enabled
+
+
+def match_query(query: str) -> str | None:
+    """Turns user input into an FTS5 query.
+    Every word is quoted, so operators in the input are not interpreted,
+    and matched as a prefix as the search runs while the user types."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_posts_stmt(match: str, last_rank: float | None = None,
+                      last_id: int = 0):
+    """Select posts matching an FTS5 query together with their rank.
+    Ordered by bm25 rank, best match first, and then by id.
+    last_rank and last_id are the rank and id of the last post on the
+    previous page."""
+    rank = posts_fts.c.rank
+
+    stmt = (
+        select(Post, rank)
+        .join(posts_fts, posts_fts.c.rowid == Post.id)
+        .where(posts_fts.c.posts_fts.match(match))
+        .order_by(rank, Post.id)
+    )
+
+    if last_rank is not None:
+        stmt = stmt.where(or_(rank > last_rank,
+                              and_(rank == last_rank, Post.id > last_id)))
+
+    return stmt
+
+
+@event.listens_for(Post.__table__, "after_create")
+def create_search_index_with_posts(target, connection, **kwargs):
+    create_search_index(connection)
+
+
+@event.listens_for(Post.__table__, "before_drop")
+def drop_search_index_with_posts(target, connection, **kwargs):
+    drop_search_index(connection)
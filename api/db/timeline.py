@@ -0,0 +1,176 @@
+from sqlalchemy import (event, select, delete, update, func, false, literal,
+                        union_all, exists)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from .models import User, Post, Follow, TimelineEntry
+import os
+
+"""
+NB: Feeds are materialized in the timeline table. When a post is created
+it is fanned out, meaning an entry is added for every follower of the
+author. Following a user backfills their latest posts, and unfollowing or
+deleting removes the entries again. A feed page is then a range read on
+the primary key of the timeline.
+
+Fanning out costs a row per follower, so posts by authors with more than
+FEED_FANOUT_LIMIT followers are not fanned out. Those posts are pulled
+into the feed when it is read instead, see feed_stmt.
+
+Like db.counters this is done by mapper events, so it only covers changes
+made through the ORM. rebuild_timeline fills the table from scratch.
+"""
+
+# Authors with more followers than this have their posts pulled
+FEED_FANOUT_LIMIT = int(os.environ.get("FEED_FANOUT_LIMIT", 10000))
+# Number of posts added to the timeline when following a user
+FEED_BACKFILL_SIZE = int(os.environ.get("FEED_BACKFILL_SIZE", 1000))
+
+timeline = TimelineEntry.__table__
+users = User.__table__
+posts = Post.__table__
+follows = Follow.__table__
+
+
+def _count_followers(connection: Connection, uid: int) -> int:
+    # Kept by db.counters, so the follows are not counted on every post
+    return connection.scalar(
+        select(users.c.follower_count).where(users.c.id == uid)) or 0
+
+
+@event.listens_for(Post, "before_insert")
+def decide_fan_out(mapper, connection, post: Post):
+    post.fanned_out = _count_followers(connection, post.uid) \
+        <= FEED_FANOUT_LIMIT
+
+
+@event.listens_for(Post, "after_insert")
+def fan_out_post(mapper, connection, post: Post):
+    if not post.fanned_out:
+        return
+
+    followers = (
+        select(follows.c.follower_id, literal(post.id))
+        .where(follows.c.followed_id == post.uid)
+    )
+    connection.execute(
+        insert(timeline)
+        .from_select(["user_id", "post_id"], followers)
+        .on_conflict_do_nothing()
+    )
+
+
+@event.listens_for(Post, "before_delete")
+def remove_post_from_timelines(mapper, connection, post: Post):
+    connection.execute(delete(timeline).where(timeline.c.post_id == post.id))
+
+
+@event.listens_for(Follow, "after_insert")
+def backfill_timeline(mapper, connection, follow: Follow):
+    latest_posts = (
+        select(literal(follow.follower_id), posts.c.id)
+        .where(posts.c.uid == follow.followed_id)
+        .where(posts.c.fanned_out)
+        .order_by(posts.c.id.desc())
+        .limit(FEED_BACKFILL_SIZE)
+    )
+    connection.execute(
+        insert(timeline)
+        .from_select(["user_id", "post_id"], latest_posts)
+        .on_conflict_do_nothing()
+    )
+
+
+@event.listens_for(Follow, "after_delete")
+def prune_timeline(mapper, connection, follow: Follow):
+    followed_posts = (
+        select(posts.c.id)
+        .where(posts.c.uid == follow.followed_id)
+    )
+    connection.execute(
+        delete(timeline)
+        .where(timeline.c.user_id == follow.follower_id)
+        .where(timeline.c.post_id.in_(followed_posts))
+    )
+
+
+@event.listens_for(User, "before_delete")
+def remove_timeline(mapper, connection, user: User):
+    connection.execute(delete(timeline).where(timeline.c.user_id == user.id))
+
+
+def rebuild_timeline(connection: Connection) -> int:
+    """Fills the timeline from the posts and follows tables, deciding again
+    which posts are fanned out. Returns the number of entries."""
+
+    follower_count = (
+        select(func.count())
+        .select_from(follows)
+        .where(follows.c.followed_id == posts.c.uid)
+        .scalar_subquery()
+    )
+
+    connection.execute(delete(timeline))
+    connection.execute(
+        update(posts).values(fanned_out=follower_count <= FEED_FANOUT_LIMIT))
+
+    entries = (
+        select(follows.c.follower_id, posts.c.id)
+        .join(posts, posts.c.uid == follows.c.followed_id)
+        .where(posts.c.fanned_out)
+    )
+    return connection.execute(
+        insert(timeline).from_select(["user_id", "post_id"], entries)
+    ).rowcount
+
+
+def _author_deleted():
+    # The posts of users marked as deleted are hidden until they are purged
+    author = users.alias("deleted_author")
+    return (exists()
+            .where(author.c.id == posts.c.uid)
+            .where(author.c.deleted_at.is_not(None)))
+
+
+def feed_stmt(uid: int, page_size: int, last_id: int = 0):
+    """Statement for a page of the feed of a user, newest first.
+    Reads the timeline of the user, and the posts that are not fanned out
+    from the users they follow, each limited to a page before merging.
+    Posts of deleted authors are left out before the limit, so they do not
+    make a page short."""
+
+    pushed = (
+        select(timeline.c.post_id.label("id"))
+        .join(posts, posts.c.id == timeline.c.post_id)
+        .where(timeline.c.user_id == uid)
+        .where(~_author_deleted())
+        .order_by(timeline.c.post_id.desc())
+        .limit(page_size)
+    )
+
+    pulled = (
+        select(posts.c.id)
+        .join(follows, follows.c.followed_id == posts.c.uid)
+        .where(follows.c.follower_id == uid)
+        .where(posts.c.fanned_out == false())
+        .where(~_author_deleted())
+        .order_by(posts.c.id.desc())
+        .limit(page_size)
+    )
+
+    if last_id:
+        pushed = pushed.where(timeline.c.post_id < last_id)
+        pulled = pulled.where(posts.c.id < last_id)
+
+    # SQLite only allows ORDER BY and LIMIT on the last part of a compound
+    # select, so each part is wrapped in a subquery
+    feed_ids = union_all(
+        select(pushed.subquery()),
+        select(pulled.subquery()),
+    ).subquery()
+
+    return (
+        select(Post)
+        .join(feed_ids, feed_ids.c.id == Post.id)
+        .order_by(Post.id.desc())
+        .limit(page_size)
+    )
@@ -1,9 +1,63 @@
 from functools import wraps
 from flask import request, Response, current_app
 from utils.jwt_helper import decode_jwt
-from db import get_session, User
+from utils.cache import TTLCache
+from db import get_request_session, User
 from sqlalchemy import select
 
+# Cache of user ids known to exist. Created on first use from the app config
+user_cache: TTLCache | None = None
+
+
+def get_user_cache() -> TTLCache | None:
+    """Returns the cache of user ids known to exist,
+    or None if it is turned off with AUTH_CACHE_ENABLED."""
+    global user_cache
+
+    config = current_app.config
+    if not config.get("AUTH_CACHE_ENABLED", True):
+        return None
+
+    if user_cache is None:
+        user_cache = TTLCache(
+            maxsize=int(config.get("AUTH_CACHE_SIZE", 10000)),
+            ttl=float(config.get("AUTH_CACHE_TTL", 60)))
+    return user_cache
+
+
+def invalidate_user(uid: int):
+    """Removes a user from the cache. Must be called when a user is deleted,
+    otherwise their tokens stay valid until the entry expires."""
+    if user_cache is not None:
+        user_cache.delete(uid)
+
+
+def clear_user_cache():
+    if user_cache is not None:
+        user_cache.clear()
+
+
+def user_exists(uid: int) -> bool:
+    cache = get_user_cache()
+
+    if cache is not None and cache.get(uid):
+        return True
+
+    session = get_request_session()
+
+    stmt = (
+        select(User.id)
+        .where(User.id == uid)
+        .where(User.deleted_at.is_(None))
+    )
+
+    exists = session.execute(stmt).first() is not None
+
+    if exists and cache is not None:
+        cache.set(uid, True)
+
+    return exists
+
 
 def authorized():
     """Decorator for routes that require authentication.
@@ -25,18 +79,7 @@ def authorized():
             except Exception:
                 return Response(status=401)
 
-            Session = get_session()
-            session = Session()
-
-            stmt = (
-                select(User)
-                .where(User.id == payload["uid"])
-            )
-
-            user = session.scalars(stmt).first()
-            session.close()
-
-            if user is None:
+            if not user_exists(payload["uid"]):
                 return Response(status=401)
 
             kwargs["uid"] = payload["uid"]
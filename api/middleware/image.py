@@ -1,7 +1,9 @@
 from functools import wraps
-from flask import request, Response
+from flask import request, Response, Request, current_app
 from werkzeug.datastructures import FileStorage
-from typing import Callable
+from tempfile import SpooledTemporaryFile
+from typing import Callable, IO
+import os
 
 mimetype_check = []
 
@@ -70,16 +72,53 @@ def validate_mimetype(file: FileStorage,
         raise ValueError("Invalid mimetype, mimetype does not match header")
 
 
+def get_stream_size(stream: IO[bytes]) -> int:
+    """Get the size of a stream by seeking to the end, without reading it.
+    The position of the stream is left unchanged."""
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return size
+
+
 def validate_img_size(file: FileStorage, max_size: int, min_size: int):
     """Validate the size of the image."""
-    byte_stream = file.stream.read()
-    if len(byte_stream) > max_size:
+    try:
+        size = get_stream_size(file.stream)
+    except (AttributeError, OSError):
+        # This should never happen, uploads are spooled to seekable files
+        raise ValueError("Invalid file, could not get size")
+
+    if size > max_size:
         raise ValueError("File too large")
 
-    if len(byte_stream) < min_size:
+    if size < min_size:
         raise ValueError("File too small")
 
 
+class UploadRequest(Request):
+    """Request that keeps uploaded files in memory up to UPLOAD_SPOOL_SIZE
+    bytes, and spools larger files to a temporary file. Together with
+    MAX_CONTENT_LENGTH and MAX_FORM_MEMORY_SIZE this bounds the memory
+    used by an upload, as the limits are checked while parsing.
+
+    The form limits are read from the config here, as Flask only reads
+    MAX_FORM_MEMORY_SIZE and MAX_FORM_PARTS itself since 3.1."""
+
+    @property
+    def max_form_memory_size(self) -> int | None:
+        return current_app.config.get("MAX_FORM_MEMORY_SIZE")
+
+    @property
+    def max_form_parts(self) -> int | None:
+        return current_app.config.get("MAX_FORM_PARTS", 1000)
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None) -> IO[bytes]:
+        max_size = current_app.config.get("UPLOAD_SPOOL_SIZE", 512 * 1024)
+        return SpooledTemporaryFile(max_size=max_size, mode="rb+")
+
+
 def image_validated(allowed_mimetypes: list[str] | None = None,
                     max_size: int = 5 * 1024 * 1024, min_size: int = 1,
                     is_multipart: bool = False):
@@ -1,7 +1,31 @@
-from flask import Blueprint
+from flask import Blueprint, Response, current_app, jsonify
+from middleware import auth, authorized
+from utils import jwt_helper, response_cache
+from db.database import get_pool_stats
 api_bp = Blueprint('api_blueprint', __name__)
 
 
 @api_bp.route('/')
 def hello_world():
     return 'Hello to the API!'
+
+
+@api_bp.route('/metrics')
+@authorized()
+def metrics(uid):
+    """Statistics of the in-process caches and the connection pool.
+    Only served when METRICS_ENABLED is set."""
+    if not current_app.config.get("METRICS_ENABLED"):
+        return Response(status=404)
+
+    user_cache = auth.user_cache
+    cache = response_cache.response_cache
+
+    response = {
+        "auth_cache": user_cache.stats() if user_cache is not None else None,
+        "jwt_cache": jwt_helper.token_cache.stats(),
+        "response_cache": cache.stats() if cache is not None else None,
+        "pool": get_pool_stats(),
+    }
+
+    return jsonify(response)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, Response, jsonify, current_app
-from db import get_session, User
+from db import get_request_session, User
 from utils.jwt_helper import create_jwt, create_jwt_expiration
+from services.username_index import username_index
 from sqlalchemy import select
 
 auth_bp = Blueprint("auth_blueprint", __name__)
@@ -18,15 +19,15 @@ def login():
     if len(data) != 2:
         return Response("Invalid request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     stmt = (
-        select(User).where(User.username == username)
+        select(User)
+        .where(User.username == username)
+        .where(User.deleted_at.is_(None))
     )
 
     user = session.scalars(stmt).first()
-    session.close()
 
     if user is None:
         return Response("Invalid credentials", 401)
@@ -34,6 +35,11 @@ def login():
     if not user.check_password(password):
         return Response("Invalid credentials", 401)
 
+    # Upgrade hashes made with an older method or cost
+    if user.password_needs_rehash():
+        user.set_password(password)
+        session.commit()
+
     expiration = create_jwt_expiration(current_app.config["JWT_TOKEN_EXPIRES"])
     secret = current_app.config["JWT_SECRET"]
     token = create_jwt(expiration, user.id, secret)
@@ -56,8 +62,7 @@ def register():
     if len(data) != 3:
         return Response("Invalid request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     stmt = (
         select(User).where(User.username == username)
@@ -72,13 +77,13 @@ def register():
         session.add(user)
         session.commit()
     except ValueError as e:
-        session.close()
         return Response(str(e), 400)
     # Fetch the user again to get the id
     user = session.query(User).filter_by(username=username).first()
     if user is None:
         return Response("Internal server error", 500)
-    session.close()
+
+    username_index.add(user.id, user.username)
 
     expiration = create_jwt_expiration(current_app.config["JWT_TOKEN_EXPIRES"])
     secret = current_app.config["JWT_SECRET"]
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, Response, jsonify
-from db import get_session, Post, Comment, Like
+from db import get_request_session, search, Post, Comment, Like
 from middleware import authorized
-from sqlalchemy import select, func
-from services import exists_service
+from sqlalchemy import select
+from services import exists_service, post_service
+from utils.etag_helper import row_etag
+from utils import response_cache
+from utils.response_cache import CachedResponse, post_key
+from utils.query_params import parse_ids, parse_include
+from utils.pagination import Page, paginated
 
 
 """
@@ -25,85 +30,83 @@ posts_bp = Blueprint('posts_blueprint', __name__)
 @authorized()
 def get_post(pid_param, uid):
     """Get a single post"""
-    Session = get_session()
-    session = Session()
+    cache = response_cache.get_response_cache()
+    key = post_key(pid_param)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached.to_response(private=True)
 
-    comment_count_sub_stmt = (
-        select(func.count(Comment.id))
-        .where(Comment.pid == Post.id)
-        .scalar_subquery()
-    )
+    # Read before the row, so the response is not stored if the row is
+    # changed while it is built
+    generation = cache.generation(key) if cache is not None else None
 
-    like_count_sub_stmt = (
-        select(func.count(Like.id))
-        .where(Like.pid == Post.id)
-        .scalar_subquery()
-    )
-    stmt = (
-        select(Post, like_count_sub_stmt, comment_count_sub_stmt)
+    session = get_request_session()
+
+    stmt = post_service.without_deleted_authors(
+        select(Post)
         .where(Post.id == pid_param)
-        .group_by(Post.id)
     )
 
-    post = session.execute(stmt).first()
-
-    session.close()
+    post = session.scalars(stmt).first()
 
     if post is None:
         return Response("Post not found", 404)
 
-    response = {
-        "id": post[0].id,
-        "uid": post[0].uid,
-        "title": post[0].title,
-        "content": post[0].content,
-        "created_at": post[0].created_at,
-        "image": post[0].image,
-        "like_count": post[1],
-        "comment_count": post[2]
-    }
+    response = post_service.serialize_post(post)
 
-    return jsonify(response)
+    cached = CachedResponse.from_json(
+        response, row_etag("post", post.id, post.updated_at), post.updated_at)
+    if cache is not None:
+        cache.set(key, cached, generation)
+
+    return cached.to_response(private=True)
 
 
 @posts_bp.route("/", methods=["GET"])
 @authorized()
 def get_posts(uid):
-    """Gets posts """
+    """Gets posts.
+    When searching, the posts are ordered by rank. The rank and id of the
+    last post is then used to get the next page."""
 
     try:
-        page_size: int = int(request.args.get('page_size', 10))
-        last_id: int = int(request.args.get('last_id', 0))
         query: str = request.args.get('query', '')
         liked_by: int = int(request.args.get('liked_by', 0))
+        include = parse_include(request.args.get('include'), {"author"})
     except ValueError:
         return Response("Bad request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
+    authors = {} if "author" in include else None
 
-    comment_count_sub_stmt = (
-        select(func.count(Comment.id))
-        .where(Comment.pid == Post.id)
-        .scalar_subquery()
-    )
+    use_search = bool(query) and search.search_enabled(session.connection())
 
-    like_count_sub_stmt = (
-        select(func.count(Like.id))
-        .where(Like.pid == Post.id)
-        .scalar_subquery()
-    )
+    try:
+        if use_search:
+            page = Page.from_request({"rank": float, "id": int},
+                                     descending=False, fixed_order=True)
+        else:
+            page = Page.from_request(descending=False)
+    except ValueError:
+        return Response("Bad request", 400)
 
-    stmt = (
-        select(Post, like_count_sub_stmt, comment_count_sub_stmt)
-        .where(Post.title.ilike(f"%{query}%") | Post.content.ilike(f"%{query}%"))
-        .group_by(Post.id)
-        .limit(page_size)
-    )
+    if use_search:
+        match = search.match_query(query)
+        if match is None:
+            return paginated(post_service.listing([], authors), None)
+
+        last_rank, last_id = page.after or (None, 0)
+        stmt = (
+            search.search_posts_stmt(match, last_rank, last_id)
+            .limit(page.size)
+        )
+    else:
+        stmt = page.apply(select(Post), Post.id)
 
-    if last_id:
-        compersion_operator = Post.id > last_id
-        stmt = stmt.where(compersion_operator)
+        # Fallback for SQLite builds without FTS5
+        if query:
+            stmt = stmt.where(Post.title.ilike(f"%{query}%")
+                              | Post.content.ilike(f"%{query}%"))
 
     if liked_by:
         stmt = (
@@ -116,19 +119,51 @@ def get_posts(uid):
             )
         )
 
-    posts = session.execute(stmt).all()
-    session.close()
+    stmt = post_service.without_deleted_authors(stmt)
+    if authors is not None:
+        stmt = post_service.with_authors(stmt)
 
-    response = [{
-        "id": post[0].id,
-        "uid": post[0].uid,
-        "title": post[0].title,
-        "content": post[0].content,
-        "created_at": post[0].created_at,
-        "image": post[0].image,
-        "like_count": post[1],
-        "comment_count": post[2]
-    } for post in posts]
+    rows = session.execute(stmt).all()
+    if authors is not None:
+        rows, authors = post_service.split_authors(rows)
+
+    response = []
+    for post, *rank in rows:
+        serialized = post_service.serialize_post(post)
+        if use_search:
+            serialized["rank"] = rank[0]
+        response.append(serialized)
+
+    if use_search:
+        next_cursor = page.next_cursor(rows, lambda row: (row[1], row[0].id))
+    else:
+        next_cursor = page.next_cursor(rows, lambda row: (row[0].id,))
+
+    return paginated(post_service.listing(response, authors), next_cursor)
+
+
+@posts_bp.route("/batch", methods=["GET"])
+@authorized()
+def get_posts_by_ids(uid):
+    """Gets many posts, given as ?ids=1,2,3, in the order asked.
+    The ids of posts that do not exist are listed in missing."""
+
+    try:
+        pids = parse_ids(request.args.get("ids"))
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    session = get_request_session()
+
+    posts = {post.id: post for post in session.scalars(
+        post_service.without_deleted_authors(
+            select(Post).where(Post.id.in_(pids))))}
+
+    response = {
+        "posts": [post_service.serialize_post(posts[pid]) for pid in pids
+                  if pid in posts],
+        "missing": [pid for pid in pids if pid not in posts],
+    }
 
     return jsonify(response)
 
@@ -138,39 +173,26 @@ def get_posts(uid):
 def get_likes_for_post(pid_param, uid):
     """Get all likes for a post"""
     try:
-        page_size: int = int(request.args.get('page_size', 10))
-        last_id: int = int(request.args.get('last_id', 0))
-        descending: bool = bool(request.args.get(
-            'descending', 'True').lower() == 'true')
+        page = Page.from_request()
     except ValueError:
         return Response("Bad request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
         exists_service.exists_by_id(session, pid=pid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    stmt = (
-        select(Like)
-        .where(Like.pid == pid_param)
-        .limit(page_size)
-        .order_by(Like.id.desc() if descending else None)
-    )
-
-    if last_id:
-        compersion_operator = Like.id < last_id if descending else Like.id > last_id
-        stmt = stmt.where(compersion_operator)
+    stmt = page.apply(select(Like).where(Like.pid == pid_param), Like.id)
 
     likes = session.scalars(stmt).all()
-    session.close()
 
     if not likes:
         return Response("Post have no likes", 204)
 
-    return jsonify([like.serialize() for like in likes])
+    return paginated([like.serialize() for like in likes],
+                     page.next_cursor(likes, lambda like: (like.id,)))
 
 
 @posts_bp.route("/<int:pid_param>/comments", methods=["GET"])
@@ -179,33 +201,21 @@ def get_comments_for_post(pid_param, uid):
     """Get comments for post"""
 
     try:
-        page_size: int = int(request.args.get('page_size', 10))
-        last_id: int = int(request.args.get('last_id', 0))
-        descending: bool = bool(request.args.get(
-            'descending', 'True').lower() == 'true')
+        page = Page.from_request()
     except ValueError:
         return Response("Bad request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
         exists_service.exists_by_id(session, pid=pid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    stmt = (
-        select(Comment)
-        .where(Comment.pid == pid_param)
-        .limit(page_size)
-        .order_by(Comment.id.desc() if descending else None)
-    )
-
-    if last_id:
-        compersion_operator = Comment.id < last_id if descending else Comment.id > last_id
-        stmt = stmt.where(compersion_operator)
+    stmt = page.apply(select(Comment).where(Comment.pid == pid_param),
+                      Comment.id)
 
     comments = session.scalars(stmt).all()
-    session.close()
 
-    return jsonify([comment.serialize() for comment in comments])
+    return paginated([comment.serialize() for comment in comments],
+                     page.next_cursor(comments, lambda comment: (comment.id,)))
@@ -1,37 +1,68 @@
 from middleware import authorized, image_validated
-from services import user_service, exists_service, post_service
+from middleware.auth import invalidate_user
+from services import (user_service, exists_service, post_service,
+                      account_purger)
+from services.username_index import username_index
+from utils.etag_helper import row_etag
+from utils import response_cache
+from utils.response_cache import CachedResponse, user_key
+from utils.query_params import parse_ids, parse_include
+from utils.pagination import Page, paginated
 from flask import Blueprint, request, Response, jsonify
-from db import get_session, User, Post, Like, Comment, Follow
-from sqlalchemy import select, func
+from datetime import datetime
+from db import get_request_session, User, Post, Like, Comment, Follow
+from db import timeline
+from sqlalchemy import select, exists, String, type_coerce
 
 users_bp = Blueprint("users_blueprint", __name__)
 
 
+def profile_response(user: User) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "profile_picture": user.profile_picture,
+        "banner_picture": user.banner_picture,
+        "about_me": user.about_me,
+        "follower_count": user.follower_count,
+        "following_count": user.following_count,
+    }
+
+
 @users_bp.route("/<int:uid_param>", methods=["GET"])
 def get_user(uid_param):
     """Get a user's profile"""
 
-    Session = get_session()
-    session = Session()
+    cache = response_cache.get_response_cache()
+    key = user_key(uid_param)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached.to_response()
+
+    # Read before the row, so the response is not stored if the row is
+    # changed while it is built
+    generation = cache.generation(key) if cache is not None else None
+
+    session = get_request_session()
 
     stmt = (
-        select(User).where(User.id == uid_param)
+        select(User)
+        .where(User.id == uid_param)
+        .where(User.deleted_at.is_(None))
     )
     user = session.scalars(stmt).first()
-    session.close()
 
     if user is None:
         return Response("User not found", 404)
 
-    response = {
-        "id": user.id,
-        "username": user.username,
-        "profile_picture": user.profile_picture,
-        "banner_picture": user.banner_picture,
-        "about_me": user.about_me,
-    }
+    response = profile_response(user)
 
-    return jsonify(response)
+    cached = CachedResponse.from_json(
+        response, row_etag("user", user.id, user.updated_at), user.updated_at)
+    if cache is not None:
+        cache.set(key, cached, generation)
+
+    return cached.to_response()
 
 
 @users_bp.route("/", methods=["GET"])
@@ -39,26 +70,20 @@ def get_user(uid_param):
 def get_users(uid):
 
     try:
-        page_size = int(request.args.get("page_size", 10))
-        last_id = int(request.args.get("last_id", 0))
+        page = Page.from_request()
         query = request.args.get("query", "")
     except ValueError:
         return Response("Bad request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
-    stmt = (
-        select(User)
-        .where(User.username.ilike(f"%{query}%"))
-        .limit(page_size)
-    )
+    # Ordered by the deleted_at index, which ends with the id
+    stmt = page.apply(select(User).where(User.deleted_at.is_(None)), User.id)
 
-    if last_id:
-        stmt = stmt.where(User.id < last_id)
+    if query:
+        stmt = stmt.where(User.username.ilike(f"%{query}%"))
 
     users = session.scalars(stmt).all()
-    session.close()
 
     response = [{
         "id": user.id,
@@ -66,6 +91,57 @@ def get_users(uid):
         "profile_picture": user.profile_picture,
     } for user in users]
 
+    return paginated(response,
+                     page.next_cursor(users, lambda user: (user.id,)))
+
+
+@users_bp.route("/batch", methods=["GET"])
+def get_users_by_ids():
+    """Get the profiles of many users, given as ?ids=1,2,3, in the order
+    asked. The ids of users that do not exist are listed in missing."""
+
+    try:
+        uids = parse_ids(request.args.get("ids"))
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    session = get_request_session()
+
+    users = {user.id: user for user in session.scalars(
+        select(User)
+        .where(User.id.in_(uids))
+        .where(User.deleted_at.is_(None)))}
+
+    response = {
+        "users": [profile_response(users[id_]) for id_ in uids
+                  if id_ in users],
+        "missing": [id_ for id_ in uids if id_ not in users],
+    }
+
+    return jsonify(response)
+
+
+@users_bp.route("/autocomplete", methods=["GET"])
+@authorized()
+def autocomplete_users(uid):
+    """Get users whose username starts with the query.
+    Served from the in-memory username index, so it does not hit the
+    database besides the authorization."""
+
+    try:
+        query = request.args.get("query", "")
+        limit = min(int(request.args.get("limit", 10)), 50)
+    except ValueError:
+        return Response("Bad request", 400)
+
+    if not query or limit < 1:
+        return jsonify([])
+
+    response = [{
+        "id": user_id,
+        "username": username,
+    } for user_id, username in username_index.search(query, limit)]
+
     return jsonify(response)
 
 
@@ -77,8 +153,7 @@ def update_user(uid_param, uid):
     if uid_param != uid:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     stmt = (
         select(User).where(User.id == uid_param)
@@ -87,7 +162,6 @@ def update_user(uid_param, uid):
     user = session.scalars(stmt).first()
 
     if user is None:
-        session.close()
         return Response("User not found", 404)
 
     has_modifications = False
@@ -101,18 +175,17 @@ def update_user(uid_param, uid):
     email = request_data.get("email")
 
     response = {}
+    old_username = user.username
 
     if username:
         stmt = (
             select(User.username).where(User.username == username)
         )
         if session.execute(stmt).first():
-            session.close()
             return Response("Username already exists", 409)
         try:
             user.username = username
         except ValueError as e:
-            session.close()
             return Response(str(e), 400)
         response["username"] = username
         has_modifications = True
@@ -121,19 +194,16 @@ def update_user(uid_param, uid):
         try:
             user.about_me = about_me
         except ValueError as e:
-            session.close()
             return Response(str(e), 400)
         response["about_me"] = about_me
         has_modifications = True
 
     if new_password and old_password:
         if not user.check_password(old_password):
-            session.close()
             return Response("Incorrect password", 401)
         try:
             user.set_password(new_password)
         except ValueError as e:
-            session.close()
             return Response(str(e), 400)
         has_modifications = True
 
@@ -141,13 +211,14 @@ def update_user(uid_param, uid):
         try:
             user.email = email
         except ValueError as e:
-            session.close()
             return Response(str(e), 400)
         response["email"] = email
         has_modifications = True
 
     session.commit()
-    session.close()
+
+    if "username" in response:
+        username_index.rename(uid, old_username, username)
 
     if not has_modifications:
         return Response("No modifications", 200)
@@ -164,8 +235,7 @@ def update_profile_picture(uid_param, uid):
     if uid_param != uid:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     stmt = (
         select(User).where(User.id == uid_param)
@@ -174,14 +244,11 @@ def update_profile_picture(uid_param, uid):
     user = session.scalars(stmt).first()
 
     if user is None:
-        session.close()
         return Response("User not found", 404)
 
     filename = user_service.update_profile_picture(
         user, request.files["image"], session)
 
-    session.close()
-
     return jsonify({"profile_picture": filename})
 
 
@@ -194,8 +261,7 @@ def update_banner(uid_param, uid):
     if uid_param != uid:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     stmt = (
         select(User).where(User.id == uid_param)
@@ -204,16 +270,14 @@ def update_banner(uid_param, uid):
     user = session.scalars(stmt).first()
 
     if user is None:
-        session.close()
         return Response("User not found", 404)
 
     old_banner = user.banner_picture
     filename = user_service.update_image_banner(
-        request.files["image"], old_banner)
+        request.files["image"], old_banner, session)
 
     user.banner_picture = filename
     session.commit()
-    session.close()
 
     return jsonify({"banner_picture": filename})
 
@@ -224,8 +288,7 @@ def delete_user(uid_param, uid):
     if uid_param != uid:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     stmt = (
         select(User).where(User.id == uid_param)
@@ -234,14 +297,25 @@ def delete_user(uid_param, uid):
     user = session.scalars(stmt).first()
 
     if user is None:
-        session.close()
         return Response("User not found", 404)
 
-    session.delete(user)
-    session.commit()
-    session.close()
+    username = user.username
 
-    return Response(status=204)
+    # Large accounts are only marked as deleted, and purged in batches
+    # in the background, see account_purger
+    if (request.args.get("mode") == "async"
+            or account_purger.is_large(session, uid)):
+        account_purger.mark_deleted(session, user)
+        status = 202
+    else:
+        session.delete(user)
+        session.commit()
+        status = 204
+
+    username_index.remove(uid, username)
+    invalidate_user(uid)
+
+    return Response(status=status)
 
 # User posts
 
@@ -252,64 +326,39 @@ def get_posts_for_user(uid_param, uid):
     """Get posts made by user"""
 
     try:
-        page_size: int = int(request.args.get('page_size', 10))
-        last_id: int = int(request.args.get('last_id', 0))
-        descending: bool = bool(
-            (request.args.get('descending', 'True').lower() == 'true'))
+        page = Page.from_request()
         has_image: bool = bool(request.args.get('has_image', False))
+        include = parse_include(request.args.get('include'), {"author"})
     except ValueError:
         return Response("Bad request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
+    authors = {} if "author" in include else None
 
     try:
         exists_service.exists_by_id(session, uid=uid)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    comment_count_sub_stmt = (
-        select(func.count(Comment.id))
-        .where(Comment.pid == Post.id)
-        .scalar_subquery()
-    )
-
-    like_count_sub_stmt = (
-        select(func.count(Like.id))
-        .where(Like.pid == Post.id)
-        .scalar_subquery()
-    )
-
-    stmt = (
-        select(Post, like_count_sub_stmt, comment_count_sub_stmt)
-        .where(Post.uid == uid_param)
-        .group_by(Post.id)
-        .limit(page_size)
-        .order_by(Post.id.desc() if descending else None)
-    )
-
-    if last_id:
-        comperison_operator = Post.id < last_id if descending else Post.id > last_id
-        stmt = stmt.where(comperison_operator)
+    stmt = page.apply(
+        post_service.without_deleted_authors(
+            select(Post).where(Post.uid == uid_param)),
+        Post.id)
 
     if has_image:
         stmt = stmt.where(Post.image != None)
 
-    posts = session.execute(stmt).all()
-    session.close()
+    if authors is not None:
+        stmt = post_service.with_authors(stmt)
 
-    response = [{
-        "id": post[0].id,
-        "uid": post[0].uid,
-        "title": post[0].title,
-        "content": post[0].content,
-        "created_at": post[0].created_at,
-        "image": post[0].image,
-        "like_count": post[1],
-        "comment_count": post[2]
-    } for post in posts]
+    rows = session.execute(stmt).all()
+    if authors is not None:
+        rows, authors = post_service.split_authors(rows)
 
-    return jsonify(response)
+    response = [post_service.serialize_post(post) for post, in rows]
+
+    return paginated(post_service.listing(response, authors),
+                     page.next_cursor(rows, lambda row: (row[0].id,)))
 
 
 @users_bp.route("/<int:uid_param>/posts", methods=["POST"])
@@ -329,24 +378,21 @@ def create_post(uid_param, uid):
     if not content:
         return Response("Post needs content", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
         new_post = Post(uid=uid, title=title, content=content)
         if request.files:
             filename = post_service.save_post_image(
-                request.files["image"])
+                request.files["image"], session)
             new_post.image = filename
 
     except ValueError as e:
-        session.close()
         return Response(str(e), 400)
 
     session.add(new_post)
     session.commit()
     session.refresh(new_post)
-    session.close()
 
     response = {
         "id": new_post.id,
@@ -361,18 +407,15 @@ def delete_post(uid_param, pid_param, uid):
     if uid != uid_param:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     post = session.scalars(select(Post).where(Post.id == pid_param)).first()
 
     if not post:
-        session.close()
         return Response("Post not found", 404)
 
     session.delete(post)
     session.commit()
-    session.close()
     return Response('Post deleted succsessfully!', 204)
 
 
@@ -383,68 +426,36 @@ def get_feed(uid_param, uid):
     if uid != uid_param:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
-        last_id = int(request.args.get('last_id', 0))
-        page_size = int(request.args.get('page_size', 10))
-    except TypeError:
+        # The feed is merged newest first, see timeline.feed_stmt
+        page = Page.from_request(fixed_order=True)
+        include = parse_include(request.args.get('include'), {"author"})
+    except (TypeError, ValueError):
         return Response("Invalid query parameters", 400)
 
-    user = session.scalars(select(User).where(User.id == uid)).first()
+    authors = {} if "author" in include else None
 
-    if not user:
-        session.close()
-        return Response("User not found", 404)
-
-    followers = session.scalars(
-        select(Follow).where(Follow.follower_id == uid)).all()
-
-    if not followers:
-        session.close()
-        return Response("User has no followers", 404)
-
-    follower_ids = [follower.followed_id for follower in followers]
-
-    like_count_sub_stmt = (
-        select(func.count(Like.id))
-        .where(Like.pid == Post.id)
-        .label("like_count")
-    )
-
-    comment_count_sub_stmt = (
-        select(func.count(Comment.id))
-        .where(Comment.pid == Post.id)
-        .label("comment_count")
-    )
-
-    stmt = (
-        select(Post, like_count_sub_stmt, comment_count_sub_stmt)
-        .where(Post.uid.in_(follower_ids))
-        .order_by(Post.id.desc())
-        .limit(page_size)
-    )
+    # The user exists, as the authorization checks it
+    stmt = timeline.feed_stmt(uid, page.size, page.last_id)
+    if authors is not None:
+        stmt = post_service.with_authors(stmt)
 
-    if last_id:
-        stmt = stmt.where(Post.id < last_id)
+    rows = session.execute(stmt).all()
+    if authors is not None:
+        rows, authors = post_service.split_authors(rows)
 
-    posts = session.execute(stmt).all()
+    if not rows and page.after is None:
+        follows_anyone = session.scalar(
+            select(exists().where(Follow.follower_id == uid)))
+        if not follows_anyone:
+            return Response("User has no followers", 404)
 
-    session.close()
+    response = [post_service.serialize_post(post) for post, in rows]
 
-    response = [{
-        "id": post[0].id,
-        "uid": post[0].uid,
-        "title": post[0].title,
-        "content": post[0].content,
-        "created_at": post[0].created_at,
-        "image": post[0].image,
-        "like_count": post[1],
-        "comment_count": post[2]
-    } for post in posts]
-
-    return jsonify(response)
+    return paginated(post_service.listing(response, authors),
+                     page.next_cursor(rows, lambda row: (row[0].id,)))
 
 
 # User likes
@@ -457,18 +468,15 @@ def get_post_like(uid_param, pid_param, uid):
     if uid != uid_param:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
-        exists_service.exists_by_id(session, pid=pid_param)
+        like = exists_service.load_if_exists(
+            session, Like, Like.uid == uid, Like.pid == pid_param,
+            pid=pid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    like = session.scalars(select(Like).where(
-        Like.uid == uid).where(Like.pid == pid_param)).first()
-    session.close()
-
     if not like:
         response = {
             "is_liked": False,
@@ -488,6 +496,38 @@ def get_post_like(uid_param, pid_param, uid):
     return jsonify(response)
 
 
+@users_bp.route("/<int:uid_param>/likes/status", methods=["GET"])
+@authorized()
+def get_post_likes(uid_param, uid):
+    """Get the like status of many posts, given as ?ids=1,2,3.
+    Posts that do not exist are not liked."""
+    if uid != uid_param:
+        return Response(status=401)
+
+    try:
+        pids = parse_ids(request.args.get("ids"))
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    session = get_request_session()
+
+    stmt = (
+        select(Like.pid, Like.id)
+        .where(Like.uid == uid)
+        .where(Like.pid.in_(pids))
+    )
+    likes = dict(session.execute(stmt).all())
+
+    response = [{
+        "is_liked": pid in likes,
+        "id": likes.get(pid),
+        "uid": uid,
+        "pid": pid,
+    } for pid in pids]
+
+    return jsonify(response)
+
+
 @users_bp.route(
     "/<int:uid_param>/posts/<int:pid_param>/likes", methods=["POST"])
 @authorized()
@@ -496,29 +536,24 @@ def like_post(uid_param, pid_param, uid):
     if uid != uid_param:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
-        exists_service.exists_by_id(session, pid=pid_param)
+        like = exists_service.load_if_exists(
+            session, Like, Like.uid == uid, Like.pid == pid_param,
+            pid=pid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    like = session.scalars(select(Like).where(
-        Like.uid == uid).where(Like.pid == pid_param)).first()
     if like:
-        session.close()
         return Response("Post already liked", 409)
 
-    new_like = Like(uid=uid, pid=pid_param)
-    session.add(new_like)
+    session.add(Like(uid=uid, pid=pid_param))
     session.commit()
-    session.refresh(new_like)
-    session.close()
 
     response = {
-        "uid": new_like.uid,
-        "pid": new_like.pid,
+        "uid": uid,
+        "pid": pid_param,
     }
 
     return jsonify(response)
@@ -532,23 +567,20 @@ def unlike_post(uid_param, pid_param, uid):
     if uid != uid_param:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
-        exists_service.exists_by_id(session, pid=pid_param)
+        like = exists_service.load_if_exists(
+            session, Like, Like.uid == uid, Like.pid == pid_param,
+            pid=pid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    like = session.scalars(select(Like).where(
-        Like.uid == uid).where(Like.pid == pid_param)).first()
     if not like:
-        session.close()
         return Response("Post not liked", 404)
 
     session.delete(like)
     session.commit()
-    session.close()
     return Response('Post unliked succsessfully!', 204)
 
 # User comments
@@ -563,46 +595,32 @@ def get_comments_for_user(uid_param, pid_param, uid):
         return Response(status=401)
 
     try:
-        page_size: int = int(request.args.get('page_size', 10))
-        last_id: int = int(request.args.get('last_id', 0))
-        descending: bool = bool(
-            (request.args.get('descending', 'True').lower() == 'true'))
+        page = Page.from_request()
     except ValueError:
         return Response("Bad request", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
         exists_service.exists_by_id(session, pid=pid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    if not last_id:
-        stmt = (
-            select(Comment)
-            .where(Comment.uid == uid)
-            .where(Comment.pid == pid_param)
-            .order_by(Comment.id.desc() if descending else None)
-        )
-    else:
-        stmt = (
-            select(Comment)
-            .where(Comment.uid == uid)
-            .where(Comment.pid == pid_param)
-            .where(Comment.id < last_id if descending else Comment.id > last_id)  # noqa
-            .order_by(Comment.id.desc() if descending else None)
-        )
+    stmt = page.apply(
+        select(Comment)
+        .where(Comment.uid == uid)
+        .where(Comment.pid == pid_param),
+        Comment.id)
 
-    comments = session.scalars(stmt.limit(page_size)).all()
-    session.close()
+    comments = session.scalars(stmt).all()
 
     if not comments:
         return Response("No comments found", 404)
 
     response = [comment.serialize() for comment in comments]
 
-    return jsonify(response)
+    return paginated(response,
+                     page.next_cursor(comments, lambda comment: (comment.id,)))
 
 
 @users_bp.route(
@@ -622,24 +640,20 @@ def create_comment(uid_param, pid_param, uid):
     if not content:
         return Response("Comment needs content", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
-    post = session.scalars(select(Post).where(Post.id == pid_param)).first()
-
-    if not post:
-        session.close()
-        return Response("Post not found", 404)
+    try:
+        exists_service.exists_by_id(session, pid=pid_param)
+    except exists_service.ExistsError as e:
+        return Response(str(e), 404)
 
     try:
         new_comment = Comment(uid=uid, pid=pid_param, content=content)
     except ValueError as e:
-        session.close()
         return Response(str(e), 400)
     session.add(new_comment)
-    session.commit()
-    session.refresh(new_comment)
-    session.close()
+    # Flushed first, so the response does not load the comment again
+    session.flush()
 
     response = {
         "id": new_comment.id,
@@ -647,6 +661,7 @@ def create_comment(uid_param, pid_param, uid):
         "pid": new_comment.pid,
         "content": new_comment.content,
     }
+    session.commit()
     return jsonify(response)
 
 # Follow
@@ -662,39 +677,29 @@ def follow_user(uid_param, followed_id, uid):
     if uid == followed_id:
         return Response("User cannot follow themselves", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
-        exists_service.exists_by_id(session, uid=followed_id)
+        follow = exists_service.load_if_exists(
+            session, Follow, Follow.follower_id == uid,
+            Follow.followed_id == followed_id, uid=followed_id)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    stmt = (
-        select(Follow)
-        .where(Follow.follower_id == uid)
-        .where(Follow.followed_id == followed_id)
-    )
-    follow = session.scalars(stmt).first()
-
     if follow:
-        session.close()
         return Response("User already followed", 400)
 
     try:
         new_follow = Follow(follower_id=uid, followed_id=followed_id)
     except ValueError as e:
-        session.close()
         return Response(str(e), 400)
 
     session.add(new_follow)
     session.commit()
-    session.refresh(new_follow)
-    session.close()
 
     response = {
-        "follower_id": new_follow.follower_id,
-        "followed_id": new_follow.followed_id,
+        "follower_id": uid,
+        "followed_id": followed_id,
     }
 
     return jsonify(response)
@@ -706,30 +711,26 @@ def get_following(uid_param, uid):
     """Get users followed by user"""
 
     try:
-        page_size: int = int(request.args.get('page_size', 10))
-        last_id: int = int(request.args.get('last_id', 0))
+        page = Page.from_request()
     except ValueError:
         return Response("Invalid query params", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
         exists_service.exists_by_id(session, uid=uid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    stmt = (
+    # Ordered by the follows index, the followed id is the user id
+    stmt = page.apply(
         select(User)
         .join(Follow, Follow.followed_id == User.id)
         .where(Follow.follower_id == uid_param)
-    )
-
-    if last_id:
-        stmt = stmt.where(User.id < last_id)
+        .where(User.deleted_at.is_(None)),
+        Follow.followed_id)
 
-    users = session.scalars(stmt.limit(page_size)).all()
-    session.close()
+    users = session.scalars(stmt).all()
 
     response = [{
         "id": user.id,
@@ -737,30 +738,64 @@ def get_following(uid_param, uid):
         "profile_picture": user.profile_picture
     } for user in users]
 
-    return jsonify(response)
+    return paginated(response,
+                     page.next_cursor(users, lambda user: (user.id,)))
 
 
-@users_bp.route("/<int:uid_param>/follows/<int:followed_id>", methods=["GET"])
+@users_bp.route("/<int:uid_param>/followers", methods=["GET"])
 @authorized()
-def get_follow(uid_param, followed_id, uid):
-    """Get follow relationship between two users"""
+def get_followers(uid_param, uid):
+    """Get users following user, the most recent first.
+    The followed date and id of the last follow are used for the next page.
+    """
+
+    try:
+        page = Page.from_request({"followed_date": str, "id": int})
+    except ValueError:
+        return Response("Invalid query params", 400)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
         exists_service.exists_by_id(session, uid=uid_param)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    stmt = (
-        select(Follow)
-        .where(Follow.follower_id == uid_param)
-        .where(Follow.followed_id == followed_id)
-    )
+    # Compared as stored, as the cursor must match the dates exactly.
+    # Ordered by the followers index, which ends with the follow id
+    followed_date = type_coerce(Follow.followed_date, String)
+    stmt = page.apply(
+        select(User, followed_date, Follow.id)
+        .join(Follow, Follow.follower_id == User.id)
+        .where(Follow.followed_id == uid_param)
+        .where(User.deleted_at.is_(None)),
+        followed_date, Follow.id)
+
+    rows = session.execute(stmt).all()
+
+    response = [{
+        "id": user.id,
+        "username": user.username,
+        "profile_picture": user.profile_picture,
+        "followed_date": datetime.fromisoformat(date),
+    } for user, date, _ in rows]
+
+    return paginated(response, page.next_cursor(rows, lambda row: row[1:]))
+
 
-    follow = session.scalars(stmt).first()
-    session.close()
+@users_bp.route("/<int:uid_param>/follows/<int:followed_id>", methods=["GET"])
+@authorized()
+def get_follow(uid_param, followed_id, uid):
+    """Get follow relationship between two users"""
+
+    session = get_request_session()
+
+    try:
+        follow = exists_service.load_if_exists(
+            session, Follow, Follow.follower_id == uid_param,
+            Follow.followed_id == followed_id, uid=uid_param)
+    except exists_service.ExistsError as e:
+        return Response(str(e), 404)
 
     if not follow:
         response = {
@@ -776,6 +811,40 @@ def get_follow(uid_param, followed_id, uid):
     return jsonify(response)
 
 
+@users_bp.route("/<int:uid_param>/follows/status", methods=["GET"])
+@authorized()
+def get_follows(uid_param, uid):
+    """Get the follow relationship between a user and many users,
+    given as ?ids=1,2,3"""
+
+    try:
+        followed_ids = parse_ids(request.args.get("ids"))
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    session = get_request_session()
+
+    try:
+        exists_service.exists_by_id(session, uid=uid_param)
+    except exists_service.ExistsError as e:
+        return Response(str(e), 404)
+
+    stmt = (
+        select(Follow.followed_id, Follow.followed_date)
+        .where(Follow.follower_id == uid_param)
+        .where(Follow.followed_id.in_(followed_ids))
+    )
+    follows = dict(session.execute(stmt).all())
+
+    response = [{
+        "id": followed_id,
+        "is_following": followed_id in follows,
+        "followed_date": follows.get(followed_id),
+    } for followed_id in followed_ids]
+
+    return jsonify(response)
+
+
 @users_bp.route("/<int:uid_param>/follows/<int:followed_id>", methods=["DELETE"])
 @authorized()
 def unfollow_user(uid_param, followed_id, uid):
@@ -783,27 +852,19 @@ def unfollow_user(uid_param, followed_id, uid):
     if uid != uid_param:
         return Response(status=401)
 
-    Session = get_session()
-    session = Session()
+    session = get_request_session()
 
     try:
-        exists_service.exists_by_id(session, uid=followed_id)
+        follow = exists_service.load_if_exists(
+            session, Follow, Follow.follower_id == uid,
+            Follow.followed_id == followed_id, uid=followed_id)
     except exists_service.ExistsError as e:
         return Response(str(e), 404)
 
-    stmt = (
-        select(Follow)
-        .where(Follow.follower_id == uid)
-        .where(Follow.followed_id == followed_id)
-    )
-    follow = session.scalars(stmt).first()
-
     if not follow:
-        session.close()
         return Response("User not followed", 400)
 
     session.delete(follow)
     session.commit()
-    session.close()
 
     return Response(status=204)
@@ -1,4 +1,5 @@
 from . import user_service
 from . import exists_service
+from . import image_service
 
-__all__ = ["user_service", "exists_service"]
+__all__ = ["user_service", "exists_service", "image_service"]
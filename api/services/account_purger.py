@@ -0,0 +1,140 @@
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import select, update, func, union_all
+from sqlalchemy.orm import Session
+from db import get_session, User, Post, Like, Comment, Follow, purge
+from db.cached_responses import queue_invalidation
+from utils.response_cache import user_key
+
+"""
+NB: Deleting a large account in one transaction holds the write lock of
+the database for as long as it takes, blocking every other writer. Users
+with more than ASYNC_THRESHOLD rows are therefore only marked as deleted
+by the route, and the purger then removes their rows in batches of
+BATCH_SIZE, each in its own transaction, before deleting the user itself.
+
+A marked user can no longer log in, and its username is free to register
+again. The user and its posts are left out of the profile, user and post
+routes, see post_service.without_deleted_authors. Its likes, comments and
+follows are still listed and counted until they are purged.
+
+The purger runs in a background thread, which the route wakes up. An
+interrupted purge is resumed on the next run, as the user stays marked
+until its row is deleted.
+"""
+
+# Accounts with more posts, likes, comments and follows than this are
+# deleted in the background
+ASYNC_THRESHOLD = int(os.environ.get("USER_PURGE_ASYNC_THRESHOLD", 5000))
+BATCH_SIZE = int(os.environ.get("USER_PURGE_BATCH_SIZE", 500))
+
+purger_thread: threading.Thread | None = None
+purger_stop = threading.Event()
+purger_wake = threading.Event()
+
+
+def account_size(session: Session, uid: int,
+                 limit: int = ASYNC_THRESHOLD) -> int:
+    """Counts the rows of a user, stopping at limit for each kind."""
+    parts = [
+        select(Post.id).where(Post.uid == uid).limit(limit),
+        select(Like.id).where(Like.uid == uid).limit(limit),
+        select(Comment.id).where(Comment.uid == uid).limit(limit),
+        select(Follow.id).where(Follow.follower_id == uid).limit(limit),
+        select(Follow.id).where(Follow.followed_id == uid).limit(limit),
+    ]
+    rows = union_all(*(select(part.subquery()) for part in parts)).subquery()
+    return session.scalar(select(func.count()).select_from(rows))
+
+
+def is_large(session: Session, uid: int) -> bool:
+    return account_size(session, uid) > ASYNC_THRESHOLD
+
+
+def mark_deleted(session: Session, user: User):
+    """Marks a user as deleted, to be purged in the background."""
+    # The username is freed with a name that can not be registered, as
+    # usernames have no spaces. Written with Core to skip that validation
+    session.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(username=f"deleted {user.id}", deleted_at=datetime.now())
+    )
+    queue_invalidation(session, user_key(user.id))
+    session.commit()
+    purger_wake.set()
+
+
+def purge_user(uid: int, batch_size: int = BATCH_SIZE) -> dict:
+    """Deletes a user and its rows, committing after every batch.
+    Returns the number of rows deleted of each kind."""
+    report = {"posts": 0, "activity": 0, "follows": 0, "timeline": 0,
+              "batches": 0}
+    steps = [
+        ("posts", lambda connection, session: purge.delete_posts(
+            connection, session, uid, batch_size)),
+        ("activity", lambda connection, session: purge.delete_activity(
+            connection, session, uid, batch_size)),
+        ("follows", lambda connection, session: purge.delete_follows(
+            connection, session, uid, batch_size)),
+        ("timeline", lambda connection, _: purge.delete_timeline(
+            connection, uid, batch_size)),
+    ]
+
+    Session = get_session()
+    with Session() as session:
+        for name, step in steps:
+            while deleted := step(session.connection(), session):
+                session.commit()
+                report[name] += deleted
+                report["batches"] += 1
+
+        # What is left is removed by the listeners in db.purge
+        user = session.get(User, uid)
+        if user is not None:
+            session.delete(user)
+            session.commit()
+
+    return report
+
+
+def purge_deleted_users(batch_size: int = BATCH_SIZE) -> int:
+    """Purges every user marked as deleted. Returns how many there were."""
+    Session = get_session()
+    with Session() as session:
+        uids = session.scalars(
+            select(User.id).where(User.deleted_at.is_not(None))).all()
+
+    for uid in uids:
+        purge_user(uid, batch_size)
+    return len(uids)
+
+
+def run_purger(interval: float):
+    while not purger_stop.is_set():
+        purge_deleted_users()
+        purger_wake.wait(interval)
+        purger_wake.clear()
+
+
+def start_account_purger(interval: float):
+    """Starts a background thread purging deleted users when woken up by
+    mark_deleted, or every interval seconds. Does nothing if it is
+    already running."""
+    global purger_thread
+    if purger_thread is not None and purger_thread.is_alive():
+        return
+
+    purger_stop.clear()
+    purger_thread = threading.Thread(
+        target=run_purger, args=(interval,), name="account-purger",
+        daemon=True)
+    purger_thread.start()
+
+
+def stop_account_purger():
+    purger_stop.set()
+    purger_wake.set()
+    if purger_thread is not None:
+        purger_thread.join()
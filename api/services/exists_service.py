@@ -1,7 +1,14 @@
-from sqlalchemy import select
+from sqlalchemy import select, exists, literal, and_
 from sqlalchemy.orm import Session
 from db import Post, Comment, Like, User
 
+"""
+NB: The checks are EXISTS subqueries in a single select, so any
+combination of ids is checked in one round trip without loading the rows.
+Routes that go on to load a row, such as the like of a user on a post,
+use load_if_exists to load it in the same statement as the checks.
+"""
+
 
 class ExistsError(Exception):
     """Raised when data is not found in database"""
@@ -28,42 +35,64 @@ class CommentExistsError(ExistsError):
     pass
 
 
-def exists_by_id(session: Session, uid=None, pid=None, lid=None, cid=None):
-    """Check if data exists in database
-    and raise error if not found, and close session"""
-
+def _checks(uid=None, pid=None, lid=None, cid=None) -> list:
+    """An EXISTS column for each given id, with the error to raise if it
+    is false, in the order the ids were checked in before."""
+    checks = []
     if uid:
-        stmt = (
-            select(User).where(User.id == uid)
-        )
-        exists = session.scalars(stmt).first()
-        if not exists:
-            session.close()
-            raise UserExistsError("User not found")
-
+        # Deleted users are hidden until they are purged
+        checks.append((exists().where(User.id == uid)
+                       .where(User.deleted_at.is_(None)),
+                       UserExistsError("User not found")))
     if pid:
-        stmt = (
-            select(Post).where(Post.id == pid)
-        )
-        exists = session.scalars(stmt).first()
-        if not exists:
-            session.close()
-            raise PostExistsError("Post not found")
-
+        checks.append((exists().where(Post.id == pid),
+                       PostExistsError("Post not found")))
     if lid:
-        stmt = (
-            select(Like).where(Like.id == lid)
-        )
-        exists = session.scalars(stmt).first()
-        if not exists:
-            session.close()
-            raise LikeExistsError("Like not found")
-
+        checks.append((exists().where(Like.id == lid),
+                       LikeExistsError("Like not found")))
     if cid:
-        stmt = (
-            select(Comment).where(Comment.id == cid)
-        )
-        exists = session.scalars(stmt).first()
-        if not exists:
-            session.close()
-            raise CommentExistsError("Comment not found")
+        checks.append((exists().where(Comment.id == cid),
+                       CommentExistsError("Comment not found")))
+    return checks
+
+
+def _raise_missing(checks: list, found):
+    for (_, error), is_found in zip(checks, found):
+        if not is_found:
+            raise error
+
+
+def exists_by_id(session: Session, uid=None, pid=None, lid=None, cid=None):
+    """Check if data exists in database
+    and raise error if not found"""
+
+    checks = _checks(uid, pid, lid, cid)
+    if not checks:
+        return
+
+    found = session.execute(
+        select(*(column for column, _ in checks))).one()
+    _raise_missing(checks, found)
+
+
+def load_if_exists(session: Session, entity, *where,
+                   uid=None, pid=None, lid=None, cid=None):
+    """Check if data exists in database like exists_by_id, and load the
+    first entity matching where in the same statement.
+    Returns the entity, or None if no entity matches."""
+
+    checks = _checks(uid, pid, lid, cid)
+
+    # Outer joined to a single row, so the checks are returned even when
+    # no entity matches
+    base = select(literal(1).label("one")).subquery("base")
+    stmt = (
+        select(entity, *(column for column, _ in checks))
+        .select_from(base)
+        .outerjoin(entity, and_(*where))
+        .limit(1)
+    )
+
+    loaded, *found = session.execute(stmt).one()
+    _raise_missing(checks, found)
+    return loaded
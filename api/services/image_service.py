@@ -0,0 +1,80 @@
+import hashlib
+import os
+import re
+import secrets
+from flask import Response, send_from_directory
+from sqlalchemy.orm import Session
+from werkzeug.datastructures import FileStorage
+from utils.image_helper import get_extension_from_mimetype
+from db import images
+
+# Bytes read at a time when hashing an upload
+CHUNK_SIZE = 64 * 1024
+
+# Images saved by save_image are named by their content, so never change
+CONTENT_ADDRESSED_NAME = re.compile(r"^([0-9a-f]{32})\.\w+$")
+
+
+def hash_image(image: FileStorage) -> tuple[str, int]:
+    """Returns the sha256 hex digest and the size of an uploaded image,
+    reading the stream in chunks."""
+    stream = image.stream
+    stream.seek(0)
+
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def save_image(image: FileStorage, kind: str, session: Session) -> str:
+    """Saves an image under the hash of its content, unless an identical
+    image is already stored, and counts the reference to it.
+    Returns the filename, which is committed with the session."""
+    digest, size = hash_image(image)
+    extension = get_extension_from_mimetype(image.mimetype)
+    filename = f"{digest[:32]}.{extension}"
+
+    path = images.image_path(kind, filename)
+    try:
+        # Marks the file as recently used, so the image sweeper leaves it
+        # alone while the new reference is being committed
+        os.utime(path)
+    except FileNotFoundError:
+        # Written under a temporary name first, so that a file with the
+        # final name is always complete
+        temporary_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        image.save(temporary_path)
+        os.replace(temporary_path, path)
+
+    images.acquire_image(session.connection(), kind, filename, size)
+    return filename
+
+
+def replace_image(image: FileStorage, kind: str, old_filename: str | None,
+                  session: Session) -> str:
+    """Saves a new image and releases the one it replaces."""
+    filename = save_image(image, kind, session)
+    images.release_image(session.connection(), session, kind, old_filename)
+    return filename
+
+
+def send_image(path: str) -> Response:
+    """Sends a file from static/images, given its path within static.
+    Files named by their content are cached for good, with the hash as a
+    strong ETag. Others, such as the placeholders and images uploaded
+    before content addressing, are validated by modification time and size.
+    Either way If-None-Match and If-Modified-Since get a 304."""
+    match = CONTENT_ADDRESSED_NAME.match(os.path.basename(path))
+    if match is None:
+        return send_from_directory("static", path)
+
+    response = send_from_directory("static", path, etag=match.group(1),
+                                   max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
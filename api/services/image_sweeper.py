@@ -0,0 +1,135 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from sqlalchemy import select, delete, union
+from db import get_session, User, Post, Image, images
+
+"""
+NB: The image sweeper removes files in static/images that no post or
+user references, such as images whose last reference was released,
+images of posts deleted before images were counted, and uploads whose
+transaction was rolled back.
+
+The directories are listed in batches, and each batch is checked against
+the filename columns with an indexed IN query, so neither the listing nor
+the referenced filenames are held in memory at once.
+
+Files modified within the grace period are skipped, as an upload writes
+its file before the post or user referencing it is committed. Saving an
+image identical to a stored one touches the stored file for the same
+reason.
+"""
+
+BATCH_SIZE = int(os.environ.get("IMAGE_SWEEP_BATCH_SIZE", 500))
+# Seconds a file must be left untouched before it can be removed
+GRACE_PERIOD = float(os.environ.get("IMAGE_SWEEP_GRACE_PERIOD", 3600))
+
+logger = logging.getLogger(__name__)
+
+sweeper_thread: threading.Thread | None = None
+sweeper_stop = threading.Event()
+
+
+def referenced_stmt(kind: str, filenames: list[str]):
+    """Statement for the filenames in the batch that are referenced."""
+    if kind == "posts":
+        return select(Post.image).where(Post.image.in_(filenames))
+
+    return union(
+        select(User.profile_picture)
+        .where(User.profile_picture.in_(filenames)),
+        select(User.banner_picture)
+        .where(User.banner_picture.in_(filenames)),
+    )
+
+
+def list_files(directory: str):
+    """Yields the files of a directory as they are read from disk."""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if (entry.is_file()
+                        and entry.name not in images.PLACEHOLDER_IMAGES):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+def sweep_images(dry_run: bool = False,
+                 grace_period: float = GRACE_PERIOD) -> dict:
+    """Removes unreferenced image files, and their row in the images table.
+    With dry_run nothing is removed, but the report is the same.
+    Returns a report of the files scanned and removed, and bytes reclaimed."""
+
+    report = {"dry_run": dry_run, "scanned": 0, "removed": 0,
+              "bytes_reclaimed": 0}
+    cutoff = time.time() - grace_period
+
+    Session = get_session()
+    with Session() as session:
+        for kind, directory in images.IMAGE_DIRECTORIES.items():
+            files = list_files(directory)
+
+            while batch := list(itertools.islice(files, BATCH_SIZE)):
+                report["scanned"] += len(batch)
+                filenames = [entry.name for entry in batch]
+                referenced = set(session.scalars(
+                    referenced_stmt(kind, filenames)))
+
+                for entry in batch:
+                    if entry.name in referenced:
+                        continue
+
+                    try:
+                        # Checked again, the file may have been reused
+                        stat = os.stat(entry.path)
+                        if stat.st_mtime > cutoff:
+                            continue
+                        if not dry_run:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+
+                    report["removed"] += 1
+                    report["bytes_reclaimed"] += stat.st_size
+
+                    if not dry_run:
+                        session.execute(
+                            delete(Image)
+                            .where(Image.kind == kind)
+                            .where(Image.filename == entry.name))
+
+                session.commit()
+
+    return report
+
+
+def run_sweeper(interval: float):
+    while not sweeper_stop.wait(interval):
+        report = sweep_images()
+        if report["removed"]:
+            logger.info("Image sweeper removed %d file(s), %d bytes "
+                        "reclaimed", report["removed"],
+                        report["bytes_reclaimed"])
+
+
+def start_image_sweeper(interval: float):
+    """Starts a background thread sweeping the images every interval
+    seconds. Does nothing if it is already running."""
+    global sweeper_thread
+    if sweeper_thread is not None and sweeper_thread.is_alive():
+        return
+
+    sweeper_stop.clear()
+    sweeper_thread = threading.Thread(
+        target=run_sweeper, args=(interval,), name="image-sweeper",
+        daemon=True)
+    sweeper_thread.start()
+
+
+def stop_image_sweeper():
+    sweeper_stop.set()
+    if sweeper_thread is not None:
+        sweeper_thread.join()
@@ -1,16 +1,71 @@
-import secrets
+from db.models import Post, User
+from sqlalchemy import Select, exists
+from sqlalchemy.orm import Session, aliased
 from werkzeug.datastructures import FileStorage
-from utils.image_helper import get_extension_from_mimetype
+from services import image_service
 
 
-def save_post_image(post_image: FileStorage) -> str:
+def save_post_image(post_image: FileStorage, session: Session) -> str:
     """Saves a post image to the static/images/posts directory """
-    mimetype = post_image.mimetype
-    extension = get_extension_from_mimetype(mimetype)
-    filename = f"{secrets.token_hex(8)}.{extension}"
+    return image_service.save_image(post_image, "posts", session)
 
-    # Reset the stream position to the beginning
-    post_image.stream.seek(0)
 
-    post_image.save(f"static/images/posts/{filename}")
-    return filename
+def serialize_post(post: Post) -> dict:
+    return {
+        "id": post.id,
+        "uid": post.uid,
+        "title": post.title,
+        "content": post.content,
+        "created_at": post.created_at,
+        "image": post.image,
+        "like_count": post.like_count,
+        "comment_count": post.comment_count
+    }
+
+
+def without_deleted_authors(stmt: Select) -> Select:
+    """Leaves the posts of users marked as deleted out of a statement
+    selecting posts, until they are purged. The author is looked up by
+    primary key for each post, so the posts are still read in the order of
+    the index the statement uses."""
+    # An alias, so it is not correlated to the users joined by with_authors
+    author = aliased(User, name="deleted_author")
+    return stmt.where(~exists()
+                      .where(author.id == Post.uid)
+                      .where(author.deleted_at.is_not(None)))
+
+
+def with_authors(stmt: Select) -> Select:
+    """Joins the username and profile picture of the author to a statement
+    selecting posts. They are added as the last two columns of each row."""
+    return (
+        stmt
+        .join(User, User.id == Post.uid)
+        .add_columns(User.username, User.profile_picture)
+    )
+
+
+def split_authors(rows) -> tuple[list[tuple], dict[int, dict]]:
+    """Splits the rows of a statement from with_authors into the rows
+    without the author columns, and the authors by id.
+    An author of many posts is only included once."""
+    authors = {}
+    remaining = []
+    for *columns, username, profile_picture in rows:
+        post: Post = columns[0]
+        if post.uid not in authors:
+            authors[post.uid] = {
+                "id": post.uid,
+                "username": username,
+                "profile_picture": profile_picture,
+            }
+        remaining.append(tuple(columns))
+    return remaining, authors
+
+
+def listing(posts: list[dict], authors: dict[int, dict] | None):
+    """The body of a post listing. A list of the posts, or with the
+    authors included an object with the posts and the authors by id."""
+    if authors is None:
+        return posts
+    return {"posts": posts, "authors": authors}
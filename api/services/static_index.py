@@ -0,0 +1,185 @@
+from flask import Response, request, send_file
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+# Vite adds a hex hash of the content to the names of the bundles,
+# for instance assets/index-5639c606.js. Other names with a dash, such as
+# site-manifest.json, can change without being renamed.
+HASHED_NAME = re.compile(r"-[0-9a-f]{8,}\.\w+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Cached, but checked with the server before every use
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Compressed versions written by utils.js_builder, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+MANIFEST_NAME = "asset-manifest.json"
+
+
+class StaticAsset:
+    """A file in the static folder, with its headers worked out."""
+
+    def __init__(self, path: str, etag: str, size: int):
+        self.path = path
+        self.etag = etag
+        self.size = size
+        self.mimetype = (mimetypes.guess_type(path)[0]
+                         or "application/octet-stream")
+        self.immutable = HASHED_NAME.search(path) is not None
+        self.cache_control = (IMMUTABLE_CACHE_CONTROL if self.immutable
+                              else REVALIDATE_CACHE_CONTROL)
+        # Content encoding -> path of the precompressed file
+        self.encodings: dict[str, str] = {}
+
+
+class StaticIndex:
+    """Index of the frontend build in the static folder.
+
+    The folder is walked once when the index is built, hashing every file
+    for its ETag unless the manifest from utils.js_builder has the hash,
+    and index.html is kept in memory for the SPA fallback. Requests are
+    then answered without looking at the filesystem, besides reading the
+    file that is sent. The build does not change while the server runs,
+    so the index is never updated.
+
+    Precompressed .br and .gz files are sent instead of the original when
+    the client accepts them.
+
+    The images folder holds uploads, which change at runtime, so it is
+    left out of the index."""
+
+    def __init__(self, root: str = "static", excluded=("images",)):
+        self.root = root
+        self.excluded = set(excluded)
+        self._assets: dict[str, StaticAsset] = {}
+        # Content encoding, None for the original -> body of index.html
+        self._index_html: dict[str | None, bytes] = {}
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def build(self):
+        manifest = self._read_manifest()
+        assets = {}
+        compressed = set()
+
+        for directory, subdirectories, filenames in os.walk(self.root):
+            if directory == self.root:
+                subdirectories[:] = [name for name in subdirectories
+                                     if name not in self.excluded]
+
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+
+                if filename.endswith(tuple(ENCODINGS.values())):
+                    compressed.add(key)
+                    continue
+                if key == MANIFEST_NAME:
+                    continue
+
+                size = os.path.getsize(path)
+                entry = manifest.get(key)
+                if entry is not None and entry.get("size") == size:
+                    digest = entry["sha256"]
+                else:
+                    digest = self._hash_file(path)
+
+                assets[key] = StaticAsset(os.path.abspath(path),
+                                          digest[:32], size)
+
+        for key, asset in assets.items():
+            for encoding, suffix in ENCODINGS.items():
+                if key + suffix in compressed:
+                    asset.encodings[encoding] = asset.path + suffix
+
+        index_html = {}
+        if "index.html" in assets:
+            asset = assets["index.html"]
+            for encoding, path in [(None, asset.path),
+                                   *asset.encodings.items()]:
+                with open(path, "rb") as f:
+                    index_html[encoding] = f.read()
+
+        self._assets = assets
+        self._index_html = index_html
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, path: str) -> StaticAsset | None:
+        return self._assets.get(path)
+
+    def is_excluded(self, path: str) -> bool:
+        return path.split("/", 1)[0] in self.excluded
+
+    @staticmethod
+    def _choose_encoding(asset: StaticAsset) -> str | None:
+        """The accepted encoding with the highest quality, preferring
+        brotli, or None to send the original."""
+        best, best_quality = None, 0.0
+        for encoding in asset.encodings:
+            quality = request.accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    @staticmethod
+    def _set_headers(response: Response, asset: StaticAsset,
+                     encoding: str | None):
+        response.headers["Cache-Control"] = asset.cache_control
+        if asset.encodings:
+            response.vary.add("Accept-Encoding")
+        if encoding is not None:
+            response.content_encoding = encoding
+
+    def serve(self, path: str) -> Response:
+        """Sends an indexed file, or index.html for any other path."""
+        asset = self._assets.get(path)
+        if asset is None or path == "index.html":
+            return self.serve_index()
+
+        encoding = self._choose_encoding(asset)
+        if encoding is None:
+            response = send_file(asset.path, mimetype=asset.mimetype,
+                                 etag=asset.etag, conditional=True)
+        else:
+            # Each encoding is a different representation, with its own ETag
+            response = send_file(asset.encodings[encoding],
+                                 mimetype=asset.mimetype,
+                                 etag=f"{asset.etag}-{encoding}",
+                                 conditional=True)
+
+        self._set_headers(response, asset, encoding)
+        return response
+
+    def serve_index(self) -> Response:
+        """Sends index.html from memory. It is revalidated on every use,
+        as it names the current bundles."""
+        if not self._index_html:
+            return Response("Frontend not built", 404)
+
+        asset = self._assets["index.html"]
+        encoding = self._choose_encoding(asset)
+
+        response = Response(self._index_html[encoding],
+                            mimetype=asset.mimetype)
+        response.set_etag(asset.etag if encoding is None
+                          else f"{asset.etag}-{encoding}")
+        self._set_headers(response, asset, encoding)
+        return response.make_conditional(request)
+
+
+static_index = StaticIndex()
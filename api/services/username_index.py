@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from sqlalchemy import select
+from db import get_session, User
+import threading
+
+
+class UsernameIndex:
+    """In-memory index of usernames for prefix search.
+
+    The usernames are kept in a sorted list, keyed on the casefolded
+    username. A prefix search is a binary search to the first match,
+    followed by reading the next entries while they still match.
+
+    The index is built from the database on first use, and must be updated
+    by the routes that register, rename or delete users. It only sees
+    changes made by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: list[str] | None = None
+        self._ids: list[int] = []
+
+    @staticmethod
+    def _key(username: str) -> str:
+        # The original username is appended, as usernames are only unique
+        # when case is taken into account
+        return f"{username.casefold()}\0{username}"
+
+    @staticmethod
+    def _username(key: str) -> str:
+        return key.split("\0", 1)[1]
+
+    def rebuild(self):
+        """Loads all usernames from the database."""
+        Session = get_session()
+        session = Session()
+        rows = session.execute(
+            select(User.username, User.id)
+            .where(User.deleted_at.is_(None))).all()
+        session.close()
+
+        entries = sorted((self._key(username), uid) for username, uid in rows)
+
+        with self._lock:
+            self._keys = [key for key, _ in entries]
+            self._ids = [uid for _, uid in entries]
+
+    def invalidate(self):
+        """Drops the index, it is rebuilt on the next search."""
+        with self._lock:
+            self._keys = None
+            self._ids = []
+
+    def add(self, uid: int, username: str):
+        with self._lock:
+            if self._keys is None:
+                return
+            key = self._key(username)
+            i = bisect_left(self._keys, key)
+            self._keys.insert(i, key)
+            self._ids.insert(i, uid)
+
+    def remove(self, uid: int, username: str):
+        with self._lock:
+            if self._keys is None:
+                return
+            key = self._key(username)
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._ids[i] == uid:
+                del self._keys[i]
+                del self._ids[i]
+
+    def rename(self, uid: int, old_username: str, new_username: str):
+        self.remove(uid, old_username)
+        self.add(uid, new_username)
+
+    def search(self, prefix: str, limit: int = 10) -> list[tuple[int, str]]:
+        """Returns up to limit (id, username) pairs where the username starts
+        with the prefix, ignoring case. Ordered alphabetically."""
+        if self._keys is None:
+            self.rebuild()
+
+        prefix = prefix.casefold()
+        results = []
+
+        with self._lock:
+            keys = self._keys or []
+            i = bisect_left(keys, prefix)
+            while i < len(keys) and len(results) < limit:
+                key = keys[i]
+                if not key.startswith(prefix):
+                    break
+                # The prefix must match the username, not the appended part
+                if "\0" not in key[:len(prefix)]:
+                    results.append((self._ids[i], self._username(key)))
+                i += 1
+
+        return results
+
+
+username_index = UsernameIndex()
@@ -0,0 +1,80 @@
+from utils.cache import TTLCache
+from utils.response_cache import CachedResponse, MemoryResponseCache
+import time
+
+
+def test_ttl_cache():
+    cache = TTLCache(maxsize=2, ttl=60)
+
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    # None is a valid value, a default tells it apart from a miss
+    cache.set("none", None)
+    assert cache.get("none", "missing") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+    cache.delete("none")
+    assert cache.get("none", "missing") == "missing"
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Using a makes b the least recently used
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    # Entries with no time to live are not stored
+    cache.set("c", 3, ttl=0)
+    assert cache.get("c") is None
+
+
+def test_response_cache_generations():
+    cache = MemoryResponseCache(maxsize=2, ttl=60)
+    response = CachedResponse(b"{}", None, None)
+
+    # A response read before the key is deleted is not stored after it
+    generation = cache.generation("user:1")
+    cache.delete("user:1")
+    cache.set("user:1", response, generation)
+    assert cache.get("user:1") is None
+
+    cache.set("user:1", response, cache.generation("user:1"))
+    assert cache.get("user:1") is response
+
+    # Deleting other keys leaves the generation alone
+    generation = cache.generation("user:1")
+    cache.delete("post:1")
+    assert cache.generation("user:1") == generation
+
+    # Until the key is forgotten, which changes it as well
+    cache.delete("post:2", "post:3")
+    assert cache.generation("user:1") != generation
+
+    generation = cache.generation("post:1")
+    cache.clear()
+    cache.set("post:1", response, generation)
+    assert cache.get("post:1") is None
@@ -1,4 +1,6 @@
 from db import Base, get_session, get_engine, User
+from db.database import get_engine_settings, get_engine_options
+from sqlalchemy import make_url
 from utils.init_db import init_db
 from sqlalchemy.orm import sessionmaker
 
@@ -154,3 +156,30 @@ def test_delete_user(db_session):
     assert user is None
 
     db_session.close()
+
+
+def test_engine_settings(db_session):
+    settings = get_engine_settings()
+
+    # Echo is off unless DATABASE_ECHO is set
+    assert settings["echo"] is False
+
+    # The PRAGMAs are applied to every connection
+    assert settings["busy_timeout"] == 5000
+    assert settings["cache_size"] == -64000
+    assert settings["synchronous"] == 1  # NORMAL
+    assert settings["temp_store"] == 2  # MEMORY
+
+
+def test_engine_options(monkeypatch):
+    url = make_url("sqlite:///database.db")
+
+    monkeypatch.setenv("DATABASE_POOL_SIZE", "20")
+    monkeypatch.setenv("DATABASE_ECHO", "True")
+    options = get_engine_options(url)
+    assert options["pool_size"] == 20
+    assert options["echo"] is True
+
+    # In-memory databases have no pool to configure
+    options = get_engine_options(make_url("sqlite:///:memory:"))
+    assert "pool_size" not in options
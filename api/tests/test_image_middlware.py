@@ -1,13 +1,19 @@
 import pytest
-from middleware.image import validate_mimetype, image_validated
+from middleware.image import (validate_mimetype, validate_img_size,
+                              image_validated, UploadRequest)
 from werkzeug.datastructures import FileStorage, Headers
-from flask import Flask
+from tempfile import SpooledTemporaryFile
+from flask import Flask, request
 import secrets
+import io
 import os
 
 app = Flask(__name__)
 # This is a random secret, only 16 as it is just for testing
 app.config["JWT_SECRET"] = secrets.token_urlsafe(16)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = 6 * 1024 * 1024
+app.config["UPLOAD_SPOOL_SIZE"] = 128 * 1024
 
 
 @pytest.fixture(scope="module")
@@ -27,6 +33,23 @@ def image_upload_route():
     return "Image uploaded"
 
 
+@app.route("/image_spool_route", methods=["POST"])
+@image_validated()
+def image_spool_route():
+    stream = request.files["image"].stream
+    assert isinstance(stream, SpooledTemporaryFile)
+    return "spooled" if stream._rolled else "in memory"
+
+
+class HeaderOnlyStream(io.BytesIO):
+    """Stream that fails if more than the header is read."""
+
+    def read(self, size=-1):
+        if size < 0 or size > 512:
+            raise AssertionError("Read more than the header")
+        return super().read(size)
+
+
 def test_check_mimetype():
     with open("tests/test_data/small.jpg", "rb") as f:
         file = FileStorage(f, headers=Headers({"Content-Type": "image/jpeg"}))
@@ -110,3 +133,69 @@ def test_image_upload_route(test_client):
         )
         assert response.status_code == 400
         assert response.data == b"Invalid mimetype"
+
+
+def test_validate_img_size():
+    with open("tests/test_data/small.png", "rb") as f:
+        data = f.read()
+
+    # The size is found by seeking, so only the header is read
+    stream = HeaderOnlyStream(data)
+    file = FileStorage(stream, headers=Headers({"Content-Type": "image/png"}))
+    validate_mimetype(file)
+    validate_img_size(file, max_size=len(data), min_size=1)
+    assert stream.tell() == 0
+
+    with pytest.raises(ValueError):
+        validate_img_size(file, max_size=len(data) - 1, min_size=1)
+
+    with pytest.raises(ValueError):
+        validate_img_size(file, max_size=len(data) * 2, min_size=len(data) + 1)
+
+
+def test_image_upload_limits(test_client):
+    # Small files stay in memory, larger files are spooled to disk
+    with open("tests/test_data/small.jpg", "rb") as f:
+        response = test_client.post(
+            "/image_spool_route",
+            data={"image": (f, "small.jpg")},
+            content_type="multipart/form-data"
+        )
+        assert response.data == b"in memory"
+
+    with open("tests/test_data/small.png", "rb") as f:
+        response = test_client.post(
+            "/image_spool_route",
+            data={"image": (f, "small.png")},
+            content_type="multipart/form-data"
+        )
+        assert response.data == b"spooled"
+
+    # Bodies over MAX_CONTENT_LENGTH are rejected while parsing
+    large = io.BytesIO(b"\x89PNG\r\n\x1a\n" + bytes(7 * 1024 * 1024))
+    response = test_client.post(
+        "/image_upload_route",
+        data={"image": (large, "large.png")},
+        content_type="multipart/form-data"
+    )
+    assert response.status_code == 413
+
+
+def test_upload_request_form_limits(test_client, monkeypatch):
+    # Read by UploadRequest, as Flask before 3.1 does not read them
+    monkeypatch.setitem(app.config, "MAX_FORM_PARTS", 3)
+    response = test_client.post(
+        "/image_upload_route",
+        data={f"field{i}": "value" for i in range(5)},
+        content_type="multipart/form-data"
+    )
+    assert response.status_code == 413
+
+    monkeypatch.setitem(app.config, "MAX_FORM_PARTS", 20)
+    monkeypatch.setitem(app.config, "MAX_FORM_MEMORY_SIZE", 128 * 1024)
+    response = test_client.post(
+        "/image_upload_route",
+        data={"field": "a" * 200 * 1024},
+        content_type="multipart/form-data"
+    )
+    assert response.status_code == 413
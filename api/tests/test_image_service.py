@@ -0,0 +1,252 @@
+from db import Base, get_session, get_engine, User, Post, Image, images
+from services import image_service, image_sweeper
+from utils.init_db import init_db
+from flask.testing import FlaskClient
+from werkzeug.datastructures import FileStorage
+from sqlalchemy import select
+from app import app
+import os
+import pytest
+
+
+@pytest.fixture(scope="module")
+def testing_env():
+    os.environ["TESTING"] = "True"
+    yield
+    del os.environ["TESTING"]
+
+
+@pytest.fixture(scope="function")
+def testing_db(testing_env):
+    init_db()
+    yield
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def image_directories(tmp_path, monkeypatch):
+    directories = {}
+    for kind in ("posts", "users"):
+        directories[kind] = tmp_path / kind
+        directories[kind].mkdir()
+    monkeypatch.setattr(images, "IMAGE_DIRECTORIES", {
+        kind: str(path) for kind, path in directories.items()})
+    return directories
+
+
+@pytest.fixture(scope="function")
+def test_client(testing_db, image_directories):
+    flask_app = app
+    os.environ["TESTING"] = "True"
+    testing_client = flask_app.test_client()
+    ctx = flask_app.app_context()
+    ctx.push()
+    yield testing_client
+    ctx.pop()
+
+
+def register(test_client: FlaskClient, username: str):
+    response = test_client.post("/api/auth/register", json={
+        "username": username, "password": "password",
+        "email": f"{username}@example.com"})
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+def create_post(test_client: FlaskClient, headers, uid: int, image: str):
+    with open(f"tests/test_data/{image}", "rb") as f:
+        response = test_client.post(
+            f"/api/users/{uid}/posts", headers=headers,
+            data={"title": "Post", "content": "Image post",
+                  "image": (f, image)})
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    return response.json["id"]
+
+
+def ref_counts():
+    Session = get_session()
+    with Session() as session:
+        return {(image.kind, image.filename): image.ref_count
+                for image in session.scalars(select(Image))}
+
+
+def test_identical_images_are_stored_once(test_client: FlaskClient,
+                                          image_directories):
+    alice = register(test_client, "Alice")
+    sheila = register(test_client, "Sheila")
+
+    first = create_post(test_client, alice, 1, "small.png")
+    second = create_post(test_client, sheila, 2, "small.png")
+    third = create_post(test_client, alice, 1, "small.jpg")
+
+    Session = get_session()
+    with Session() as session:
+        filename = session.get(Post, first).image
+        assert session.get(Post, second).image == filename
+        assert session.get(Post, third).image != filename
+
+    assert len(os.listdir(image_directories["posts"])) == 2
+    assert ref_counts()[("posts", filename)] == 2
+
+    # The file is kept until the last post using it is deleted
+    response = test_client.delete(f"/api/users/1/posts/{first}",
+                                  headers=alice)
+    assert response.status_code == 204
+    assert ref_counts()[("posts", filename)] == 1
+    assert (image_directories["posts"] / filename).exists()
+
+    # The last release only drops the row, the sweeper removes the file
+    response = test_client.delete("/api/users/2", headers=sheila)
+    assert response.status_code == 204
+    assert ("posts", filename) not in ref_counts()
+    assert (image_directories["posts"] / filename).exists()
+
+    image_sweeper.sweep_images(grace_period=0)
+    assert not (image_directories["posts"] / filename).exists()
+
+
+def test_replaced_images_are_released(test_client: FlaskClient,
+                                      image_directories):
+    headers = register(test_client, "Alice")
+
+    def upload(route: str, image: str):
+        with open(f"tests/test_data/{image}", "rb") as f:
+            response = test_client.put(
+                f"/api/users/1/{route}", headers=headers,
+                data={"image": (f, image)})
+        assert response.status_code == 200
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return response.json
+
+    # The same picture as profile picture and banner is stored once
+    profile_picture = upload("profile-picture", "small.png")["profile_picture"]
+    banner = upload("banner-picture", "small.png")["banner_picture"]
+    assert profile_picture == banner
+    assert ref_counts() == {("users", banner): 2}
+
+    upload("profile-picture", "small.jpg")
+    assert ref_counts()[("users", banner)] == 1
+
+    upload("banner-picture", "small.jpg")
+    assert ("users", banner) not in ref_counts()
+    image_sweeper.sweep_images(grace_period=0)
+    assert os.listdir(image_directories["users"]) == [
+        upload("profile-picture", "small.jpg")["profile_picture"]]
+
+
+def test_release_and_save_of_the_same_image(test_client: FlaskClient,
+                                            image_directories, monkeypatch):
+    headers = register(test_client, "Alice")
+    pid = create_post(test_client, headers, 1, "small.png")
+
+    Session = get_session()
+    with Session() as releasing, Session() as saving:
+        filename = releasing.get(Post, pid).image
+        releasing.delete(releasing.get(Post, pid))
+        releasing.flush()
+
+        # The release commits after the upload found the file on disk,
+        # but before the upload counts its reference
+        acquire_image = images.acquire_image
+
+        def commit_release_first(*args):
+            releasing.commit()
+            acquire_image(*args)
+
+        monkeypatch.setattr(images, "acquire_image", commit_release_first)
+        with open("tests/test_data/small.png", "rb") as f:
+            image = FileStorage(f, "small.png", content_type="image/png")
+            assert image_service.save_image(image, "posts",
+                                            saving) == filename
+        saving.add(Post(uid=1, title="Post", content="Post",
+                        image=filename))
+        saving.commit()
+
+    assert ref_counts() == {("posts", filename): 1}
+    assert (image_directories["posts"] / filename).exists()
+
+    # The file is referenced again, so the sweeper keeps it
+    image_sweeper.sweep_images(grace_period=0)
+    assert (image_directories["posts"] / filename).exists()
+
+
+def test_legacy_images_are_removed(test_client: FlaskClient,
+                                   image_directories):
+    headers = register(test_client, "Alice")
+
+    # Images uploaded before content addressing have no row in images
+    legacy = image_directories["posts"] / "0123456789abcdef.png"
+    legacy.write_bytes(b"legacy")
+    Session = get_session()
+    with Session() as session:
+        post = Post(uid=1, title="Old", content="Old post",
+                    image=legacy.name)
+        session.add(post)
+        session.commit()
+        pid = post.id
+
+    response = test_client.delete(f"/api/users/1/posts/{pid}",
+                                  headers=headers)
+    assert response.status_code == 204
+    assert not legacy.exists()
+
+
+def test_rollback_keeps_images(testing_db, image_directories):
+    image = image_directories["posts"] / "kept.png"
+    image.write_bytes(b"image")
+
+    Session = get_session()
+    with Session() as session:
+        session.add(User(username="Alice", password="password",
+                         email="alice@example.com"))
+        session.add(Post(uid=1, title="Post", content="Post",
+                         image=image.name))
+        session.commit()
+
+        session.delete(session.get(Post, 1))
+        session.flush()
+        session.rollback()
+
+    assert image.exists()
+
+
+def test_sweep_orphaned_images(test_client: FlaskClient, image_directories,
+                               monkeypatch):
+    headers = register(test_client, "Alice")
+    pid = create_post(test_client, headers, 1, "small.png")
+    Session = get_session()
+    with Session() as session:
+        referenced = session.get(Post, pid).image
+
+    # Files left behind by deleted rows and rolled back uploads
+    orphans = {
+        image_directories["posts"] / "0123456789abcdef.jpg": 1000,
+        image_directories["users"] / "fedcba9876543210.png": 500,
+        image_directories["users"] / "abc.png.1234.tmp": 20,
+    }
+    for orphan, size in orphans.items():
+        orphan.write_bytes(bytes(size))
+    (image_directories["users"] / "placeholder-profile.jpg").write_bytes(b"x")
+
+    # Recently written files may belong to an upload in progress
+    report = image_sweeper.sweep_images()
+    assert report["removed"] == 0
+
+    monkeypatch.setattr(image_sweeper, "BATCH_SIZE", 2)
+
+    report = image_sweeper.sweep_images(dry_run=True, grace_period=0)
+    assert report == {"dry_run": True, "scanned": 4, "removed": 3,
+                      "bytes_reclaimed": 1520}
+    assert all(orphan.exists() for orphan in orphans)
+
+    report = image_sweeper.sweep_images(grace_period=0)
+    assert report["removed"] == 3
+    assert report["bytes_reclaimed"] == 1520
+    assert not any(orphan.exists() for orphan in orphans)
+    assert (image_directories["posts"] / referenced).exists()
+    assert (image_directories["users"] / "placeholder-profile.jpg").exists()
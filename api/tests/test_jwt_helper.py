@@ -1,6 +1,7 @@
 import hashlib
 import hmac
 import datetime
+import time
 import pytest
 
 from utils.jwt_helper import (create_jwt,
@@ -8,7 +9,8 @@ from utils.jwt_helper import (create_jwt,
                               base64_decode,
                               decode_jwt,
                               JWTInvalidError,
-                              JWTExpiredError)
+                              JWTExpiredError,
+                              token_cache)
 import json
 
 
@@ -168,3 +170,49 @@ def test_decode_jwt():
 
     with pytest.raises(JWTInvalidError):
         decode_jwt(jwt, secret)
+
+
+def test_decode_jwt_cache():
+
+    secret = "secret"
+    uid = 1
+    exp = datetime.datetime.now().timestamp() + 1000
+
+    jwt = create_jwt(exp, uid, secret)
+    token_cache.clear()
+
+    decode_jwt(jwt, secret)
+    hits = token_cache.hits
+
+    # The second decode is served from the cache
+    header, payload = decode_jwt(jwt, secret)
+    assert token_cache.hits == hits + 1
+    assert payload["uid"] == uid
+    assert header["alg"] == "HS256"
+
+    # Changing the returned payload does not change the cached one
+    payload["uid"] = 2
+    _, payload = decode_jwt(jwt, secret)
+    assert payload["uid"] == uid
+
+    # A cached token is still rejected with another secret
+    with pytest.raises(JWTInvalidError):
+        decode_jwt(jwt, "invalid_secret")
+
+    # A tampered payload is not a cache hit, and fails verification
+    header_b64, _, signature_b64 = jwt.split(".")
+    tampered_payload = base64_encode(json.dumps(
+        {"exp": exp, "uid": 2}, separators=(",", ":"),
+        sort_keys=True).encode("utf-8")).decode("utf-8")
+
+    with pytest.raises(JWTInvalidError):
+        decode_jwt(f"{header_b64}.{tampered_payload}.{signature_b64}",
+                   secret)
+
+    # Tokens are only cached until they expire
+    jwt = create_jwt(datetime.datetime.now().timestamp() + 0.05, uid, secret)
+    decode_jwt(jwt, secret)
+    time.sleep(0.1)
+
+    with pytest.raises(JWTExpiredError):
+        decode_jwt(jwt, secret)
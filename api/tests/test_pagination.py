@@ -0,0 +1,141 @@
+from db import Base, get_session, get_engine, User, Post
+from utils import pagination
+from utils.pagination import Page, encode_cursor, decode_cursor
+from utils.init_db import init_db
+from flask.testing import FlaskClient
+from app import app
+import os
+import pytest
+
+
+@pytest.fixture(scope="module")
+def testing_env():
+    os.environ["TESTING"] = "True"
+    yield
+    del os.environ["TESTING"]
+
+
+@pytest.fixture(scope="function")
+def testing_db(testing_env):
+    init_db()
+    yield
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def test_client(testing_db):
+    flask_app = app
+    os.environ["TESTING"] = "True"
+    testing_client = flask_app.test_client()
+    ctx = flask_app.app_context()
+    ctx.push()
+    yield testing_client
+    ctx.pop()
+
+
+def insert_posts(count: int):
+    Session = get_session()
+    with Session() as session:
+        session.add(User(username="Alice", password="password",
+                         email="alice@example.com"))
+        session.commit()
+        for i in range(count):
+            session.add(Post(uid=1, title=f"Post {i}", content="Post"))
+        session.commit()
+
+
+def login(test_client: FlaskClient):
+    response = test_client.post("api/auth/login", json={
+        "username": "Alice", "password": "password"})
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"rank": -1.5, "id": 3}, descending=False)
+    assert decode_cursor(cursor) == ({"rank": -1.5, "id": 3}, False)
+
+    for cursor in ("", "not a cursor", encode_cursor({"id": 1}, True)[:-2],
+                   encode_cursor({"id": None}, True),
+                   encode_cursor({"id": [1]}, True),
+                   encode_cursor({"id": True}, True)):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_page_from_request():
+    with app.test_request_context("/?page_size=5000"):
+        page = Page.from_request()
+        assert page.size == pagination.MAX_PAGE_SIZE
+        assert page.descending and page.after is None
+
+    # Older clients send last_id=0 for the first page
+    with app.test_request_context("/?last_id=0&descending=false"):
+        page = Page.from_request()
+        assert page.after is None and not page.descending
+
+    # The cursor decides the direction, unless the order is fixed
+    cursor = encode_cursor({"id": 7}, descending=False)
+    with app.test_request_context(f"/?cursor={cursor}&descending=true"):
+        page = Page.from_request()
+        assert page.after == (7,) and not page.descending
+        with pytest.raises(ValueError):
+            Page.from_request(fixed_order=True)
+        with pytest.raises(ValueError):
+            Page.from_request({"rank": float, "id": int})
+
+    with app.test_request_context("/?page_size=0"):
+        with pytest.raises(ValueError):
+            Page.from_request()
+
+
+def test_routes_follow_cursors(test_client: FlaskClient):
+    insert_posts(25)
+    headers = login(test_client)
+
+    def walk(url: str):
+        ids, cursors = [], 0
+        response = test_client.get(url, headers=headers)
+        while True:
+            assert response.status_code == 200
+            if response.json is None:
+                pytest.fail("No JSON data returned")
+            ids += [post["id"] for post in response.json]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return ids, cursors
+            cursors += 1
+            response = test_client.get(
+                f"{url}&cursor={cursor}", headers=headers)
+
+    # Every post is read once, in order, without a cursor after the last
+    ids, cursors = walk("api/posts?page_size=10")
+    assert ids == list(range(1, 26))
+    assert cursors == 2
+
+    ids, cursors = walk("api/users/1/posts?page_size=5")
+    assert ids == list(range(25, 0, -1))
+    assert cursors == 5
+
+    ids, _ = walk("api/users/1/posts?page_size=10&descending=false")
+    assert ids == list(range(1, 26))
+
+    # Objects carry the cursor in the body as well
+    response = test_client.get("api/posts?page_size=10&include=author",
+                               headers=headers)
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert response.json["next_cursor"] == response.headers["X-Next-Cursor"]
+
+    # A cursor only works for lists with the same sort key
+    cursor = encode_cursor({"rank": -1.0, "id": 3}, descending=False)
+    malformed = [encode_cursor({"id": value}, descending=True)
+                 for value in (None, [1], "abc", 1e400)]
+    for url in (f"api/posts?cursor={cursor}", "api/posts?cursor=abc",
+                *(f"api/posts?cursor={cursor}" for cursor in malformed),
+                *(f"api/users/1/follows?cursor={cursor}"
+                  for cursor in malformed)):
+        response = test_client.get(url, headers=headers)
+        assert response.status_code == 400, url
@@ -1,4 +1,5 @@
-from db import Base, get_session, get_engine, User, Post, Comment, Like
+from db import (Base, get_session, get_engine, User, Post, Comment, Like,
+                reconcile_post_counters, search)
 from utils.init_db import init_db
 from flask.testing import FlaskClient
 from sqlalchemy.orm import Session
@@ -377,3 +378,181 @@ def test_post_comment(test_client: FlaskClient, db_session: Session):
     # meaning that the first is the last inserted
     assert comments[1]["uid"] == 1
     assert comments[0]["uid"] == 2
+
+
+def test_post_counters(test_client: FlaskClient, db_session: Session):
+
+    # Insert Alice, Sheila and a post made by Alice
+
+    insert_alice()
+    insert_sheila()
+    insert_dummy_post(1)
+
+    # Login as Sheila
+
+    response = test_client.post("api/auth/login",
+                                json={"username": "Sheila",
+                                      "password": "password"})
+    assert response.status_code == 200
+
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+
+    jwt_token = response.json["access_token"]
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+
+    # Like and comment the post through the routes
+
+    response = test_client.post("api/users/2/posts/1/likes", headers=headers)
+    assert response.status_code == 200
+
+    response = test_client.post("api/users/2/posts/1/comments",
+                                json={"content": "Nice post"},
+                                headers=headers)
+    assert response.status_code == 200
+
+    post = db_session.scalars(select(Post).where(Post.id == 1)).one()
+    assert post.like_count == 1
+    assert post.comment_count == 1
+
+    # Unliking decrements the counter
+
+    response = test_client.delete("api/users/2/posts/1/likes",
+                                  headers=headers)
+    assert response.status_code == 204
+
+    db_session.expire_all()
+    post = db_session.scalars(select(Post).where(Post.id == 1)).one()
+    assert post.like_count == 0
+    assert post.comment_count == 1
+
+    # Deleting Sheila removes her like and comment from the counters
+
+    insert_dummy_like(1, 2)
+    response = test_client.delete("api/users/2", headers=headers)
+    assert response.status_code == 204
+
+    db_session.expire_all()
+    post = db_session.scalars(select(Post).where(Post.id == 1)).one()
+    assert post.like_count == 0
+    assert post.comment_count == 0
+
+    # The reconcile command fixes counters that have drifted
+
+    post.like_count = 42
+    db_session.commit()
+
+    assert reconcile_post_counters(db_session.connection()) == 1
+    db_session.commit()
+
+    post = db_session.scalars(select(Post).where(Post.id == 1)).one()
+    assert post.like_count == 0
+
+
+def test_post_search(test_client: FlaskClient, db_session: Session,
+                     monkeypatch: pytest.MonkeyPatch):
+
+    insert_alice()
+
+    for title in ["Cats are great", "Dogs are great", "A cat and a dog",
+                  "Nothing here"]:
+        db_session.add(Post(title=title, content="Some content", uid=1))
+    db_session.commit()
+
+    response = test_client.post("api/auth/login",
+                                json={"username": "Alice",
+                                      "password": "password"})
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    # Words are matched as prefixes, so "cat" also matches "Cats"
+
+    response = test_client.get("api/posts?query=cat", headers=headers)
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+
+    assert sorted(post["id"] for post in response.json) == [1, 3]
+
+    # Pages continue after the rank and id of the last post
+
+    response = test_client.get("api/posts?query=great&page_size=1",
+                               headers=headers)
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    first_page = response.json
+    assert len(first_page) == 1
+
+    last = first_page[-1]
+    response = test_client.get(
+        f"api/posts?query=great&page_size=1"
+        f"&last_rank={last['rank']}&last_id={last['id']}",
+        headers=headers)
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    second_page = response.json
+    assert len(second_page) == 1
+    assert {first_page[0]["id"], second_page[0]["id"]} == {1, 2}
+
+    # Search syntax in the query is not interpreted
+
+    response = test_client.get('api/posts?query="great" OR (',
+                               headers=headers)
+    assert response.status_code == 200
+
+    # Updated and deleted posts are kept in sync with the search index
+
+    post = db_session.scalars(select(Post).where(Post.id == 4)).one()
+    post.title = "Cat pictures"
+    db_session.delete(
+        db_session.scalars(select(Post).where(Post.id == 1)).one())
+    db_session.commit()
+
+    response = test_client.get("api/posts?query=cat", headers=headers)
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert sorted(post["id"] for post in response.json) == [3, 4]
+
+    # Without FTS5 the search falls back to ilike
+
+    monkeypatch.setattr(search, "_search_enabled", False)
+
+    response = test_client.get("api/posts?query=cat", headers=headers)
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert sorted(post["id"] for post in response.json) == [3, 4]
+
+
+def test_post_batch(test_client: FlaskClient, db_session: Session):
+    insert_alice()
+    for _ in range(3):
+        insert_dummy_post(1)
+
+    response = test_client.post("api/auth/login",
+                                json={"username": "Alice",
+                                      "password": "password"})
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    # Posts come back in the order asked, missing ones are listed
+    response = test_client.get("api/posts/batch?ids=3,99,1,3",
+                               headers=headers)
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert [post["id"] for post in response.json["posts"]] == [3, 1]
+    assert response.json["missing"] == [99]
+    assert response.json["posts"][0]["like_count"] == 0
+
+    response = test_client.get("api/posts/batch?ids=1,x", headers=headers)
+    assert response.status_code == 400
+
+    # Profiles are public, like get_user
+    response = test_client.get("api/users/batch?ids=2,1")
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert [user["username"] for user in response.json["users"]] == ["Alice"]
+    assert response.json["missing"] == [2]
@@ -0,0 +1,340 @@
+from db import Base, get_session, get_engine, User, Post, Comment, Like, Follow
+from utils.init_db import init_db
+from flask.testing import FlaskClient
+from sqlalchemy import event
+from app import app
+import os
+import pytest
+
+
+"""
+NB: These tests capture every statement issued by the routes in
+routes/posts.py and routes/users.py, and run EXPLAIN QUERY PLAN on them.
+A statement fails the test if SQLite has to scan a whole table or index
+to answer it, as that means the statement is not backed by an index.
+
+A scan is allowed when the statement has no WHERE clause and a LIMIT,
+as it then only reads the first rows of the table. This includes a WHERE
+clause that only leaves out users marked as deleted. Scanning a
+materialized subquery, or one run as a co-routine, is also allowed, as the
+subquery has its own plan, as is the constant row of a select without a
+FROM.
+
+The paginated routes must also read their rows in the order of an index,
+instead of sorting them in a temporary b-tree. Search results are sorted
+by a computed rank, and the feed merges pages of two sources, so
+statements with virtual tables or materialized subqueries may sort.
+"""
+
+
+@pytest.fixture(scope="module")
+def testing_env():
+    os.environ["TESTING"] = "True"
+    yield
+    del os.environ["TESTING"]
+
+
+@pytest.fixture(scope="function")
+def testing_db(testing_env):
+    init_db()
+    yield
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def test_client(testing_db):
+    flask_app = app
+    os.environ["TESTING"] = "True"
+    testing_client = flask_app.test_client()
+    ctx = flask_app.app_context()
+    ctx.push()
+    yield testing_client
+    ctx.pop()
+
+
+def insert_data():
+    """Inserts Alice and Sheila, who follow each other,
+    and posts that are liked and commented by both."""
+    Session = get_session()
+    session = Session()
+
+    session.add(User(username="Alice",
+                     password="password",
+                     email="Alice@example.com"))
+    session.add(User(username="Sheila",
+                     password="password",
+                     email="Sheila@example.com"))
+    session.commit()
+
+    for i in range(1, 21):
+        session.add(Post(title=f"Post {i}", content="Dummy post",
+                         uid=i % 2 + 1,
+                         image="dummy.png" if i % 3 == 0 else None))
+    session.commit()
+
+    for pid in range(1, 21):
+        for uid in (1, 2):
+            session.add(Like(uid=uid, pid=pid))
+            session.add(Comment(uid=uid, pid=pid, content="Dummy comment"))
+
+    session.add(Follow(follower_id=1, followed_id=2))
+    session.add(Follow(follower_id=2, followed_id=1))
+    session.commit()
+    session.close()
+
+
+def login(test_client: FlaskClient, username: str):
+    response = test_client.post("api/auth/login", json={
+        "username": username,
+        "password": "password"
+    })
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+class StatementCapture:
+    """Records the statements executed on the engine while active.
+    Only statements that read rows are recorded, unless kinds is None."""
+
+    def __init__(self, kinds=("SELECT", "UPDATE", "DELETE")):
+        self.kinds = kinds
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(get_engine(), "before_cursor_execute", self.capture)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(get_engine(), "before_cursor_execute", self.capture)
+
+    def capture(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if (self.kinds is None
+                or statement.lstrip().upper().startswith(self.kinds)):
+            self.statements.append((statement, parameters))
+
+
+def explain(statement: str, parameters):
+    with get_engine().connect() as connection:
+        rows = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return [row[3] for row in rows]
+
+
+# Filters leaving out users marked as deleted, see account_purger. They
+# only skip the few rows waiting to be purged, so a statement filtered by
+# nothing else still reads only its first rows.
+DELETED_FILTERS = [
+    "NOT (EXISTS (SELECT * FROM USERS AS DELETED_AUTHOR WHERE "
+    "DELETED_AUTHOR.ID = POSTS.UID AND DELETED_AUTHOR.DELETED_AT IS NOT "
+    "NULL))",
+    "USERS.DELETED_AT IS NULL",
+]
+
+
+def without_deleted_filters(sql: str) -> str:
+    for deleted_filter in DELETED_FILTERS:
+        sql = (sql.replace(f" WHERE {deleted_filter} AND ", " WHERE ")
+               .replace(f" AND {deleted_filter}", "")
+               .replace(f" WHERE {deleted_filter}", ""))
+    return sql
+
+
+def is_full_scan(detail: str, statement: str, materialized=()):
+    # Few users are deleted, so a search on deleted_at alone reads them all
+    if detail.endswith("(deleted_at=?)"):
+        detail = "SCAN " + detail.split()[1]
+
+    if not detail.startswith("SCAN "):
+        return False
+
+    # Virtual tables such as FTS5 do their own lookups
+    if "VIRTUAL TABLE" in detail:
+        return False
+
+    # The single row of a select without a FROM, such as the EXISTS checks
+    if detail == "SCAN CONSTANT ROW":
+        return False
+
+    # Subqueries are materialized by their own, checked, plan
+    if detail.split()[1] in materialized:
+        return False
+
+    sql = without_deleted_filters(" ".join(statement.upper().split()))
+    if " WHERE " not in sql and " LIMIT " in sql:
+        return False
+
+    return True
+
+
+def full_scans(statements):
+    scans = []
+    for statement, parameters in statements:
+        details = explain(statement, parameters)
+        materialized = {detail.split()[1] for detail in details
+                        if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+        for detail in details:
+            if is_full_scan(detail, statement, materialized):
+                scans.append(f"{detail}: {statement}")
+    return scans
+
+
+def temp_sorts(statements):
+    sorts = []
+    for statement, parameters in statements:
+        details = explain(statement, parameters)
+        if any(detail.startswith("MATERIALIZE ") or "VIRTUAL TABLE" in detail
+               for detail in details):
+            continue
+        for detail in details:
+            if "USE TEMP B-TREE FOR ORDER BY" in detail:
+                sorts.append(f"{detail}: {statement}")
+    return sorts
+
+
+def test_post_routes_use_indexes(test_client: FlaskClient):
+    insert_data()
+    headers = login(test_client, "Alice")
+
+    urls = [
+        "api/posts/1",
+        "api/posts/batch?ids=3,1,99",
+        "api/posts",
+        "api/posts?last_id=5",
+        "api/posts?liked_by=2",
+        "api/posts?liked_by=2&last_id=5",
+        "api/posts?include=author&last_id=5",
+        "api/posts?descending=true&page_size=1000",
+        "api/posts/1/likes",
+        "api/posts/1/likes?last_id=2",
+        "api/posts/1/likes?descending=false&last_id=1",
+        "api/posts/1/comments",
+        "api/posts/1/comments?last_id=2",
+        "api/posts/1/comments?descending=false&last_id=1",
+    ]
+
+    with StatementCapture() as capture:
+        for url in urls:
+            response = test_client.get(url, headers=headers)
+            assert response.status_code in (200, 204), url
+
+    assert capture.statements
+    assert full_scans(capture.statements) == []
+    assert temp_sorts(capture.statements) == []
+
+
+def test_user_routes_use_indexes(test_client: FlaskClient):
+    insert_data()
+    headers = login(test_client, "Alice")
+
+    requests = [
+        ("get", "api/users/2", None),
+        ("get", "api/users/batch?ids=2,1,5", None),
+        ("get", "api/users", None),
+        ("get", "api/users?last_id=2", None),
+        ("put", "api/users/1", {"about_me": "Hello"}),
+        ("put", "api/users/1", {"username": "Alice2"}),
+        ("get", "api/users/2/posts", None),
+        ("get", "api/users/2/posts?last_id=10", None),
+        ("get", "api/users/2/posts?descending=false&last_id=2", None),
+        ("get", "api/users/2/posts?has_image=true", None),
+        ("get", "api/users/2/posts?has_image=true&last_id=10", None),
+        ("get", "api/users/2/posts?include=author", None),
+        ("get", "api/users/1/posts/feed", None),
+        ("get", "api/users/1/posts/feed?include=author&last_id=10", None),
+        ("get", "api/users/1/posts/feed?last_id=10", None),
+        ("get", "api/users/1/posts/2/likes", None),
+        ("delete", "api/users/1/posts/2/likes", None),
+        ("post", "api/users/1/posts/2/likes", None),
+        ("get", "api/users/1/posts/2/comments", None),
+        ("get", "api/users/1/posts/2/comments?last_id=100", None),
+        ("post", "api/users/1/posts/2/comments", {"content": "Hi"}),
+        ("get", "api/users/1/follows", None),
+        ("get", "api/users/1/follows?last_id=5", None),
+        ("get", "api/users/1/follows?descending=false", None),
+        ("get", "api/users/1/followers", None),
+        ("get", "api/users/1/followers?descending=false", None),
+        ("get", "api/users/1/followers?last_followed_date=2100-01-01"
+                "&last_id=5", None),
+        ("get", "api/users/1/follows/2", None),
+        ("get", "api/users/1/follows/status?ids=2,3", None),
+        ("get", "api/users/1/likes/status?ids=1,2,25", None),
+        ("delete", "api/users/1/follows/2", None),
+        ("post", "api/users/1/follows/2", None),
+        ("delete", "api/users/1/posts/3", None),
+        ("delete", "api/users/1", None),
+    ]
+
+    with StatementCapture() as capture:
+        test_client.post("api/users/1/posts", headers=headers,
+                         data={"title": "Hello", "content": "New post"})
+        for method, url, json in requests:
+            response = getattr(test_client, method)(
+                url, headers=headers, json=json)
+            assert response.status_code < 300, url
+
+    assert capture.statements
+    assert full_scans(capture.statements) == []
+    assert temp_sorts(capture.statements) == []
+
+
+def test_post_search_uses_index(test_client: FlaskClient):
+    insert_data()
+    headers = login(test_client, "Alice")
+
+    with StatementCapture() as capture:
+        response = test_client.get("api/posts?query=Post", headers=headers)
+        assert response.status_code == 200
+        response = test_client.get(
+            "api/posts?query=Post&liked_by=2&last_rank=-1&last_id=5",
+            headers=headers)
+        assert response.status_code == 200
+        response = test_client.get("api/posts?query=Post&include=author",
+                                   headers=headers)
+        assert response.status_code == 200
+
+    assert full_scans(capture.statements) == []
+
+
+@pytest.mark.xfail(strict=True,
+                   reason="Substring search with ilike can't use an index")
+def test_user_search_uses_index(test_client: FlaskClient):
+    insert_data()
+    headers = login(test_client, "Alice")
+
+    with StatementCapture() as capture:
+        response = test_client.get("api/users?query=Ali", headers=headers)
+        assert response.status_code == 200
+
+    assert full_scans(capture.statements) == []
+
+
+def test_route_statement_counts(test_client: FlaskClient):
+    """The existence checks are done in the statement that loads the row,
+    so these routes make a single round trip before writing."""
+    insert_data()
+    headers = login(test_client, "Alice")
+    # Caches the user looked up by the authorization
+    test_client.get("api/users/1/follows/2", headers=headers)
+
+    requests = [
+        ("get", "api/users/1/posts/2/likes", None, 1),
+        ("delete", "api/users/1/posts/2/likes", None, 3),
+        ("post", "api/users/1/posts/2/likes", None, 3),
+        ("post", "api/users/1/posts/2/comments", {"content": "Hi"}, 3),
+        ("get", "api/users/1/follows/2", None, 1),
+        ("delete", "api/users/1/follows/2", None, 5),
+        ("post", "api/users/1/follows/2", None, 5),
+        ("get", "api/users/1/posts/99/likes", None, 1),
+        ("post", "api/users/1/follows/99", None, 1),
+    ]
+
+    for method, url, json, expected in requests:
+        with StatementCapture(kinds=None) as capture:
+            response = getattr(test_client, method)(
+                url, headers=headers, json=json)
+            assert response.status_code < 500, url
+        assert len(capture.statements) <= expected, (
+            url, [statement for statement, _ in capture.statements])
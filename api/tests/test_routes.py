@@ -1,9 +1,19 @@
-from db import Base, get_session, get_engine, User
+from db import Base, get_session, get_engine, User, instrumentation
 from utils.init_db import init_db
 from flask.testing import FlaskClient
+from middleware import auth
+from routes import users
+from utils import password_helper
+from werkzeug.security import generate_password_hash
+from flask import g
+from sqlalchemy.exc import OperationalError
 from app import app
+import gc
+import logging
 import os
+import re
 import pytest
+import threading
 
 
 @pytest.fixture(scope="module")
@@ -248,3 +258,344 @@ def test_api_users_route(test_client: FlaskClient, db_session):
         pytest.fail("No JSON data returned")
     profile_pic = response.json["profile_picture"]
     os.remove("static/images/users/" + profile_pic)
+
+
+def test_auth_user_cache(test_client: FlaskClient, db_session,
+                         monkeypatch: pytest.MonkeyPatch):
+    insert_alice()
+    monkeypatch.setitem(app.config, "METRICS_ENABLED", True)
+
+    response = test_client.post(
+        "/api/auth/login", json={"username": "Alice", "password": "password"}
+    )
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    # The first request checks the database, the next ones use the cache
+    for _ in range(3):
+        response = test_client.get("/api/users/1/follows", headers=headers)
+        assert response.status_code == 200
+
+    response = test_client.get("/api/metrics", headers=headers)
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert response.json["auth_cache"]["misses"] >= 1
+    assert response.json["auth_cache"]["hits"] >= 2
+
+    # Deleting the user removes it from the cache, so the token is rejected
+    response = test_client.delete("/api/users/1", headers=headers)
+    assert response.status_code == 204
+
+    response = test_client.get("/api/users/1/follows", headers=headers)
+    assert response.status_code == 401
+
+
+def test_metrics_are_gated(test_client: FlaskClient, db_session,
+                           monkeypatch: pytest.MonkeyPatch):
+    insert_alice()
+    response = test_client.post(
+        "/api/auth/login", json={"username": "Alice", "password": "password"}
+    )
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    # Off unless METRICS_ENABLED is set, and only for logged in users
+    response = test_client.get("/api/metrics", headers=headers)
+    assert response.status_code == 404
+
+    monkeypatch.setitem(app.config, "METRICS_ENABLED", True)
+    assert test_client.get("/api/metrics").status_code == 401
+    response = test_client.get("/api/metrics", headers=headers)
+    assert response.status_code == 200
+
+def test_request_session(test_client: FlaskClient, db_session,
+                         monkeypatch: pytest.MonkeyPatch):
+    insert_alice()
+    monkeypatch.setitem(app.config, "METRICS_ENABLED", True)
+
+    response = test_client.post(
+        "/api/auth/login", json={"username": "Alice", "password": "password"}
+    )
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    def checkouts():
+        response = test_client.get("/api/metrics", headers=headers)
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return response.json["pool"]["checkouts"]
+
+    # The auth middleware and the route share a single connection.
+    # A session left open elsewhere holds on to the connection of the
+    # in-memory database, hiding the checkouts, until it is collected
+    gc.collect()
+    auth.clear_user_cache()
+    before = checkouts()
+    response = test_client.get("/api/users/1/follows", headers=headers)
+    assert response.status_code == 200
+    assert checkouts() - before == 1
+
+    # The session is closed when the request ends, also on errors
+    response = test_client.get("/api/users/2/follows", headers=headers)
+    assert response.status_code == 404
+    assert "db_session" not in g
+
+
+def test_login_rehashes_password(test_client: FlaskClient, db_session):
+    insert_alice()
+
+    # A hash made with an older method is replaced on login
+    alice = db_session.query(User).filter(User.username == "Alice").first()
+    alice.hashed_password = generate_password_hash(
+        "password", "pbkdf2:sha256:1000")
+    db_session.commit()
+    assert alice.password_needs_rehash()
+
+    response = test_client.post("/api/auth/login", json={
+        "username": "Alice", "password": "password"})
+    assert response.status_code == 200
+
+    db_session.refresh(alice)
+    assert alice.hashed_password.startswith(password_helper.HASH_METHOD + "$")
+    assert not alice.password_needs_rehash()
+
+    response = test_client.post("/api/auth/login", json={
+        "username": "Alice", "password": "password"})
+    assert response.status_code == 200
+
+
+def test_login_hasher_busy(test_client: FlaskClient, db_session,
+                           monkeypatch):
+    insert_alice()
+
+    # With every slot taken, logins are turned away instead of queued
+    monkeypatch.setattr(password_helper, "HASH_WORKERS", 1)
+    monkeypatch.setattr(password_helper, "_slots",
+                        threading.BoundedSemaphore(1))
+    password_helper._slots.acquire()
+
+    response = test_client.post("/api/auth/login", json={
+        "username": "Alice", "password": "password"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    password_helper._slots.release()
+    response = test_client.post("/api/auth/login", json={
+        "username": "Alice", "password": "password"})
+    assert response.status_code == 200
+
+
+def test_conditional_get(test_client: FlaskClient, db_session):
+    insert_alice()
+
+    response = test_client.post(
+        "/api/auth/login", json={"username": "Alice", "password": "password"}
+    )
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    def revalidate(url: str, headers: dict = {}):
+        response = test_client.get(url, headers=headers)
+        assert response.status_code == 200
+        etag, weak = response.get_etag()
+        assert etag and not weak
+
+        response = test_client.get(url, headers={
+            **headers, "If-None-Match": f'"{etag}"'})
+        return response
+
+    # Users change version when updated
+    response = revalidate("/api/users/1")
+    assert response.status_code == 304
+    assert response.data == b""
+    etag = response.headers["ETag"]
+
+    response = test_client.put("/api/users/1", json={"about_me": "Hi"},
+                               headers=headers)
+    assert response.status_code == 200
+    response = test_client.get("/api/users/1",
+                               headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["about_me"] == "Hi"
+
+    # Posts change version when liked
+    response = test_client.post("/api/users/1/posts", headers=headers,
+                                data={"title": "Hi", "content": "Post"})
+    assert response.status_code == 200
+    response = revalidate("/api/posts/1", headers)
+    assert response.status_code == 304
+    assert "private" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+
+    response = test_client.post("/api/users/1/posts/1/likes", headers=headers)
+    assert response.status_code == 200
+    response = test_client.get("/api/posts/1", headers={
+        **headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["like_count"] == 1
+
+    # Placeholders are validated by modification time and size,
+    # content addressed images by their hash
+    response = revalidate("/images/users/placeholder-banner.jpg")
+    assert response.status_code == 304
+
+    with open("tests/test_data/small.png", "rb") as f:
+        response = test_client.put(
+            "/api/users/1/profile-picture",
+            data={"image": (f, "small.png")}, headers=headers)
+    profile_picture = response.json["profile_picture"]
+    try:
+        url = f"/images/users/{profile_picture}"
+        response = revalidate(url)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'"{profile_picture[:32]}"'
+        assert "immutable" in test_client.get(url).headers["Cache-Control"]
+    finally:
+        os.remove(f"static/images/users/{profile_picture}")
+
+
+def test_response_cache(test_client: FlaskClient, db_session,
+                        monkeypatch: pytest.MonkeyPatch):
+    insert_alice()
+    monkeypatch.setitem(app.config, "METRICS_ENABLED", True)
+
+    response = test_client.post(
+        "/api/auth/login", json={"username": "Alice", "password": "password"}
+    )
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    # Another user reads the metrics, as Alice is deleted at the end
+    response = test_client.post("/api/auth/register", json={
+        "username": "Bob", "password": "password",
+        "email": "bob@example.com"})
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    bob = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    def cache_stats():
+        response = test_client.get("/api/metrics", headers=bob)
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return response.json["response_cache"] or {"hits": 0, "misses": 0}
+
+    response = test_client.post("/api/users/1/posts", headers=headers,
+                                data={"title": "Hi", "content": "Post"})
+    assert response.status_code == 200
+
+    # The first request fills the cache, the next ones are served from it
+    before = cache_stats()
+    for _ in range(3):
+        response = test_client.get("/api/users/1")
+        assert response.status_code == 200
+        response = test_client.get("/api/posts/1", headers=headers)
+        assert response.status_code == 200
+        assert "private" in response.headers["Cache-Control"]
+    stats = cache_stats()
+    assert stats["backend"] == "memory"
+    assert stats["misses"] - before["misses"] == 2
+    assert stats["hits"] - before["hits"] == 4
+
+    # The cached ETag is answered without the database
+    etag = response.headers["ETag"]
+    response = test_client.get("/api/posts/1", headers={
+        **headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Writes remove the responses they change
+    response = test_client.put("/api/users/1", json={"about_me": "Hi"},
+                               headers=headers)
+    assert response.status_code == 200
+    assert test_client.get("/api/users/1").json["about_me"] == "Hi"
+
+    for method in ("post", "delete"):
+        response = getattr(test_client, method)(
+            "/api/users/1/posts/1/likes", headers=headers)
+        assert response.status_code in (200, 204)
+        response = test_client.get("/api/posts/1", headers=headers)
+        assert response.json["like_count"] == (1 if method == "post" else 0)
+
+    response = test_client.post("/api/users/1/posts/1/comments",
+                                json={"content": "Nice"}, headers=headers)
+    assert response.status_code == 200
+    response = test_client.get("/api/posts/1", headers=headers)
+    assert response.json["comment_count"] == 1
+
+    # Deleting the user removes its profile and the posts it touched
+    response = test_client.delete("/api/users/1", headers=headers)
+    assert response.status_code == 204
+    assert test_client.get("/api/users/1").status_code == 404
+    assert cache_stats()["size"] == 0
+
+
+def test_response_cache_invalidated_while_building(test_client: FlaskClient,
+                                                   db_session, monkeypatch):
+    insert_alice()
+    profile_response = users.profile_response
+
+    def update_while_building(user: User) -> dict:
+        # Committed after the route read the user, but before it stores
+        # the response it builds from it
+        Session = get_session()
+        with Session() as session:
+            session.get(User, user.id).about_me = "Updated"
+            session.commit()
+        return profile_response(user)
+
+    monkeypatch.setattr(users, "profile_response", update_while_building)
+    response = test_client.get("/api/users/1")
+    assert response.json["about_me"] == ""
+
+    monkeypatch.setattr(users, "profile_response", profile_response)
+    response = test_client.get("/api/users/1")
+    assert response.json["about_me"] == "Updated"
+
+def test_server_timing(test_client: FlaskClient, db_session,
+                       monkeypatch: pytest.MonkeyPatch,
+                       caplog: pytest.LogCaptureFixture):
+    insert_alice()
+
+    def timing(url: str):
+        response = test_client.get(url)
+        assert response.status_code == 200
+        match = re.fullmatch(
+            r'db;dur=([\d.]+);desc="(\d+) statements?", total;dur=([\d.]+)',
+            response.headers["Server-Timing"])
+        assert match is not None, response.headers["Server-Timing"]
+        return float(match[1]), int(match[2]), float(match[3])
+
+    db_time, statements, total = timing("/api/users/batch?ids=1")
+    assert statements == 1
+    assert 0 < db_time <= total
+
+    # Slow statements are logged with their parameters and plan
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 1e-9)
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        timing("/api/users/batch?ids=1")
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert "GET /api/users/batch" in message
+    assert "Parameters: (1," in message
+    assert "SEARCH users USING INTEGER PRIMARY KEY" in message
+
+    monkeypatch.setitem(app.config, "SERVER_TIMING_ENABLED", False)
+    response = test_client.get("/api/users/batch?ids=1")
+    assert "Server-Timing" not in response.headers
+
+
+def test_failed_statement_timing(testing_db, monkeypatch, caplog):
+    # A statement that raises leaves nothing behind for the next one
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 1e-9)
+    with get_engine().connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("SELECT * FROM missing")
+        with caplog.at_level(logging.WARNING, logger="slow_queries"):
+            connection.exec_driver_sql("SELECT 1")
+        assert "query_start" not in connection.info
+    assert [record.getMessage().split("\n")[1]
+            for record in caplog.records] == ["SELECT 1"]
@@ -0,0 +1,131 @@
+from services.static_index import StaticIndex
+from utils.js_builder import compress_static
+from flask import Flask
+import gzip
+import json
+import os
+import pytest
+
+
+@pytest.fixture(scope="function")
+def static_app(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "index-5639c606.js").write_text("console.log(1)")
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "upload.png").write_bytes(b"image")
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / "vite.svg").write_text("<svg></svg>")
+    (tmp_path / "site-manifest.json").write_text("{}")
+
+    index = StaticIndex(root=str(tmp_path))
+    index.build()
+
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/<path:path>")
+    def static_proxy(path):
+        return index.serve(path)
+
+    return flask_app, index
+
+
+def test_static_index(static_app):
+    flask_app, index = static_app
+
+    # Uploaded images are left out of the index
+    assert index.get("images/upload.png") is None
+    assert index.is_excluded("images/upload.png")
+    assert index.get("assets/index-5639c606.js").immutable
+    assert not index.get("vite.svg").immutable
+    assert not index.get("site-manifest.json").immutable
+
+
+def test_static_headers(static_app, monkeypatch):
+    flask_app, index = static_app
+    test_client = flask_app.test_client()
+
+    # Hashed bundles never change, so they are cached for good
+    response = test_client.get("/assets/index-5639c606.js")
+    assert response.status_code == 200
+    assert response.data == b"console.log(1)"
+    assert response.headers["Cache-Control"] == \
+        "public, max-age=31536000, immutable"
+    etag, weak = response.get_etag()
+    assert etag and not weak
+
+    response = test_client.get("/assets/index-5639c606.js",
+                               headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+
+    # Other files are revalidated
+    response = test_client.get("/vite.svg")
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    # The SPA fallback is served from memory, without looking at the disk
+    def no_filesystem(*args, **kwargs):
+        raise AssertionError("Looked at the filesystem")
+    monkeypatch.setattr(os.path, "exists", no_filesystem)
+    monkeypatch.setattr(os, "stat", no_filesystem)
+
+    response = test_client.get("/users/1/posts")
+    assert response.status_code == 200
+    assert response.data == b"<html></html>"
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag, weak = response.get_etag()
+    assert etag and not weak
+
+    response = test_client.get("/some/other/route",
+                               headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+
+
+def test_precompressed_assets(static_app, tmp_path, monkeypatch):
+    flask_app, index = static_app
+    bundle = tmp_path / "assets" / "index-5639c606.js"
+    bundle.write_text("console.log('hello');" * 100)
+
+    manifest = compress_static(str(tmp_path))
+    assert "images/upload.png" not in manifest
+    entry = manifest["assets/index-5639c606.js"]
+    assert entry["size"] == bundle.stat().st_size
+    assert entry["encodings"]["gzip"]["size"] < entry["size"]
+    with open(tmp_path / "asset-manifest.json") as f:
+        assert json.load(f) == manifest
+
+    # Stand in for brotli, which is optional
+    (tmp_path / "assets" / "index-5639c606.js.br").write_bytes(b"brotli")
+
+    # The hashes are read from the manifest instead of the files
+    def no_hashing(path):
+        raise AssertionError("Hashed a file in the manifest")
+    monkeypatch.setattr(StaticIndex, "_hash_file", staticmethod(no_hashing))
+    index.build()
+    assert index.get("assets/index-5639c606.js.gz") is None
+    test_client = flask_app.test_client()
+
+    response = test_client.get("/assets/index-5639c606.js",
+                               headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.data == b"brotli"
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    response = test_client.get("/assets/index-5639c606.js",
+                               headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == bundle.read_bytes()
+    etag, _ = response.get_etag()
+
+    response = test_client.get("/assets/index-5639c606.js",
+                               headers={"Accept-Encoding": "gzip",
+                                        "If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+
+    # Without the header the original is sent, with another ETag
+    response = test_client.get("/assets/index-5639c606.js")
+    assert "Content-Encoding" not in response.headers
+    assert response.data == bundle.read_bytes()
+    assert response.get_etag()[0] != etag
+
+    response = test_client.get("/assets/index-5639c606.js",
+                               headers={"Accept-Encoding": "br;q=0, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
@@ -1,8 +1,10 @@
 from db import Base, get_session, get_engine, User, Post, Comment, Like
+from db import Follow, TimelineEntry, timeline
+from services import account_purger
 from utils.init_db import init_db
 from flask.testing import FlaskClient
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, func, event
 from app import app
 import os
 import pytest
@@ -462,3 +464,385 @@ def test_user_post_likes(test_client: FlaskClient, db_session: Session):
         headers={"Authorization": f"Bearer {jwt_token}"})
 
     assert response.status_code == 200
+
+
+def test_user_feed(test_client: FlaskClient, db_session: Session,
+                   monkeypatch):
+    insert_alice()
+    insert_sheila()
+
+    response = test_client.post("api/auth/login", json={
+        "username": "Alice",
+        "password": "password"
+    })
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    def feed_ids(last_id=0, page_size=10):
+        response = test_client.get(
+            f"api/users/1/posts/feed?last_id={last_id}&page_size={page_size}",
+            headers=headers)
+        assert response.status_code == 200
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return [post["id"] for post in response.json]
+
+    def timeline_ids():
+        return db_session.scalars(
+            select(TimelineEntry.post_id)
+            .where(TimelineEntry.user_id == 1)
+            .order_by(TimelineEntry.post_id)).all()
+
+    # Alice follows nobody
+    response = test_client.get("api/users/1/posts/feed", headers=headers)
+    assert response.status_code == 404
+
+    # Following backfills the posts Sheila has made
+    insert_dummy_post(2)
+    insert_dummy_post(2)
+    response = test_client.post("api/users/1/follows/2", headers=headers)
+    assert response.status_code == 200
+    assert timeline_ids() == [1, 2]
+
+    # New posts are fanned out to the followers
+    insert_dummy_post(2)
+    insert_dummy_post(1)
+    assert timeline_ids() == [1, 2, 3]
+    assert feed_ids() == [3, 2, 1]
+    assert feed_ids(last_id=3, page_size=1) == [2]
+
+    # Posts by authors with many followers are pulled instead
+    monkeypatch.setattr(timeline, "FEED_FANOUT_LIMIT", 0)
+    insert_dummy_post(2)
+    insert_dummy_post(2)
+    assert timeline_ids() == [1, 2, 3]
+    assert feed_ids() == [6, 5, 3, 2, 1]
+    assert feed_ids(last_id=6, page_size=2) == [5, 3]
+
+    # Deleted posts are removed from the timeline
+    response = test_client.post("api/auth/login", json={
+        "username": "Sheila",
+        "password": "password"
+    })
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    sheila = {"Authorization": f"Bearer {response.json['access_token']}"}
+    response = test_client.delete("api/users/2/posts/3", headers=sheila)
+    assert response.status_code == 204
+    assert timeline_ids() == [1, 2]
+    assert feed_ids() == [6, 5, 2, 1]
+
+    # Unfollowing empties the feed
+    response = test_client.delete("api/users/1/follows/2", headers=headers)
+    assert response.status_code == 204
+    assert timeline_ids() == []
+    response = test_client.get("api/users/1/posts/feed", headers=headers)
+    assert response.status_code == 404
+
+    # Rebuilding decides again which posts are fanned out,
+    # but the feed stays the same
+    monkeypatch.setattr(timeline, "FEED_FANOUT_LIMIT", 10000)
+    response = test_client.post("api/users/1/follows/2", headers=headers)
+    assert response.status_code == 200
+    assert timeline_ids() == [1, 2]
+    with get_engine().begin() as connection:
+        assert timeline.rebuild_timeline(connection) == 4
+    assert timeline_ids() == [1, 2, 5, 6]
+    assert feed_ids() == [6, 5, 2, 1]
+
+
+def test_feed_of_deleted_author(test_client: FlaskClient,
+                                db_session: Session, monkeypatch):
+    insert_alice()
+    insert_sheila()
+    db_session.add(User(username="Bob", password="password",
+                        email="Bob@example.com"))
+    db_session.commit()
+
+    response = test_client.post("api/auth/login", json={
+        "username": "Alice",
+        "password": "password"
+    })
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+    for followed in (2, 3):
+        response = test_client.post(f"api/users/1/follows/{followed}",
+                                    headers=headers)
+        assert response.status_code == 200
+
+    # The newest posts of both the timeline and the pulled posts are by
+    # Sheila, who is marked as deleted
+    insert_dummy_post(3)
+    insert_dummy_post(3)
+    insert_dummy_post(2)
+    insert_dummy_post(2)
+    monkeypatch.setattr(timeline, "FEED_FANOUT_LIMIT", 0)
+    insert_dummy_post(2)
+    insert_dummy_post(2)
+    account_purger.mark_deleted(db_session, db_session.get(User, 2))
+
+    response = test_client.get("api/users/1/posts/feed?page_size=2",
+                               headers=headers)
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert [post["id"] for post in response.json] == [2, 1]
+    assert "X-Next-Cursor" in response.headers
+
+
+def test_batch_status(test_client: FlaskClient, db_session: Session):
+    insert_alice()
+    insert_sheila()
+    insert_dummy_post(2)
+    insert_dummy_post(2)
+    insert_dummy_like(2, 1)
+
+    response = test_client.post("api/auth/login", json={
+        "username": "Alice",
+        "password": "password"
+    })
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    # Answered in the order asked, missing posts are not liked
+    response = test_client.get("api/users/1/likes/status?ids=2,1,99,2",
+                               headers=headers)
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert [(like["pid"], like["is_liked"]) for like in response.json] == [
+        (2, True), (1, False), (99, False)]
+    assert response.json[0]["id"] == 1
+
+    response = test_client.get("api/users/2/likes/status?ids=1",
+                               headers=headers)
+    assert response.status_code == 401
+
+    response = test_client.post("api/users/1/follows/2", headers=headers)
+    assert response.status_code == 200
+
+    response = test_client.get("api/users/1/follows/status?ids=2,1",
+                               headers=headers)
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    assert [(user["id"], user["is_following"]) for user in response.json] == [
+        (2, True), (1, False)]
+    assert response.json[0]["followed_date"] is not None
+    assert response.json[1]["followed_date"] is None
+
+    response = test_client.get("api/users/5/follows/status?ids=1",
+                               headers=headers)
+    assert response.status_code == 404
+
+    for ids in ("", "1,a", "0", ",".join(map(str, range(1, 102)))):
+        response = test_client.get(f"api/users/1/follows/status?ids={ids}",
+                                   headers=headers)
+        assert response.status_code == 400, ids
+
+
+def test_include_author(test_client: FlaskClient, db_session: Session):
+    insert_alice()
+    insert_sheila()
+    for uid in (2, 2, 1):
+        insert_dummy_post(uid)
+
+    response = test_client.post("api/auth/login", json={
+        "username": "Alice",
+        "password": "password"
+    })
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+    response = test_client.post("api/users/1/follows/2", headers=headers)
+    assert response.status_code == 200
+
+    # Without include the listings are unchanged
+    response = test_client.get("api/users/1/posts/feed", headers=headers)
+    assert [post["id"] for post in response.json] == [2, 1]
+
+    # Authors of many posts are included once
+    for url in ("api/users/1/posts/feed?include=author",
+                "api/posts?include=author"):
+        response = test_client.get(url, headers=headers)
+        assert response.status_code == 200
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        uids = {post["uid"] for post in response.json["posts"]}
+        assert set(map(int, response.json["authors"])) == uids
+        assert response.json["authors"]["2"] == {
+            "id": 2, "username": "Sheila",
+            "profile_picture": "placeholder-profile.jpg"}
+
+    response = test_client.get("api/users/2/posts?include=author",
+                               headers=headers)
+    assert list(response.json["authors"]) == ["2"]
+    assert len(response.json["posts"]) == 2
+
+    response = test_client.get("api/posts?include=comments", headers=headers)
+    assert response.status_code == 400
+
+
+def test_followers(test_client: FlaskClient, db_session: Session):
+    insert_alice()
+    insert_sheila()
+    db_session.add(User(username="Bob", password="password",
+                        email="Bob@example.com"))
+    db_session.commit()
+
+    def login(username: str):
+        response = test_client.post("api/auth/login", json={
+            "username": username,
+            "password": "password"
+        })
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    def counts(uid: int):
+        response = test_client.get(f"api/users/{uid}")
+        assert response.status_code == 200
+        return (response.json["follower_count"],
+                response.json["following_count"])
+
+    # Cached profiles are updated when the counters change
+    assert counts(1) == (0, 0)
+
+    alice, sheila, bob = login("Alice"), login("Sheila"), login("Bob")
+    for headers, uid, followed in ((sheila, 2, 1), (bob, 3, 1),
+                                   (alice, 1, 2)):
+        response = test_client.post(f"api/users/{uid}/follows/{followed}",
+                                    headers=headers)
+        assert response.status_code == 200
+
+    assert counts(1) == (2, 1)
+    assert counts(2) == (1, 1)
+    assert counts(3) == (0, 1)
+
+    # The most recent followers come first, one page at a time
+    usernames = []
+    url = "api/users/1/followers?page_size=1"
+    while url:
+        response = test_client.get(url, headers=bob)
+        assert response.status_code == 200
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        usernames += [user["username"] for user in response.json]
+        assert all(user["followed_date"] for user in response.json)
+        cursor = response.headers.get("X-Next-Cursor")
+        url = cursor and f"api/users/1/followers?page_size=1&cursor={cursor}"
+    assert usernames == ["Bob", "Sheila"]
+
+    response = test_client.get("api/users/5/followers", headers=bob)
+    assert response.status_code == 404
+
+    response = test_client.delete("api/users/3/follows/1", headers=bob)
+    assert response.status_code == 204
+    assert counts(1) == (1, 1)
+    assert counts(3) == (0, 0)
+
+
+def test_delete_user(test_client: FlaskClient, db_session: Session):
+    insert_alice()
+    insert_sheila()
+
+    def login(username: str):
+        response = test_client.post("api/auth/login", json={
+            "username": username,
+            "password": "password"
+        })
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    alice, sheila = login("Alice"), login("Sheila")
+    for headers, uid, followed in ((alice, 1, 2), (sheila, 2, 1)):
+        response = test_client.post(f"api/users/{uid}/follows/{followed}",
+                                    headers=headers)
+        assert response.status_code == 200
+
+    insert_dummy_post(2)
+    for _ in range(20):
+        insert_dummy_post(1)
+    for pid in range(1, 12):
+        insert_dummy_like(pid, 1)
+        insert_dummy_comment(pid, 2)
+    insert_dummy_comment(1, 1)
+
+    def count(model, *where):
+        return db_session.scalar(
+            select(func.count()).select_from(model).where(*where))
+
+    # The rows are deleted with a few statements, not one per row
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(get_engine(), "before_cursor_execute", capture)
+    try:
+        response = test_client.delete("api/users/1", headers=alice)
+    finally:
+        event.remove(get_engine(), "before_cursor_execute", capture)
+    assert response.status_code == 204
+    assert len(statements) < 30
+
+    # The counters of the posts of others are updated
+    post = db_session.get(Post, 1)
+    db_session.refresh(post)
+    assert (post.like_count, post.comment_count) == (0, 1)
+    assert count(Post) == 1
+    assert count(Like) == 0
+    assert count(Comment) == 1
+    assert count(Follow) == 0
+    assert count(TimelineEntry) == 0
+
+    # As are the follow counters of others
+    user = db_session.get(User, 2)
+    db_session.refresh(user)
+    assert (user.follower_count, user.following_count) == (0, 0)
+
+    # Large accounts are marked as deleted, and purged in the background
+    for _ in range(5):
+        insert_dummy_post(2)
+    response = test_client.delete("api/users/2?mode=async", headers=sheila)
+    assert response.status_code == 202
+    assert test_client.get("api/users/2").status_code == 404
+    response = test_client.post("api/auth/login", json={
+        "username": "Sheila",
+        "password": "password"
+    })
+    assert response.status_code == 401
+    assert count(Post) == 6
+
+    # The user and its posts are hidden, and the username is free
+    response = test_client.post("api/auth/register", json={
+        "username": "Sheila",
+        "password": "password",
+        "email": "Sheila@example.com"
+    })
+    assert response.status_code == 200
+    headers = login("Sheila")
+
+    def listed(url: str, key: str) -> list:
+        response = test_client.get(url, headers=headers)
+        assert response.status_code == 200, url
+        if response.json is None:
+            pytest.fail("No JSON data returned")
+        return [row[key] for row in response.json]
+
+    assert listed("api/users", "id") == [3]
+    assert listed("api/posts", "uid") == []
+    assert listed("api/users/2/posts", "uid") == []
+    response = test_client.get("api/posts/batch?ids=1", headers=headers)
+    assert response.json["missing"] == [1]
+    assert test_client.get("api/posts/1", headers=headers).status_code == 404
+
+    assert account_purger.purge_user(2, batch_size=2)["posts"] == 6
+    assert count(Post) == 0
+    assert count(Comment) == 0
+    # Only the new Sheila is left
+    assert count(User) == 1
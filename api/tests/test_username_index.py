@@ -0,0 +1,145 @@
+from db import Base, get_session, get_engine, User
+from services.username_index import UsernameIndex
+from utils.init_db import init_db
+from flask.testing import FlaskClient
+from app import app
+import os
+import pytest
+
+
+@pytest.fixture(scope="module")
+def testing_env():
+    os.environ["TESTING"] = "True"
+    yield
+    del os.environ["TESTING"]
+
+
+@pytest.fixture(scope="function")
+def testing_db(testing_env):
+    init_db()
+    yield
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def test_client(testing_db):
+    flask_app = app
+    os.environ["TESTING"] = "True"
+    testing_client = flask_app.test_client()
+    ctx = flask_app.app_context()
+    ctx.push()
+    yield testing_client
+    ctx.pop()
+
+
+def insert_user(username: str):
+    user = User(username=username,
+                password="password",
+                email=f"{username}@example.com")
+    Session = get_session()
+    session = Session()
+    session.add(user)
+    session.commit()
+    session.close()
+
+
+def test_username_index(testing_db):
+    for username in ["alice", "Alicia", "bob", "Albert", "alfred"]:
+        insert_user(username)
+
+    index = UsernameIndex()
+
+    # Prefix matches ignore case and are ordered alphabetically
+    assert [username for _, username in index.search("al")] == [
+        "Albert", "alfred", "alice", "Alicia"]
+    assert [username for _, username in index.search("ALI")] == [
+        "alice", "Alicia"]
+    assert index.search("al", limit=1) == [(4, "Albert")]
+    assert index.search("x") == []
+
+    index.add(6, "Alex")
+    assert [username for _, username in index.search("ale")] == ["Alex"]
+
+    index.rename(6, "Alex", "Xander")
+    assert index.search("ale") == []
+    assert index.search("xa") == [(6, "Xander")]
+
+    index.remove(1, "alice")
+    assert [username for _, username in index.search("ali")] == ["Alicia"]
+
+
+class CountingList(list):
+    """List counting the items read from it."""
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.reads = 0
+
+    def __getitem__(self, i):
+        self.reads += 1
+        return super().__getitem__(i)
+
+
+def test_username_index_search_reads_few_keys(testing_db):
+    index = UsernameIndex()
+    index.rebuild()
+
+    for i in range(200_000):
+        index.add(i + 1, f"user{i:06d}")
+
+    # A search is a binary search and then the matches, whatever the size.
+    # The timing is measured by benchmarks.bench_username_index
+    keys = index._keys = CountingList(index._keys)
+    binary_search = len(keys).bit_length()
+    for i in range(200):
+        keys.reads = 0
+        assert len(index.search(f"user{i:03d}", 10)) == 10
+        assert keys.reads <= binary_search + 10
+
+    keys.reads = 0
+    assert index.search("user9") == []
+    assert keys.reads <= binary_search + 1
+
+
+def test_autocomplete_route(test_client: FlaskClient):
+    response = test_client.post("/api/auth/register", json={
+        "username": "Alice", "password": "password",
+        "email": "alice@example.com"})
+    assert response.status_code == 200
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    test_client.post("/api/auth/register", json={
+        "username": "Alfred", "password": "password",
+        "email": "alfred@example.com"})
+
+    response = test_client.get("/api/users/autocomplete?query=al",
+                               headers=headers)
+    assert response.status_code == 200
+    assert response.json == [{"id": 2, "username": "Alfred"},
+                             {"id": 1, "username": "Alice"}]
+
+    # Renaming and deleting users updates the index
+
+    response = test_client.put("/api/users/1", json={"username": "Zoe"},
+                               headers=headers)
+    assert response.status_code == 200
+
+    response = test_client.get("/api/users/autocomplete?query=zo",
+                               headers=headers)
+    assert response.json == [{"id": 1, "username": "Zoe"}]
+
+    response = test_client.delete("/api/users/1", headers=headers)
+    assert response.status_code == 204
+
+    response = test_client.post("/api/auth/login", json={
+        "username": "Alfred", "password": "password"})
+    if response.json is None:
+        pytest.fail("No JSON data returned")
+    headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    response = test_client.get("/api/users/autocomplete?query=zo",
+                               headers=headers)
+    assert response.json == []
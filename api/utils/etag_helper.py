@@ -0,0 +1,41 @@
+from datetime import datetime
+from flask import Response, request, jsonify
+import hashlib
+
+
+def row_etag(kind: str, row_id: int,
+             updated_at: datetime | None) -> str | None:
+    """A strong ETag for a row, from its id and when it was last updated.
+    None if the row has never been given an update time."""
+    if updated_at is None:
+        return None
+    version = f"{kind}:{row_id}:{updated_at.isoformat()}"
+    return hashlib.sha1(version.encode()).hexdigest()
+
+
+def make_conditional(response: Response, etag: str | None,
+                     last_modified: datetime | None = None,
+                     private: bool = False) -> Response:
+    """Adds the validators to a response, and turns it into an empty 304
+    response if the client sent If-None-Match or If-Modified-Since and
+    already has this version. The client is told to revalidate before
+    reusing its copy."""
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+
+    if etag is None:
+        return response
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    return response.make_conditional(request)
+
+
+def conditional_json(data, etag: str | None,
+                     last_modified: datetime | None = None,
+                     private: bool = False) -> Response:
+    """Returns data as JSON, see make_conditional."""
+    return make_conditional(jsonify(data), etag, last_modified, private)
@@ -1,4 +1,46 @@
-from db import Base, get_session, get_engine
+from db import (Base, get_session, get_engine, reconcile_post_counters,
+                reconcile_user_counters, search, timeline)
+from services.username_index import username_index
+from middleware.auth import clear_user_cache
+from utils.response_cache import clear_response_cache
+from sqlalchemy import inspect, update
+from datetime import datetime
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+
+
+def add_missing_columns(connection: Connection):
+    """Adds columns that are declared on the models, but are missing from
+    tables created by an older version of the application.
+    Returns the added columns as "table.column"."""
+    inspector = inspect(connection)
+    added = []
+
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"]
+                    for column in inspector.get_columns(table.name)}
+
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_ddl = CreateColumn(column).compile(
+                dialect=connection.dialect)
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+            added.append(f"{table.name}.{column.name}")
+
+    return added
+
+
+def add_missing_indexes(connection: Connection):
+    """Creates indexes that are declared on the models, but are missing from
+    tables created by an older version of the application."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
 
 
 def init_db():
@@ -9,6 +51,33 @@ def init_db():
     session.commit()
     session.close()
 
+    with engine.begin() as connection:
+        added = add_missing_columns(connection)
+        add_missing_indexes(connection)
+        search.create_search_index(connection)
+
+        # The counters of existing posts start at zero, so they are
+        # backfilled once when the columns are added
+        if {"posts.like_count", "posts.comment_count"} & set(added):
+            reconcile_post_counters(connection)
+        if {"users.follower_count", "users.following_count"} & set(added):
+            reconcile_user_counters(connection)
+
+        # Existing rows get a first version for the conditional GETs
+        for table in Base.metadata.sorted_tables:
+            if f"{table.name}.updated_at" in added:
+                connection.execute(
+                    update(table).values(updated_at=datetime.now()))
+
+        # Feeds of existing users are filled once when the timeline is added
+        if "posts.fanned_out" in added:
+            timeline.rebuild_timeline(connection)
+
+    # The database may have changed since the caches were filled
+    username_index.invalidate()
+    clear_user_cache()
+    clear_response_cache()
+
 
 if __name__ == "__main__":
     init_db()
@@ -1,7 +1,21 @@
+import gzip
+import hashlib
+import json
 import os
 import subprocess
 import shutil
 
+try:
+    # Optional, the .br files are only made when brotli is installed
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files that are worth compressing, the images are compressed already
+COMPRESSIBLE_EXTENSIONS = {".js", ".css", ".html", ".svg", ".json", ".map",
+                           ".txt"}
+MANIFEST_NAME = "asset-manifest.json"
+
 
 def build_static():
     """Builds the static files for the frontend.
@@ -34,6 +48,63 @@ def build_static():
     # Change the working directory back to the api folder
     os.chdir("../../api")
 
+    compress_static("static")
+
+
+def compress_static(root: str):
+    """Writes .gz and .br files next to the files of the build, at maximum
+    compression, so the server can send them without compressing on every
+    request. A file is only kept if it is smaller than the original.
+    Also writes a manifest with the hash and size of every file and its
+    compressed versions."""
+    manifest = {}
+
+    for directory, subdirectories, filenames in os.walk(root):
+        if directory == root:
+            subdirectories[:] = [name for name in subdirectories
+                                 if name != "images"]
+
+        for filename in filenames:
+            extension = os.path.splitext(filename)[1]
+            if extension in (".gz", ".br") or filename == MANIFEST_NAME:
+                continue
+
+            path = os.path.join(directory, filename)
+            key = os.path.relpath(path, root).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+
+            entry = {
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "size": len(data),
+                "encodings": {},
+            }
+
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                compressed = {
+                    "gzip": (".gz", gzip.compress(data, 9, mtime=0)),
+                }
+                if brotli is not None:
+                    compressed["br"] = (".br", brotli.compress(
+                        data, quality=11))
+
+                for encoding, (suffix, body) in compressed.items():
+                    if len(body) >= len(data):
+                        continue
+                    with open(path + suffix, "wb") as f:
+                        f.write(body)
+                    entry["encodings"][encoding] = {
+                        "path": key + suffix,
+                        "size": len(body),
+                    }
+
+            manifest[key] = entry
+
+    with open(os.path.join(root, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
 
 if __name__ == "__main__":
     build_static()
@@ -2,7 +2,14 @@ import base64
 import hashlib
 import hmac
 import json
+import os
 import time
+from utils.cache import TTLCache
+
+# Verified tokens, keyed on the secret and the exact token string. An entry
+# lives until the token expires. Any change to the token, such as tampering
+# with the payload, gives a different key and a full verification.
+token_cache = TTLCache(maxsize=int(os.environ.get("JWT_CACHE_SIZE", 10000)))
 
 
 class JWTError(Exception):
@@ -64,7 +71,24 @@ def create_jwt(exp, uid, secret: str):
 
 
 def decode_jwt(jwt: str, secret: str):
-    """Decode and validates a JWT."""
+    """Decode and validates a JWT.
+    Tokens that have been verified before are served from the token cache."""
+
+    cached = token_cache.get((secret, jwt))
+    if cached is not None:
+        header, payload = cached
+        return dict(header), dict(payload)
+
+    header, payload = verify_jwt(jwt, secret)
+
+    token_cache.set((secret, jwt), (header, payload),
+                    ttl=payload["exp"] - time.time())
+
+    return dict(header), dict(payload)
+
+
+def verify_jwt(jwt: str, secret: str):
+    """Decode and validates a JWT, without using the token cache."""
 
     jwt_bytes = jwt.encode("utf-8")
 
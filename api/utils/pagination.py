@@ -0,0 +1,157 @@
+from flask import Response, jsonify, request
+from sqlalchemy import Select, and_, or_
+import base64
+import binascii
+import json
+import os
+
+"""
+NB: The list routes use keyset pagination. A page is ordered by a sort key
+that an index can return in order, usually the id, and the next page
+starts after the key of the last row, so no rows are skipped or repeated
+when rows are added between requests.
+
+The next page is asked for with the opaque cursor from the X-Next-Cursor
+header, or from next_cursor when the body is an object. The cursor holds
+the names and values of the sort key and the direction, and is only
+accepted by routes with the same sort key. There is no next cursor when
+the page is not full.
+
+Older clients pass the values of the sort key as last_<name>, for instance
+last_id, and the direction as descending. These are still accepted.
+"""
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: dict, descending: bool) -> str:
+    data = json.dumps({"k": key, "d": "desc" if descending else "asc"},
+                      separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[dict, bool]:
+    """Returns the sort key and whether the page is descending.
+    Raises ValueError if the cursor is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, direction = data["k"], data["d"]
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError,
+            TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(key, dict) or direction not in ("asc", "desc"):
+        raise ValueError("Invalid cursor")
+    # Only numbers and strings are sort key values
+    if not all(isinstance(value, (str, int, float))
+               and not isinstance(value, bool) for value in key.values()):
+        raise ValueError("Invalid cursor")
+    return key, direction == "desc"
+
+
+class Page:
+    """A page asked for by a request.
+
+    sort_key maps the names of the sort key to their types, for instance
+    {"id": int}. after holds the values of the sort key of the last row
+    on the previous page, or is None for the first page."""
+
+    def __init__(self, sort_key: dict[str, type], size: int,
+                 descending: bool, after: tuple | None = None):
+        self.sort_key = sort_key
+        self.size = size
+        self.descending = descending
+        self.after = after
+
+    @classmethod
+    def from_request(cls, sort_key: dict[str, type] | None = None,
+                     descending: bool = True,
+                     fixed_order: bool = False) -> "Page":
+        """Reads page_size, cursor, and the older last_<name> and
+        descending parameters. With fixed_order the direction can not be
+        changed by the client. Raises ValueError if a parameter is invalid.
+        """
+        sort_key = sort_key or {"id": int}
+        args = request.args
+
+        size = int(args.get("page_size", DEFAULT_PAGE_SIZE))
+        if size < 1:
+            raise ValueError("Page size must be positive")
+        size = min(size, MAX_PAGE_SIZE)
+
+        if not fixed_order and "descending" in args:
+            descending = args["descending"].lower() == "true"
+
+        after = None
+        if args.get("cursor"):
+            key, cursor_descending = decode_cursor(args["cursor"])
+            if key.keys() != sort_key.keys():
+                raise ValueError("Cursor is for another list")
+            if fixed_order and cursor_descending != descending:
+                raise ValueError("Cursor is for another order")
+            descending = cursor_descending
+            try:
+                after = tuple(kind(key[name])
+                              for name, kind in sort_key.items())
+            except (TypeError, ValueError, OverflowError) as e:
+                raise ValueError("Invalid cursor") from e
+        elif all(args.get(f"last_{name}") for name in sort_key):
+            after = tuple(kind(args[f"last_{name}"])
+                          for name, kind in sort_key.items())
+            # last_id=0 was sent by older clients for the first page
+            if after == (0,) * len(after):
+                after = None
+
+        return cls(sort_key, size, descending, after)
+
+    @property
+    def last_id(self) -> int:
+        """The id the page starts after, or 0 for the first page,
+        for statements that take the sort key as last_id."""
+        return self.after[-1] if self.after is not None else 0
+
+    def after_clause(self, *columns):
+        """Where clause for the rows after the cursor, in the order of the
+        columns. Written out instead of a row value comparison, so each
+        column is compared on its own by the index."""
+        clause = None
+        for column, value in reversed(list(zip(columns, self.after))):
+            past = column < value if self.descending else column > value
+            clause = past if clause is None else or_(
+                past, and_(column == value, clause))
+        return clause
+
+    def apply(self, stmt: Select, *columns) -> Select:
+        """Orders a statement by the columns of the sort key, starts it
+        after the cursor and limits it to the page size. The columns must
+        be in the order of the sort key, and an index must return them in
+        that order."""
+        stmt = stmt.order_by(*(column.desc() if self.descending
+                               else column.asc() for column in columns))
+        if self.after is not None:
+            stmt = stmt.where(self.after_clause(*columns))
+        return stmt.limit(self.size)
+
+    def next_cursor(self, rows: list, key) -> str | None:
+        """The cursor of the next page, given the rows of this page and a
+        function returning the values of the sort key of a row.
+        None if this is the last page."""
+        if len(rows) < self.size:
+            return None
+        values = key(rows[-1])
+        return encode_cursor(dict(zip(self.sort_key, values)),
+                             self.descending)
+
+
+def paginated(body, next_cursor: str | None) -> Response:
+    """JSON response for a page. The next cursor is sent in a header, and
+    in the body as well when it is an object."""
+    if isinstance(body, dict):
+        body = {**body, "next_cursor": next_cursor}
+    response = jsonify(body)
+    if next_cursor is not None:
+        response.headers[CURSOR_HEADER] = next_cursor
+    return response
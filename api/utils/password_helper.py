@@ -0,0 +1,66 @@
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+import os
+import threading
+
+"""
+NB: Password hashing is slow on purpose. To keep a burst of logins from
+using every CPU and starving the other endpoints, hashing and verification
+run in a small process pool. At most PASSWORD_HASH_QUEUE_SIZE hashes may
+be running or waiting at once, further requests fail with
+PasswordHasherBusy instead of piling up.
+"""
+
+# Werkzeug method string, including the cost parameters. The default is
+# what generate_password_hash uses in the pinned Werkzeug 2.2, so existing
+# hashes are not replaced. Werkzeug 3 also supports "scrypt:32768:8:1".
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+# Number of hashing processes. With 0 the hashing runs in the calling thread
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", 32))
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(HASH_QUEUE_SIZE, 1))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already in progress."""
+    pass
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _executor
+
+
+def _run(function, *args):
+    if HASH_WORKERS <= 0:
+        return function(*args)
+
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy("Too many password hashes in progress")
+
+    try:
+        return _get_executor().submit(function, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with the configured method."""
+    return _run(generate_password_hash, password, HASH_METHOD)
+
+
+def check_password(hashed_password: str, password: str) -> bool:
+    """Check a password against a hash made with any supported method."""
+    return _run(check_password_hash, hashed_password, password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made with another method or cost than the
+    configured one, and should be replaced on the next login."""
+    return hashed_password.split("$", 1)[0] != HASH_METHOD
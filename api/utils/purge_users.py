@@ -0,0 +1,22 @@
+from services.account_purger import purge_deleted_users
+import argparse
+
+
+def main():
+    """Purges the accounts that were deleted, but not yet removed.
+    Run with `python -m utils.purge_users` from the api folder."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="rows deleted in each transaction")
+    args = parser.parse_args()
+
+    options = {}
+    if args.batch_size is not None:
+        options["batch_size"] = args.batch_size
+    purged = purge_deleted_users(**options)
+
+    print(f"Purged {purged} deleted account(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+
+# Most ids a batch route takes in one request
+MAX_BATCH_IDS = int(os.environ.get("MAX_BATCH_IDS", 100))
+
+
+def parse_ids(value: str | None, limit: int = MAX_BATCH_IDS) -> list[int]:
+    """Parses a comma separated list of ids, such as "1,2,3".
+    Duplicates are dropped, the order is kept.
+    Raises ValueError if an id is not a positive integer,
+    or there are none or more than the limit."""
+    if not value:
+        raise ValueError("No ids given")
+
+    ids = list(dict.fromkeys(int(part) for part in value.split(",")))
+
+    if any(id_ < 1 for id_ in ids):
+        raise ValueError("Ids must be positive")
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids can be given")
+
+    return ids
+
+
+def parse_include(value: str | None, allowed: set[str]) -> set[str]:
+    """Parses a comma separated list of related data to include in a
+    response, such as "author". Raises ValueError for unknown names."""
+    if not value:
+        return set()
+
+    include = set(value.split(","))
+    unknown = include - allowed
+    if unknown:
+        raise ValueError(f"Cannot include {', '.join(sorted(unknown))}")
+
+    return include
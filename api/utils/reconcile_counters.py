@@ -0,0 +1,17 @@
+from db import get_engine, reconcile_post_counters, reconcile_user_counters
+
+
+def reconcile_counters():
+    """Recounts the like and comment counters of all posts, and the
+    follower and following counters of all users.
+    Run with `python -m utils.reconcile_counters` from the api folder."""
+    engine = get_engine()
+    with engine.begin() as connection:
+        posts = reconcile_post_counters(connection)
+        users = reconcile_user_counters(connection)
+    print(f"Reconciled counters, {posts} post(s) and {users} user(s) "
+          "had drifted")
+
+
+if __name__ == "__main__":
+    reconcile_counters()
@@ -0,0 +1,173 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from flask import Response, current_app, jsonify
+from utils.cache import TTLCache
+from utils.etag_helper import make_conditional
+import threading
+
+"""
+NB: Responses of public GET routes that are the same for every viewer,
+such as get_user and get_post, are cached. The key is made from the route
+and its arguments, for instance "user:1".
+
+The responses changed by a transaction are invalidated when it is
+committed, by the mapper events in db.cached_responses. The cache only
+holds bytes and strings, so a shared backend such as Redis can implement
+ResponseCache and be plugged in with set_response_cache. The in-process
+cache only sees invalidations made by this process, so its TTL bounds how
+stale other processes can make it.
+
+A route reads the generation of its key before reading the row, and
+passes it to set. Deleting a key changes its generation, so a response
+built from a row read before an invalidation is not stored after it.
+"""
+
+
+class CachedResponse:
+    """The body and validators of a JSON response."""
+
+    def __init__(self, body: bytes, etag: str | None,
+                 last_modified: datetime | None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def from_json(cls, data, etag: str | None,
+                  last_modified: datetime | None) -> "CachedResponse":
+        return cls(jsonify(data).get_data(), etag, last_modified)
+
+    def to_response(self, private: bool = False) -> Response:
+        response = Response(self.body, mimetype="application/json")
+        return make_conditional(response, self.etag, self.last_modified,
+                                private)
+
+
+class ResponseCache(ABC):
+    """Interface of the response caches."""
+
+    @abstractmethod
+    def get(self, key: str) -> CachedResponse | None:
+        pass
+
+    @abstractmethod
+    def generation(self, key: str) -> int:
+        """A number that changes every time the key is deleted."""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, response: CachedResponse,
+            generation: int | None = None):
+        """Stores a response, unless the key has been deleted since the
+        generation was read."""
+        pass
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def stats(self) -> dict:
+        pass
+
+
+class MemoryResponseCache(ResponseCache):
+    """Response cache in the memory of this process, an LRU with a TTL."""
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 30.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._deletes = 0
+        # Generations of the maxsize keys deleted most recently. Other keys
+        # have the newest generation forgotten, so forgetting a key changes
+        # its generation as well
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._max_generations = maxsize
+        self._forgotten = 0
+
+    def get(self, key: str) -> CachedResponse | None:
+        return self._cache.get(key)
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(key, self._forgotten)
+
+    def set(self, key: str, response: CachedResponse,
+            generation: int | None = None):
+        with self._lock:
+            if (generation is not None and generation
+                    != self._generations.get(key, self._forgotten)):
+                return
+            self._cache.set(key, response)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._deletes += 1
+                self._generations[key] = self._deletes
+                self._generations.move_to_end(key)
+                self._cache.delete(key)
+
+            while len(self._generations) > self._max_generations:
+                _, self._forgotten = self._generations.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._deletes += 1
+            self._forgotten = self._deletes
+            self._generations.clear()
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+# Created on first use from the app config, unless one is set
+response_cache: ResponseCache | None = None
+
+
+def set_response_cache(cache: ResponseCache | None):
+    """Replaces the response cache, for instance with a shared backend."""
+    global response_cache
+    response_cache = cache
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Returns the response cache,
+    or None if it is turned off with RESPONSE_CACHE_ENABLED."""
+    global response_cache
+
+    config = current_app.config
+    if not config.get("RESPONSE_CACHE_ENABLED", True):
+        return None
+
+    if response_cache is None:
+        response_cache = MemoryResponseCache(
+            maxsize=int(config.get("RESPONSE_CACHE_SIZE", 1000)),
+            ttl=float(config.get("RESPONSE_CACHE_TTL", 30)))
+    return response_cache
+
+
+def clear_response_cache():
+    if response_cache is not None:
+        response_cache.clear()
+
+
+def invalidate(*keys: str):
+    """Removes responses from the cache, after the write that changed
+    them has been committed."""
+    if response_cache is not None:
+        response_cache.delete(*keys)
+
+
+def user_key(uid: int) -> str:
+    return f"user:{uid}"
+
+
+def post_key(pid: int) -> str:
+    return f"post:{pid}"
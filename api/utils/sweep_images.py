@@ -0,0 +1,27 @@
+from services.image_sweeper import sweep_images
+import argparse
+
+
+def main():
+    """Removes image files that no post or user references.
+    Run with `python -m utils.sweep_images [--dry-run]` from the api folder."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report the files without removing them")
+    parser.add_argument("--grace-period", type=float, default=None,
+                        help="seconds a file must be untouched to be removed")
+    args = parser.parse_args()
+
+    options = {"dry_run": args.dry_run}
+    if args.grace_period is not None:
+        options["grace_period"] = args.grace_period
+    report = sweep_images(**options)
+
+    action = "Would remove" if args.dry_run else "Removed"
+    print(f"Scanned {report['scanned']} file(s). {action} "
+          f"{report['removed']} orphaned file(s), "
+          f"{report['bytes_reclaimed']} bytes reclaimed")
+
+
+if __name__ == "__main__":
+    main()
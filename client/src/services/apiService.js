@@ -111,6 +111,8 @@ const fetchOperations = {
  * @property {string} banner_picture
  * @property {string} username
  * @property {string} about_me
+ * @property {int} follower_count
+ * @property {int} following_count
  */
 
 /**
@@ -144,6 +146,7 @@ const fetchOperations = {
  * @property {int} id
  * @property {string} profile_picture
  * @property {string} username
+ * @property {string} [followed_date] Only set for followers
  */
 
 const apiService = {
@@ -164,6 +167,20 @@ const apiService = {
         store.commit("addUserToCache", user);
         return user;
     },
+    /**
+     * Get info of many users, fetching the ones not in cache in one request
+     * @param {Array<string|int>} uids
+     * @returns {Promise<User[]>} user info of the users that exist, in the order given
+     * @throws {Error} failed to fetch user info
+     */
+    async fetchUsersInfo(uids) {
+        const missing = uids.filter(uid => !store.state.userCache[uid]);
+        if (missing.length > 0) {
+            const response = await fetchOperations.get(`/users/batch?ids=${missing.join(",")}`);
+            response.users.forEach(user => store.commit("addUserToCache", user));
+        }
+        return uids.map(uid => store.state.userCache[uid]).filter(user => user);
+    },
     /**
      * Fetch users from server
      * @param {int} pageSize The number of users to fetch
@@ -191,10 +208,12 @@ const apiService = {
      * @param {int} lastPostId The id of the last post fetched
      * @param {string} query Search query
      * @param {int} likedBy Filter posts by user id that liked the post
-     * @returns {Promise<Post[]>} Array of posts
+     * @param {boolean} includeAuthor Include the username and profile picture of the authors
+     * @returns {Promise<Post[]|{posts: Post[], authors: Object<string, Author>}>} Array of posts,
+     * or the posts and their authors by id if includeAuthor is set
      * @throws {Error} failed to fetch posts
      */
-    async fetchPosts(pageSize, lastPostId=null, query=null, likedBy=null) {
+    async fetchPosts(pageSize, lastPostId=null, query=null, likedBy=null, includeAuthor=false) {
 
         let endpoint = `/posts?page_size=${pageSize}`;
         if (lastPostId !== null) {
@@ -206,6 +225,9 @@ const apiService = {
         if (likedBy !== null) {
             endpoint += `&liked_by=${likedBy}`;
         }
+        if (includeAuthor) {
+            endpoint += "&include=author";
+        }
 
         return await fetchOperations.get(endpoint);
 
@@ -219,6 +241,15 @@ const apiService = {
     async fetchPost(pid) {
         return await fetchOperations.get(`/posts/${pid}`);
     },
+    /**
+     * Fetch many posts from server in one request
+     * @param {Array<string|int>} pids The ids of the posts to fetch
+     * @returns {Promise<{posts: Post[], missing: int[]}>} Posts in the order given, and the ids not found
+     * @throws {Error} failed to fetch posts
+     */
+    async fetchPostsByIds(pids) {
+        return await fetchOperations.get(`/posts/batch?ids=${pids.join(",")}`);
+    },
     /**
      * Fetch comments from server
      * @param {string|int} pid The id of the post to fetch comments from
@@ -226,11 +257,14 @@ const apiService = {
      * @param {int} lastCommentId The id of the last comment fetched
      * @returns {Promise<Comment[]>} Array of comments
      */
-    async fetchUserFeedPosts(uid, pageSize, lastPostId=null) {
+    async fetchUserFeedPosts(uid, pageSize, lastPostId=null, includeAuthor=false) {
         let endpoint = `/users/${uid}/posts/feed?page_size=${pageSize}`;
         if (lastPostId !== null) {
             endpoint += `&last_id=${lastPostId}`;
         }
+        if (includeAuthor) {
+            endpoint += "&include=author";
+        }
         return await fetchOperations.get(endpoint);
     },
     /**
@@ -406,6 +440,17 @@ const apiService = {
         const response = await fetchOperations.get(`/users/${uid}/follows/${followedUid}`);
         return response.is_following;
     },
+    /**
+     * Check if user is following each of many users, in one request
+     * @param {string|int} uid The id of the user to check
+     * @param {Array<string|int>} followedUids The ids of the users to be checked
+     * @returns {Promise<Object<string, boolean>>} Whether each user is followed, by id
+     * @throws {Error} failed to check follows
+     */
+    async checkFollows(uid, followedUids) {
+        const response = await fetchOperations.get(`/users/${uid}/follows/status?ids=${followedUids.join(",")}`);
+        return Object.fromEntries(response.map(follow => [follow.id, follow.is_following]));
+    },
     /**
      * Unfollow user
      * @param {string|int} uid The id of the user to unfollow
@@ -427,7 +472,21 @@ const apiService = {
     async getFollowing(uid, lastFollowId = null) {
         let endpoint = `/users/${uid}/follows`;
         if (lastFollowId !== null) {
-            endpoint += `?last_follow_id=${lastFollowId}`;
+            endpoint += `?last_id=${lastFollowId}`;
+        }
+        return await fetchOperations.get(endpoint);
+    },
+    /**
+     * Get users following a user, the most recent first
+     * @param {string|int} uid The id of the user to get followers for
+     * @param {string|null} cursor The cursor of the next page, if any
+     * @returns {Promise<Follow[]>} The user's followers
+     * @throws {Error} failed to get followers
+     */
+    async getFollowers(uid, cursor = null) {
+        let endpoint = `/users/${uid}/followers`;
+        if (cursor !== null) {
+            endpoint += `?cursor=${encodeURIComponent(cursor)}`;
         }
         return await fetchOperations.get(endpoint);
     },
@@ -465,6 +524,17 @@ const apiService = {
         const response = await fetchOperations.get(`/users/${uid}/posts/${postId}/likes`);
         return response.is_liked;
     },
+    /**
+     * Check if user has liked each of many posts, in one request
+     * @param {string|int} uid The id of the user to check
+     * @param {Array<string|int>} postIds The ids of the posts to be checked
+     * @returns {Promise<Object<string, boolean>>} Whether each post is liked, by id
+     * @throws {Error} failed to check likes
+     */
+    async checkLikes(uid, postIds) {
+        const response = await fetchOperations.get(`/users/${uid}/likes/status?ids=${postIds.join(",")}`);
+        return Object.fromEntries(response.map(like => [like.pid, like.is_liked]));
+    },
 
     /**
      * Calls the API to add a comment to a post